@@ -0,0 +1,98 @@
+"""
+Benchmark del cálculo de ET0: bucle por píxel original contra el motor vectorizado PenmanMonteith.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_et0.py [n_lat] [n_lon] [n_days]
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from et0_engine import PenmanMonteith
+
+
+def legacy_et0(temperature, humidity, wind_speed, solar_radiation, lat, lon, mask, doy, pressure=101.325):
+    """
+    Implementación original de MSWXData.calculate_et0 (un píxel a la vez), conservada como referencia.
+    """
+    myET0 = np.empty((np.size(lat), np.size(lon)))
+    myET0[:] = np.nan
+    for i in range(len(lat)):
+        for j in range(len(lon)):
+            if mask[i, j] == 1:
+                mytas = temperature[i, j]
+                myrh = humidity[i, j]
+                myws = wind_speed[i, j]
+                mysr = solar_radiation[i, j] * 0.0864
+
+                es = 0.6108 * math.exp(17.27 * mytas / (mytas + 237.3))
+                ea = (myrh / 100) * es
+
+                delta = 4098 * es / (mytas + 237.3) ** 2
+                gamma = 0.665 * 10 ** (-3) * pressure / 0.622
+
+                latitude = lat[i]
+
+                dr = 1 + 0.033 * math.cos(2 * math.pi / 365 * doy)
+                delta_s = 0.409 * math.sin(2 * math.pi / 365 * doy - 1.39)
+                omega_s = math.acos(-math.tan(latitude * math.pi / 180) * math.tan(delta_s))
+                Ra = (24 * 60 / math.pi) * 0.082 * dr * (omega_s * math.sin(latitude * math.pi / 180) * math.sin(
+                    delta_s) + math.cos(latitude * math.pi / 180) * math.cos(delta_s) * math.sin(omega_s))
+
+                Rns = 0.77 * mysr
+                Rnl = 4.903 * 10 ** (-9) * ((mytas + 273.16) ** 4) * (
+                    0.34 - 0.14 * math.sqrt(ea)) * (1.35 * (mysr / Ra) - 0.35)
+
+                Rn = Rns - Rnl
+                G = 0
+
+                myET0[i][j] = (0.408 * delta * (Rn - G) + gamma * (900 / (mytas + 273))
+                               * myws * (es - ea)) / (delta + gamma * (1 + 0.34 * myws))
+    return myET0
+
+
+def synthetic_day(n_lat, n_lon, seed):
+    """
+    Genera una grilla sintética con valores plausibles para Centroamérica.
+    """
+    rng = np.random.default_rng(seed)
+    tmax = rng.uniform(28, 36, (n_lat, n_lon))
+    tmin = rng.uniform(16, 24, (n_lat, n_lon))
+    humidity = rng.uniform(40, 95, (n_lat, n_lon))
+    wind_speed = rng.uniform(0.5, 6, (n_lat, n_lon))
+    solar_radiation = rng.uniform(120, 300, (n_lat, n_lon))
+    return tmax, tmin, humidity, wind_speed, solar_radiation
+
+
+def main(n_lat=400, n_lon=700, n_days=3):
+    lat = np.linspace(16.5, 12.5, n_lat)
+    lon = np.linspace(-90, -83, n_lon)
+    mask = (np.random.default_rng(0).uniform(size=(n_lat, n_lon)) < 0.6).astype(int)
+    days = [synthetic_day(n_lat, n_lon, seed) for seed in range(n_days)]
+
+    start = time.perf_counter()
+    legacy = [legacy_et0((d[0] + d[1]) / 2, d[2], d[3], d[4], lat, lon, mask, 150 + k) for k, d in enumerate(days)]
+    legacy_time = time.perf_counter() - start
+
+    results = {}
+    for label, float32 in (("float64", False), ("float32", True)):
+        engine = PenmanMonteith(float32=float32)
+        start = time.perf_counter()
+        vectorized = [engine.et0_grid(*d, lat, 150 + k, mask) for k, d in enumerate(days)]
+        elapsed = time.perf_counter() - start
+        max_diff = max(np.nanmax(np.abs(v - l)) for v, l in zip(vectorized, legacy))
+        results[label] = (elapsed, max_diff)
+
+    print(f"Grilla {n_lat}x{n_lon}, {n_days} días, {int(mask.sum())} píxeles en la máscara")
+    print(f"  bucle original: {legacy_time:.3f} s")
+    for label, (elapsed, max_diff) in results.items():
+        print(f"  vectorizado {label}: {elapsed:.3f} s (x{legacy_time / elapsed:.0f}), diferencia máxima {max_diff:.2e} mm/día")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:4]])
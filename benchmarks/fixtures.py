@@ -0,0 +1,267 @@
+"""
+Generación de insumos sintéticos para los benchmarks: archivos diarios de MSWX (nombrados por día juliano),
+archivos diarios de IMERG, GeoTIFF de pronóstico, la máscara de Honduras y los shapefiles de regiones y
+municipios. Los archivos tienen la misma estructura (nombres, variables, dimensiones y orden de la grilla)
+que los que usa el ETL, sobre grillas de distinto tamaño.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/fixtures.py <carpeta> [tamaño] [días]
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import netCDF4 as nc
+import numpy as np
+import geopandas as gpd
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon
+
+# Extensión (lat_min, lat_max, lon_min, lon_max) de la grilla de 0.1° de cada tamaño; 'global' es la grilla
+# completa de MSWX
+SIZES = {
+    'domain': (10, 20, -95, -80),
+    'region': (-10, 30, -120, -60),
+    'global': (-90, 90, -180, 180),
+}
+
+RESOLUTION = 0.1
+
+# Caja de Honduras usada para la máscara y los polígonos
+HONDURAS = (13.0, 16.0, -89.3, -83.2)
+
+# Carpeta de MSWX -> (variable en el archivo, valor medio, amplitud)
+MSWX_VARIABLES = {
+    'Tmax': ('air_temperature', 31.0, 4.0),
+    'Tmin': ('air_temperature', 19.0, 3.0),
+    'Temp': ('air_temperature', 25.0, 3.0),
+    'RelHum': ('relative_humidity', 70.0, 20.0),
+    'Wind': ('wind_speed', 3.0, 2.0),
+    'SWd': ('downward_shortwave_radiation', 220.0, 60.0),
+}
+
+# Carpeta de pronóstico -> (valor medio, amplitud)
+FORECAST_VARIABLES = {
+    'RAIN': (5.0, 5.0),
+    'ET0': (4.0, 1.5),
+    'T2': (25.0, 3.0),
+}
+
+START_DATE = date(2024, 5, 1)
+
+
+def grid(size):
+    """
+    Vectores de centros de celda (lat descendente, lon ascendente) de un tamaño, como en MSWX.
+    """
+    lat_min, lat_max, lon_min, lon_max = SIZES[size]
+    lat = np.round(np.arange(lat_max - RESOLUTION / 2, lat_min, -RESOLUTION), 2)
+    lon = np.round(np.arange(lon_min + RESOLUTION / 2, lon_max, RESOLUTION), 2)
+    return lat, lon
+
+
+def field(lat, lon, mean, amplitude, seed):
+    """
+    Campo suave con ruido pequeño, para que la compresión se comporte como en datos reales.
+    """
+    rng = np.random.default_rng(seed)
+    phase = rng.uniform(0, 2 * np.pi)
+    smooth = np.sin(np.radians(lat)[:, None] * 3 + phase) * np.cos(np.radians(lon)[None, :] * 2 + phase)
+    noise = rng.normal(0, 0.05, (lat.size, lon.size))
+    return (mean + amplitude * (smooth + noise)).astype(np.float32)
+
+
+def dates(days):
+    """
+    Fechas de los insumos: START_DATE y los días siguientes, uno más que la ventana para cubrir su fin.
+    """
+    return [START_DATE + timedelta(days=k) for k in range(days + 1)]
+
+
+def write_mswx(folder, size, days):
+    """
+    Escribe los archivos diarios de MSWX en folder/MSWX/<variable>/<YYYYjjj>.nc.
+    """
+    lat, lon = grid(size)
+    for k, day in enumerate(dates(days)):
+        for variable_folder, (variable, mean, amplitude) in MSWX_VARIABLES.items():
+            path = os.path.join(folder, 'MSWX', variable_folder, f"{day.strftime('%Y%j')}.nc")
+            if os.path.exists(path):
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with nc.Dataset(path, 'w') as dataset:
+                dataset.createDimension('time', 1)
+                dataset.createDimension('lat', lat.size)
+                dataset.createDimension('lon', lon.size)
+                dataset.createVariable('lat', 'f8', ('lat',))[:] = lat
+                dataset.createVariable('lon', 'f8', ('lon',))[:] = lon
+                time = dataset.createVariable('time', 'f8', ('time',))
+                time.units = f"days since {day.isoformat()}"
+                time[:] = 0
+                data = dataset.createVariable(variable, 'f4', ('time', 'lat', 'lon'), zlib=True, complevel=1,
+                                              least_significant_digit=2, fill_value=-9999.0)
+                data[:] = field(lat, lon, mean, amplitude, seed=k * 100 + len(variable_folder))[None]
+
+
+def write_temp_dates(folder, size, days):
+    """
+    Escribe Temp con los nombres ya traducidos (YYYY-MM-DD.nc) que usa Tools.merge_files.
+    """
+    source = os.path.join(folder, 'MSWX', 'Temp')
+    target = os.path.join(folder, 'MSWX_dates', 'Temp')
+    os.makedirs(target, exist_ok=True)
+    for day in dates(days):
+        path = os.path.join(target, f"{day.isoformat()}.nc")
+        if not os.path.exists(path):
+            os.link(os.path.join(source, f"{day.strftime('%Y%j')}.nc"), path)
+
+
+def write_mask(folder, size):
+    """
+    Escribe mask_mswx_hnd.nc4 en la grilla de MSWX con 1 dentro de la caja de Honduras y NaN fuera.
+    """
+    path = os.path.join(folder, 'mask_mswx_hnd.nc4')
+    if os.path.exists(path):
+        return path
+    lat, lon = grid(size)
+    lat_min, lat_max, lon_min, lon_max = HONDURAS
+    inside = ((lat[:, None] > lat_min) & (lat[:, None] < lat_max) & (lon[None, :] > lon_min) & (lon[None, :] < lon_max))
+    with nc.Dataset(path, 'w') as dataset:
+        dataset.createDimension('lat', lat.size)
+        dataset.createDimension('lon', lon.size)
+        dataset.createVariable('lat', 'f8', ('lat',))[:] = lat
+        dataset.createVariable('lon', 'f8', ('lon',))[:] = lon
+        dataset.createVariable('mask', 'f4', ('lat', 'lon'), zlib=True)[:] = np.where(inside, 1.0, np.nan)
+    return path
+
+
+def write_imerg(folder, size, days, padding=2):
+    """
+    Escribe los archivos diarios de IMERG (IMERG_LATEYYYYMMDD.nc) con la ventana que se descarga por
+    OPeNDAP: la caja de la máscara más 'padding' celdas, con precipitation[time][lon][lat].
+    """
+    lat, lon = grid(size)
+    lat_min, lat_max, lon_min, lon_max = HONDURAS
+    lat = np.sort(lat[(lat > lat_min - padding * RESOLUTION) & (lat < lat_max + padding * RESOLUTION)])
+    lon = lon[(lon > lon_min - padding * RESOLUTION) & (lon < lon_max + padding * RESOLUTION)]
+    target = os.path.join(folder, 'IMERG')
+    os.makedirs(target, exist_ok=True)
+    for k, day in enumerate(dates(days)):
+        path = os.path.join(target, f"IMERG_LATE{day.strftime('%Y%m%d')}.nc")
+        if os.path.exists(path):
+            continue
+        with nc.Dataset(path, 'w') as dataset:
+            dataset.createDimension('time', 1)
+            dataset.createDimension('lon', lon.size)
+            dataset.createDimension('lat', lat.size)
+            time = dataset.createVariable('time', 'i4', ('time',))
+            time.units = 'seconds since 1970-01-01 00:00:00 UTC'
+            time[:] = int((day - date(1970, 1, 1)).total_seconds())
+            dataset.createVariable('lon', 'f8', ('lon',))[:] = lon
+            dataset.createVariable('lat', 'f8', ('lat',))[:] = lat
+            precipitation = dataset.createVariable('precipitation', 'f4', ('time', 'lon', 'lat'), zlib=True)
+            precipitation.units = 'mm/day'
+            precipitation[:] = np.clip(field(lat, lon, 5.0, 8.0, seed=1000 + k), 0, None).T[None]
+
+
+def write_forecast(folder, size, days):
+    """
+    Escribe los GeoTIFF diarios de pronóstico en folder/forecast/<variable>/<variable>_YYYY-MM-DD.tif.
+    """
+    lat, lon = grid(size)
+    transform = from_origin(lon[0] - RESOLUTION / 2, lat[0] + RESOLUTION / 2, RESOLUTION, RESOLUTION)
+    for variable, (mean, amplitude) in FORECAST_VARIABLES.items():
+        target = os.path.join(folder, 'forecast', variable)
+        os.makedirs(target, exist_ok=True)
+        for k, day in enumerate(dates(days)):
+            path = os.path.join(target, f"{variable}_{day.isoformat()}.tif")
+            if os.path.exists(path):
+                continue
+            data = field(lat, lon, mean, amplitude, seed=2000 + k * 10 + len(variable))
+            with rasterio.open(path, 'w', driver='GTiff', height=lat.size, width=lon.size, count=1,
+                               dtype='float32', crs='EPSG:4326', transform=transform) as tif:
+                tif.write(data, 1)
+
+
+def write_shapefiles(folder, municipalities=(12, 20), seed=0):
+    """
+    Escribe el shapefile de regiones (columna Nombre) y el de municipios (columnas NAME_1 y NAME_2) dentro
+    de la caja de Honduras. Los municipios son una malla de rows x cols polígonos con vértices irregulares.
+    """
+    regions_path = os.path.join(folder, 'regions_shapefile', 'Regiones_productoras_HN.shp')
+    municipalities_path = os.path.join(folder, 'municipalities_shapefile', 'Municipios_reg_prod_HN.shp')
+    if os.path.exists(regions_path) and os.path.exists(municipalities_path):
+        return regions_path, municipalities_path
+
+    lat_min, lat_max, lon_min, lon_max = HONDURAS
+    names = ['Occidente', 'Centro', 'Oriente']
+    edges = np.linspace(lon_min, lon_max, len(names) + 1)
+    regions = gpd.GeoDataFrame(
+        {'Nombre': names},
+        geometry=[Polygon([(edges[k], lat_min), (edges[k + 1], lat_min), (edges[k + 1], lat_max), (edges[k], lat_max)])
+                  for k in range(len(names))],
+        crs='EPSG:4326')
+
+    rows, cols = municipalities
+    rng = np.random.default_rng(seed)
+    lat_edges = np.linspace(lat_min, lat_max, rows + 1)
+    lon_edges = np.linspace(lon_min, lon_max, cols + 1)
+    # Vértices internos desplazados para que los bordes no coincidan con la grilla
+    lat_nodes = np.repeat(lat_edges[:, None], cols + 1, axis=1)
+    lon_nodes = np.repeat(lon_edges[None, :], rows + 1, axis=0)
+    jitter = 0.3 * min(lat_edges[1] - lat_edges[0], lon_edges[1] - lon_edges[0])
+    lat_nodes[1:-1, 1:-1] += rng.uniform(-jitter, jitter, (rows - 1, cols - 1))
+    lon_nodes[1:-1, 1:-1] += rng.uniform(-jitter, jitter, (rows - 1, cols - 1))
+
+    records = {'NAME_1': [], 'NAME_2': []}
+    polygons = []
+    for i in range(rows):
+        for j in range(cols):
+            corners = [(i, j), (i, j + 1), (i + 1, j + 1), (i + 1, j)]
+            polygons.append(Polygon([(lon_nodes[r, c], lat_nodes[r, c]) for r, c in corners]))
+            records['NAME_1'].append(names[min(int(j * len(names) / cols), len(names) - 1)])
+            records['NAME_2'].append(f"Municipio {i * cols + j + 1:03d}")
+    municipalities = gpd.GeoDataFrame(records, geometry=polygons, crs='EPSG:4326')
+
+    for path, frame in ((regions_path, regions), (municipalities_path, municipalities)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        frame.to_file(path)
+    return regions_path, municipalities_path
+
+
+def build(folder, size='domain', days=10):
+    """
+    Genera (si no existen) todos los insumos de un tamaño y ventana en folder/<tamaño>/ y devuelve sus rutas.
+    Los archivos ya generados se reutilizan, así que una ventana más larga sólo agrega los días que faltan.
+    """
+    if size not in SIZES:
+        raise ValueError(f"Tamaño no soportado: {size}. Use uno de {', '.join(SIZES)}")
+    root = os.path.join(folder, size)
+    os.makedirs(root, exist_ok=True)
+    write_mswx(root, size, days)
+    write_temp_dates(root, size, days)
+    write_imerg(root, size, days)
+    write_forecast(root, size, days)
+    regions, municipalities = write_shapefiles(root)
+    return {
+        'root': root,
+        'ini_date': START_DATE,
+        'fin_date': START_DATE + timedelta(days=days),
+        'mswx': os.path.join(root, 'MSWX') + '/',
+        'temp': os.path.join(root, 'MSWX_dates', 'Temp') + '/',
+        'imerg': os.path.join(root, 'IMERG') + '/',
+        'forecast': os.path.join(root, 'forecast') + '/',
+        'mask': write_mask(root, size),
+        'regions': regions,
+        'municipalities': municipalities,
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    paths = build(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'domain', int(sys.argv[3]) if len(sys.argv) > 3 else 10)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
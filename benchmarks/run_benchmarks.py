@@ -0,0 +1,217 @@
+"""
+Benchmarks de las etapas del ETL sobre insumos sintéticos (ver fixtures.py), a varios tamaños de grilla
+y largos de ventana. Los resultados se guardan en benchmarks/results/<etiqueta>.json para comparar versiones.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/run_benchmarks.py run [--sizes domain,region] [--days 5,10] [--repeat 3] [--label etiqueta]
+    python benchmarks/run_benchmarks.py compare benchmarks/results/<base>.json benchmarks/results/<nuevo>.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCHMARKS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_FOLDER, "..", "src"))
+
+import numpy as np
+import xarray as xr
+
+import fixtures
+from imerg_data import IMERGData
+from mask_index import MaskIndex
+from mswx_data import MSWXData
+from region_index import RegionIndex
+from tools import Tools
+
+RESULTS_FOLDER = os.path.join(BENCHMARKS_FOLDER, "results")
+
+
+def calculate_et0(paths, output):
+    MSWXData().calculate_et0(paths['ini_date'], paths['fin_date'], inputdatapath=paths['mswx'],
+                             outputpath=os.path.join(output, "MSWX/"), mask_file_path=paths['mask'])
+
+
+def imerg_merge(paths, output):
+    os.makedirs(os.path.join(output, "IMERG"), exist_ok=True)
+    IMERGData().merge_nc_files(paths['ini_date'], paths['fin_date'], paths['imerg'], os.path.join(output, "IMERG"), paths['mask'])
+
+
+def merge_files_tif(paths, output):
+    Tools().merge_files(paths['ini_date'], paths['fin_date'], os.path.join(paths['forecast'], "RAIN", "RAIN_"),
+                        os.path.join(output, "RAIN_forecast.nc"), "tif", "mm/day", variable_name='precipitation')
+
+
+def merge_files_tif_window(paths, output):
+    Tools().merge_files(paths['ini_date'], paths['fin_date'], os.path.join(paths['forecast'], "RAIN", "RAIN_"),
+                        os.path.join(output, "RAIN_forecast_window.nc"), "tif", "mm/day", variable_name='precipitation',
+                        bounds=MaskIndex.load(paths['mask']).bounds)
+
+
+def merge_files_nc(paths, output):
+    Tools().merge_files(paths['ini_date'], paths['fin_date'], paths['temp'], os.path.join(output, "Temp.nc"), "nc",
+                        "grados celcius", variable_name='air_temperature')
+
+
+def regions_crop(paths, output):
+    Tools().regions_crop(os.path.join(output, "MSWX", "ET0_Honduras.nc"), paths['regions'],
+                         os.path.join(output, "ET0_Honduras_regions.nc"), "Nombre")
+
+
+def municipalities(paths, output):
+    Tools().calculate_daily_mean_per_municipality(paths['municipalities'], os.path.join(output, "MSWX", "ET0_Honduras.nc"),
+                                                  "ET0", "NAME_1", "NAME_2", "mm-day", "et0")
+
+
+def plot_nc_file(paths, output):
+    os.makedirs(os.path.join(output, "figures"), exist_ok=True)
+    Tools().plot_nc_file(os.path.join(output, "ET0_Honduras_regions.nc"), "ET0", save_path=os.path.join(output, "figures", "et0_"))
+
+
+# En orden: regions_crop, municipalities y plot_nc_file usan las salidas de los anteriores
+BENCHMARKS = {
+    'calculate_et0': calculate_et0,
+    'imerg_merge_nc_files': imerg_merge,
+    'merge_files_tif': merge_files_tif,
+    'merge_files_tif_window': merge_files_tif_window,
+    'merge_files_nc': merge_files_nc,
+    'regions_crop': regions_crop,
+    'municipalities': municipalities,
+    'plot_nc_file': plot_nc_file,
+}
+
+
+def time_benchmark(function, paths, output, repeat):
+    """
+    Ejecuta una etapa 'repeat' veces y devuelve los tiempos en segundos. Los índices de regiones en memoria
+    se borran antes de cada repetición para medir siempre el caso sin caché.
+    """
+    times = []
+    for _ in range(repeat):
+        RegionIndex._loaded.clear()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            start = time.perf_counter()
+            function(paths, output)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_FOLDER, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    sizes = args.sizes.split(',')
+    windows = [int(days) for days in args.days.split(',')]
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        raise SystemExit(f"Benchmarks desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(BENCHMARKS)}")
+
+    revision = git_revision()
+    label = args.label or revision or datetime.now().strftime('%Y%m%d%H%M%S')
+    results = []
+    for size in sizes:
+        for days in windows:
+            print(f"Generando insumos {size}, {days} días en {args.workdir}...")
+            paths = fixtures.build(args.workdir, size, days)
+            output = os.path.join(args.workdir, "output", f"{size}_{days}")
+            shutil.rmtree(output, ignore_errors=True)
+            os.makedirs(output)
+
+            for name in selected:
+                entry = {'benchmark': name, 'size': size, 'days': days, 'repeat': args.repeat}
+                try:
+                    times = time_benchmark(BENCHMARKS[name], paths, output, args.repeat)
+                    entry.update({'min': min(times), 'median': statistics.median(times), 'max': max(times)})
+                    print(f"  {name:<22} {size:<8} {days:>3} días  {entry['median']:.3f} s (min {entry['min']:.3f} s)")
+                except Exception as e:
+                    entry['error'] = str(e)
+                    print(f"  {name:<22} {size:<8} {days:>3} días  error: {e}")
+                results.append(entry)
+
+    report = {
+        'label': label,
+        'revision': revision,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'xarray': xr.__version__,
+        'results': results,
+    }
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    path = os.path.join(RESULTS_FOLDER, f"{label}.json")
+    with open(path, 'w', encoding='utf-8') as results_file:
+        json.dump(report, results_file, indent=2)
+    print(f"Resultados guardados en: {path}")
+
+
+def compare(args):
+    """
+    Compara las medianas de dos archivos de resultados. Devuelve 1 si alguna etapa es más lenta que la
+    base por encima del umbral.
+    """
+    with open(args.base, 'r', encoding='utf-8') as base_file, open(args.new, 'r', encoding='utf-8') as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+
+    def key(entry):
+        return entry['benchmark'], entry['size'], entry['days']
+
+    base_results = {key(entry): entry for entry in base['results'] if 'median' in entry}
+    regressions = 0
+    print(f"{'benchmark':<22} {'tamaño':<8} {'días':>4} {base['label']:>12} {new['label']:>12} {'razón':>7}")
+    for entry in new['results']:
+        reference = base_results.get(key(entry))
+        if reference is None or 'median' not in entry:
+            continue
+        ratio = entry['median'] / reference['median'] if reference['median'] > 0 else float('inf')
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = " regresión"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = " mejora"
+        print(f"{entry['benchmark']:<22} {entry['size']:<8} {entry['days']:>4} {reference['median']:>11.3f}s {entry['median']:>11.3f}s {ratio:>6.2f}x{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del ETL sobre insumos sintéticos")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Ejecuta los benchmarks y guarda los resultados")
+    run_parser.add_argument('--sizes', default='domain,region', help=f"Tamaños de grilla: {', '.join(fixtures.SIZES)}")
+    run_parser.add_argument('--days', default='5,10', help="Largos de ventana en días, separados por coma")
+    run_parser.add_argument('--repeat', type=int, default=3, help="Repeticiones de cada medición")
+    run_parser.add_argument('--only', default=None, help=f"Benchmarks a ejecutar: {', '.join(BENCHMARKS)}")
+    run_parser.add_argument('--label', default=None, help="Nombre del archivo de resultados (por defecto el commit actual)")
+    run_parser.add_argument('--workdir', default=os.path.join(BENCHMARKS_FOLDER, "data"), help="Carpeta de los insumos sintéticos")
+
+    compare_parser = commands.add_parser('compare', help="Compara dos archivos de resultados")
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help="Variación relativa tolerada (por defecto 0.1)")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from master import Master, env_number
+from tools import Tools
+import os, sys
+
+"""
+Clase que regenera los boletines de un rango de fechas centrales: descarga y procesa una sola vez los días
+de todas las ventanas y luego arma la ventana de cada fecha en paralelo
+"""
+
+
+class Backfill:
+    #Number of central dates assembled at the same time
+    WORKERS = env_number('BACKFILL_WORKERS', 4)
+    #Days of the window before each central date (as in Master)
+    WINDOW_DAYS = 10
+
+    def __init__(self, start_date, end_date, *master_args):
+        """
+        Inicializa el backfill.
+
+        Parámetros:
+        - start_date, end_date: Primera y última fecha central (YYYY-MM-DD), ambas incluidas.
+        - master_args: Resto de los argumentos de Master (workspace, shapefiles y carpeta de pronósticos).
+        """
+        self.start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
+        self.end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
+        if self.end_date < self.start_date:
+            raise ValueError(f"La fecha final ({end_date}) es anterior a la inicial ({start_date})")
+        self.master_args = master_args
+        self.central_dates = [self.start_date + timedelta(days=k) for k in range((self.end_date - self.start_date).days + 1)]
+
+        # Unión de las ventanas de todas las fechas: de start_date - WINDOW_DAYS a end_date - 1
+        self.INI_DATE = self.start_date - timedelta(days=self.WINDOW_DAYS)
+        self.FIN_DATE = self.end_date
+        self.master = self.window_master(end_date, f"backfill/{self.start_date.strftime('%Y%m%d')}_{self.end_date.strftime('%Y%m%d')}")
+        print(f"Backfill de {len(self.central_dates)} fechas centrales; días de entrada: {self.INI_DATE} a {self.FIN_DATE - timedelta(days=1)}")
+
+    def window_master(self, central_date, folder):
+        """
+        Master de una ventana con las salidas en output/<folder>/. La ET0 siempre usa el almacén por día, que
+        comparten todas las ventanas.
+        """
+        master = Master(central_date, *self.master_args)
+        master.TODAY = folder
+        master.ET0_STORE = True
+        return master
+
+    @staticmethod
+    def is_window_stage(name):
+        """
+        Etapas que se ejecutan por fecha central: las que resumen la ventana (regiones, gráficos y tabla por
+        municipio). El resto produce datos por día y se ejecuta una sola vez sobre la unión de las ventanas.
+        """
+        stage = name.split('@')[0]
+        return stage.startswith('regions_') or stage in ('plots', 'municipalities')
+
+    def run(self):
+        """
+        Ejecuta el backfill y devuelve el estado de las etapas de cada fecha central.
+        """
+        status = self.run_daily_products()
+        failed = [name for name, state in status.items() if state != 'done']
+        if failed:
+            print(f"Las ventanas usarán sólo los productos que se generaron (etapas con errores: {', '.join(failed)})")
+
+        # Con ETL_STAGE_EXECUTOR=queue cada fecha es una tarea de la cola que puede tomar cualquier nodo
+        queue = self.master.STAGE_EXECUTOR == 'queue'
+        results = {}
+        with (self.master.task_queue() if queue else ProcessPoolExecutor(max_workers=max(1, self.WORKERS))) as pool:
+            futures = {pool.submit(self.assemble_window, central_date): central_date for central_date in self.central_dates}
+            for future in as_completed(futures):
+                central_date = futures[future]
+                try:
+                    results[central_date] = future.result()
+                except Exception as e:
+                    print(f"Error al armar la ventana de {central_date}: {e}")
+                    results[central_date] = None
+
+        done = [central_date for central_date, result in results.items() if result is not None and all(state == 'done' for state in result.values())]
+        print(f"Backfill terminado: {len(done)} de {len(self.central_dates)} fechas sin errores")
+        return results
+
+    def run_daily_products(self):
+        """
+        Descarga los insumos de la unión de las ventanas y calcula una sola vez IMERG, ET0 (que queda en el
+        almacén por día), temperatura y pronósticos de todos los días, en output/backfill/<inicio>_<fin>/.
+        """
+        self.master.creates_folders()
+        scheduler = self.master.build_stages(self.INI_DATE, self.FIN_DATE)
+        selected = [name for name in scheduler.stages if not self.is_window_stage(name)]
+        status = self.master.run_stages(self.INI_DATE, self.FIN_DATE, selected=selected)
+        self.master.evict_input_cache()
+        return status
+
+    def assemble_window(self, central_date):
+        """
+        Arma las salidas de una fecha central en output/backfill/<YYYYMMDD>/: recorta del archivo de la unión
+        la ventana de cada producto diario, toma la ET0 del almacén y ejecuta las etapas de la ventana.
+        """
+        master = self.window_master(central_date.strftime("%Y-%m-%d"), f"backfill/{central_date.strftime('%Y%m%d')}")
+        if master.STAGE_EXECUTOR == 'queue':
+            # La ventana ya es una tarea de la cola: sus etapas corren en el nodo que la tomó
+            master.STAGE_EXECUTOR = 'process'
+        master.creates_folders()
+        scheduler = master.build_stages(master.INI_DATE, master.FIN_DATE)
+        selected = [name for name in scheduler.stages if self.is_window_stage(name)]
+
+        # Productos que usan las etapas de la ventana; ET0 se vuelve a escribir desde el almacén porque
+        # también guarda la suma de la ventana
+        products = sorted({dep for name in selected for dep in scheduler.stages[name]['deps']})
+        tools = Tools()
+        for product in products:
+            if product.split('@')[0] == 'et0':
+                selected.append(product)
+                continue
+            for output_file in scheduler.stages[product]['outputs']:
+                relative_path = os.path.relpath(output_file, master.output_path(""))
+                source_file = self.master.output_path(relative_path)
+                if os.path.exists(source_file):
+                    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+                    tools.time_window(source_file, output_file, master.INI_DATE, master.FIN_DATE, profile=master.NETCDF_PROFILE)
+                else:
+                    print(f"No existe {source_file}; las etapas de {central_date} que lo usan no podrán ejecutarse")
+
+        return master.run_stages(master.INI_DATE, master.FIN_DATE, selected=selected)
+
+
+if __name__ == "__main__":
+    variable = os.getenv('ETL_EXEC')
+
+    if variable is None or bool(int(variable)):
+
+        def process_arg(arg):
+            return None if arg == 'None' or arg is None else arg
+
+        # Procesar los argumentos
+        #YYYY-MM-DD YYYY-MM-DD, then the same optional arguments of master.py
+        start_date = sys.argv[1] if len(sys.argv) > 1 else None
+        end_date = sys.argv[2] if len(sys.argv) > 2 else None
+        master_args = [process_arg(arg) for arg in sys.argv[3:8]]
+
+        Backfill(start_date, end_date, *master_args).run()
@@ -0,0 +1,133 @@
+import os
+import pandas as pd
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from mswx_data import MSWXData
+from imerg_data import IMERGData
+
+"""
+Fuentes de insumos diarios intercambiables: Google Drive (MSWX), OPeNDAP/HTTP (IMERG) y un espejo local
+con los archivos ya descargados (disco local o carpeta compartida por NFS)
+"""
+
+
+class DataSource(ABC):
+    """
+    Interfaz de una fuente de insumos. fetch deja disponibles en disco los archivos diarios de un rango de
+    fechas y folder es la carpeta desde la que los leen las etapas de procesamiento.
+    """
+    @property
+    @abstractmethod
+    def folder(self):
+        pass
+
+    @abstractmethod
+    def fetch(self, ini_date, fin_date):
+        """
+        Prepara los archivos de las fechas ini_date a fin_date (sin incluir fin_date) y devuelve la lista de
+        archivos disponibles como diccionarios {'variable', 'name', 'folder'}.
+        """
+
+
+class GoogleDriveSource(DataSource):
+    def __init__(self, credentials_file, folder_id, variables, cache, manifest=None, workers=None):
+        """
+        Archivos diarios de MSWX en Google Drive, sincronizados en la caché de insumos.
+
+        Parámetros:
+        - credentials_file: Ruta al archivo credentials.json de la cuenta de servicio.
+        - folder_id: Carpeta de Drive que contiene una carpeta por variable.
+        - variables: Diccionario con las carpetas de variables a sincronizar.
+        - cache: InputCache donde se guardan los archivos.
+        - manifest: SyncManifest opcional para no volver a listar ni descargar lo que no cambió.
+        - workers: Número de descargas simultáneas (por defecto MSWXData.WORKERS).
+        """
+        self.credentials_file = credentials_file
+        self.folder_id = folder_id
+        self.variables = variables
+        self.cache = cache
+        self.manifest = manifest
+        self.workers = workers
+
+    @property
+    def folder(self):
+        return os.path.join(self.cache.cache_folder, "MSWX/")
+
+    def fetch(self, ini_date, fin_date):
+        mswx = MSWXData(self.credentials_file, workers=self.workers, manifest=self.manifest, cache=self.cache)
+        folders = mswx.list_folders_in_folder(self.folder_id, self.variables)
+
+        # Se listan todas las variables y luego se sincronizan juntas en paralelo; sólo se descargan los
+        # archivos nuevos o modificados desde la ejecución anterior
+        tasks = []
+        for folder in folders:
+            tasks += mswx.list_daily_files(folder['id'], ini_date, fin_date, self.cache.cache_folder, folder['title'])
+
+        failed = mswx.sync_files(tasks)
+        if failed:
+            print(f"No se pudieron descargar {len(failed)} archivos de MSWX: {', '.join(task['name'] for task in failed)}")
+        return [task for task in tasks if os.path.exists(os.path.join(task['folder'], task['name']))]
+
+
+class OpendapSource(DataSource):
+    def __init__(self, download_folder, mask_file_path, padding=2, workers=4, cookie_file=None, cache=None):
+        """
+        Archivos diarios de IMERG descargados del servidor OPeNDAP de GES DISC (sólo la ventana de la máscara).
+        Los parámetros son los de IMERGData.download.
+        """
+        self.download_folder = download_folder
+        self.mask_file_path = mask_file_path
+        self.padding = padding
+        self.workers = workers
+        self.cookie_file = cookie_file
+        self.cache = cache
+
+    @property
+    def folder(self):
+        if self.cache is None:
+            return self.download_folder
+        imerg = IMERGData()
+        hyperslab = imerg.domain_hyperslab(self.mask_file_path, self.padding) if self.mask_file_path is not None else None
+        return os.path.join(self.cache.cache_folder, 'IMERG', imerg.cache_variable(hyperslab)) + '/'
+
+    def fetch(self, ini_date, fin_date):
+        folder = IMERGData().download(ini_date, fin_date, self.download_folder, self.mask_file_path, self.padding,
+                                      self.workers, self.cookie_file, self.cache)
+        return LocalMirrorSource(folder, "IMERG_LATE%Y%m%d.nc", variables=['precipitation']).fetch(ini_date, fin_date)
+
+
+class LocalMirrorSource(DataSource):
+    def __init__(self, root, pattern, variables=None):
+        """
+        Archivos diarios ya presentes en una carpeta local o compartida; no se descarga ni se copia nada y
+        las etapas leen directamente del espejo.
+
+        Parámetros:
+        - root: Carpeta raíz del espejo.
+        - pattern: Ruta de cada archivo relativa a root, con {variable} y los códigos de fecha de strftime,
+          por ejemplo "{variable}/%Y%j.nc" para MSWX o "IMERG_LATE%Y%m%d.nc" para IMERG.
+        - variables: Variables del espejo (por defecto una sola, sin nombre).
+        """
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"No existe la carpeta del espejo de insumos: {root}")
+        self.root = root
+        self.pattern = pattern
+        self.variables = list(variables) if variables is not None else [None]
+
+    @property
+    def folder(self):
+        return os.path.join(self.root, '')
+
+    def fetch(self, ini_date, fin_date):
+        files = []
+        missing = []
+        for variable in self.variables:
+            for date in pd.date_range(start=ini_date, end=fin_date - timedelta(days=1)):
+                path = os.path.join(self.root, date.strftime(self.pattern.replace('{variable}', variable or '')))
+                if os.path.exists(path):
+                    files.append({'variable': variable, 'name': os.path.basename(path), 'folder': os.path.dirname(path)})
+                else:
+                    missing.append(path)
+        if missing:
+            print(f"Faltan {len(missing)} archivos en el espejo {self.root}: {', '.join(missing)}")
+        return files
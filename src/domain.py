@@ -0,0 +1,98 @@
+import os
+import re
+import json
+import inspect
+
+"""
+Clase que describe un país (dominio) procesado por el ETL: máscara, shapefiles y columnas de nombres
+"""
+
+
+class Domain:
+    # Claves obligatorias de cada dominio en el archivo de configuración
+    REQUIRED = ('name', 'mask', 'regions_shapefile', 'municipalities_shapefile')
+
+    def __init__(self, name, mask, regions_shapefile, municipalities_shapefile, region_column='Nombre',
+                 municipality_region_column='NAME_1', municipality_column='NAME_2', forecast_folder=None,
+                 et0_window=None, folder=''):
+        """
+        Inicializa el dominio.
+
+        Parámetros:
+        - name: Nombre del dominio; se usa en los nombres de los archivos de salida (por ejemplo ET0_<name>.nc).
+        - mask: Máscara NetCDF del país en la grilla de MSWX (variable 'mask' con valor 1 en el país).
+        - regions_shapefile: Shapefile de regiones y region_column, su columna de nombres.
+        - municipalities_shapefile: Shapefile de municipios, con las columnas de región (municipality_region_column)
+          y de municipio (municipality_column).
+        - forecast_folder: Carpeta con los pronósticos RAIN/, ET0/ y T2/ del país (None si no tiene pronósticos).
+        - et0_window: Caja (lat_min, lat_max, lon_min, lon_max) del cálculo de ET0 (None usa la caja de la máscara).
+        - folder: Subcarpeta de las salidas del dominio dentro de output/<fecha>/ ('' para escribir en ella).
+        """
+        if not re.fullmatch(r'[\w-]+', name):
+            raise ValueError(f"Nombre de dominio no válido: '{name}'. Use sólo letras, números, '_' o '-'")
+        self.name = name
+        self.mask = mask
+        self.regions_shapefile = regions_shapefile
+        self.municipalities_shapefile = municipalities_shapefile
+        self.region_column = region_column
+        self.municipality_region_column = municipality_region_column
+        self.municipality_column = municipality_column
+        self.forecast_folder = forecast_folder
+        self.et0_window = tuple(et0_window) if et0_window is not None else None
+        self.folder = folder
+
+    @classmethod
+    def load(cls, config_file):
+        """
+        Lee los dominios de un archivo JSON {"domains": [{...}, ...]} con las claves de __init__. Las rutas
+        relativas se toman desde la carpeta del archivo de configuración y las salidas de cada dominio se
+        escriben en output/<fecha>/<name>/.
+        """
+        with open(config_file, 'r', encoding='utf-8') as config:
+            content = json.load(config)
+
+        base_folder = os.path.dirname(os.path.abspath(config_file))
+
+        def resolve(path):
+            return os.path.join(base_folder, path) if path is not None and not os.path.isabs(path) else path
+
+        # Claves que acepta cada dominio: los parámetros de __init__ salvo folder, que se deriva del nombre
+        allowed = [key for key in inspect.signature(cls.__init__).parameters if key not in ('self', 'folder')]
+
+        domains = []
+        for entry in content.get('domains', []):
+            missing = [key for key in cls.REQUIRED if key not in entry]
+            if missing:
+                raise ValueError(f"Faltan las claves {', '.join(missing)} en un dominio de {config_file}")
+            unknown = [key for key in entry if key not in allowed]
+            if unknown:
+                raise ValueError(f"Claves desconocidas {', '.join(unknown)} en el dominio '{entry['name']}' de {config_file}. "
+                                 f"Las claves válidas son: {', '.join(allowed)}")
+            settings = dict(entry)
+            for key in ('mask', 'regions_shapefile', 'municipalities_shapefile', 'forecast_folder'):
+                settings[key] = resolve(settings.get(key))
+            if settings.get('forecast_folder') is not None:
+                settings['forecast_folder'] = os.path.join(settings['forecast_folder'], '')
+            domains.append(cls(folder=f"{entry['name']}/", **settings))
+
+        if not domains:
+            raise ValueError(f"No hay dominios en {config_file}")
+        names = [domain.name for domain in domains]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Hay dominios repetidos en {config_file}: {', '.join(names)}")
+        for domain in domains:
+            if not os.path.exists(domain.mask):
+                raise FileNotFoundError(f"No existe la máscara del dominio {domain.name}: {domain.mask}")
+        return domains
+
+    def stage(self, name):
+        """
+        Nombre de una etapa del dominio; las etapas del dominio por defecto conservan su nombre.
+        """
+        return f"{name}@{self.name}" if self.folder else name
+
+    def output(self, relative_path):
+        """
+        Ruta de una salida del dominio relativa a output/<fecha>/.
+        """
+        return f"{self.folder}{relative_path}"
@@ -0,0 +1,76 @@
+import os
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlparse
+
+"""
+Sesión HTTP reutilizable y autenticada con NASA Earthdata para las descargas de IMERG
+"""
+
+
+class EarthdataSession(requests.Session):
+    AUTH_HOST = 'urs.earthdata.nasa.gov'
+
+    def __init__(self, username, password, pool_size=4, cookie_file=None, max_retries=3):
+        """
+        Inicializa la sesión con las credenciales de Earthdata, un pool de conexiones keep-alive y
+        reintentos ante errores transitorios.
+
+        Parámetros:
+        - username, password: Credenciales de Earthdata.
+        - pool_size: Número máximo de conexiones simultáneas por servidor.
+        - cookie_file: Archivo JSON opcional donde se guardan las cookies de autenticación entre ejecuciones.
+        - max_retries: Reintentos ante errores 429/5xx o de conexión.
+        """
+        super().__init__()
+        self.auth = (username, password)
+        self.cookie_file = cookie_file
+
+        retry = Retry(total=max_retries, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+        self.load_cookies()
+
+    def rebuild_auth(self, prepared_request, response):
+        """
+        Conserva las credenciales sólo en las redirecciones hacia o desde el servidor de Earthdata.
+        """
+        headers = prepared_request.headers
+        if 'Authorization' in headers:
+            original_host = urlparse(response.request.url).hostname
+            redirect_host = urlparse(prepared_request.url).hostname
+            if original_host != redirect_host and self.AUTH_HOST not in (original_host, redirect_host):
+                del headers['Authorization']
+
+    def load_cookies(self):
+        """
+        Carga las cookies de una autenticación anterior, si existen.
+        """
+        if self.cookie_file is None or not os.path.exists(self.cookie_file):
+            return
+        try:
+            with open(self.cookie_file, 'r', encoding='utf-8') as cookie_file:
+                for cookie in json.load(cookie_file):
+                    self.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+        except (ValueError, KeyError) as e:
+            print(f"No se pudieron cargar las cookies de Earthdata de {self.cookie_file}: {e}")
+
+    def save_cookies(self):
+        """
+        Guarda las cookies de la sesión para reutilizar la autenticación en la siguiente ejecución.
+        """
+        if self.cookie_file is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.cookie_file)), exist_ok=True)
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+                   for c in self.cookies if not c.is_expired()]
+        temp_path = self.cookie_file + '.tmp'
+        # Las cookies dan acceso a la cuenta: sólo el usuario puede leerlas
+        with open(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as cookie_file:
+            json.dump(cookies, cookie_file)
+        os.replace(temp_path, self.cookie_file)
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+import numpy as np
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # fcntl no existe en Windows: el índice se guarda sin bloqueo entre procesos
+    fcntl = None
+
+"""
+Clase que guarda entre ejecuciones la ET0 de cada día, asociada a los checksums de los archivos de entrada
+"""
+
+
+class ET0Store:
+    def __init__(self, store_folder, max_age_days=None):
+        """
+        Inicializa el almacén. Cada día se guarda como store_folder/<YYYYMMDD>.npy y se indexa en
+        store_folder/index.json con la firma de sus insumos (checksums de los archivos de MSWX y parámetros
+        del cálculo); un día sólo se vuelve a calcular si falta o si cambió su firma.
+
+        Parámetros:
+        - store_folder: Carpeta del almacén.
+        - max_age_days: Días sin usarse tras los que evict elimina un día del almacén y los checksums memorizados
+          (None: el almacén crece sin límite).
+        """
+        self.store_folder = store_folder
+        self.max_age_days = max_age_days
+        self.index_path = os.path.join(store_folder, "index.json")
+        self._lock = threading.Lock()
+        self._changed = {'days': set(), 'files': set()}
+        self._removed = {'days': set(), 'files': set()}
+        content = self.read_index()
+        self.days = content['days']
+        self.files = content['files']
+
+    def read_index(self):
+        """
+        Lee el índice del almacén desde disco.
+        """
+        if not os.path.exists(self.index_path):
+            return {'days': {}, 'files': {}}
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            content = json.load(index_file)
+        return {'days': content.get('days', {}), 'files': content.get('files', {})}
+
+    def checksum(self, file_path):
+        """
+        Checksum MD5 de un archivo. Se memoriza por ruta, tamaño y fecha de modificación para no volver a leer
+        los archivos que no cambiaron; lanza FileNotFoundError si el archivo no existe.
+        """
+        stat = os.stat(file_path)
+        with self._lock:
+            entry = self.files.get(file_path)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                entry['last_used'] = time.time()
+                self._changed['files'].add(file_path)
+                return entry['md5']
+
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as input_file:
+            for block in iter(lambda: input_file.read(1024 * 1024), b''):
+                md5.update(block)
+        with self._lock:
+            self.files[file_path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'md5': md5.hexdigest(), 'last_used': time.time()}
+            self._changed['files'].add(file_path)
+        return md5.hexdigest()
+
+    def signature(self, file_paths, settings):
+        """
+        Firma de un día: checksums de sus archivos de entrada y parámetros del cálculo (diccionario serializable).
+        """
+        content = {'inputs': {os.path.basename(os.path.dirname(path)): self.checksum(path) for path in file_paths},
+                   'settings': settings}
+        return hashlib.md5(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, date, signature):
+        """
+        Devuelve la ET0 guardada de un día, o None si no existe o se calculó con otros insumos.
+        """
+        key = date.strftime('%Y%m%d')
+        entry = self.days.get(key)
+        if entry is None or entry['signature'] != signature:
+            return None
+        path = os.path.join(self.store_folder, entry['file'])
+        if not os.path.exists(path):
+            return None
+        with self._lock:
+            entry['last_used'] = time.time()
+            self._changed['days'].add(key)
+        return np.load(path)
+
+    def put(self, date, values, signature):
+        """
+        Guarda la ET0 de un día (arreglo lat x lon).
+        """
+        os.makedirs(self.store_folder, exist_ok=True)
+        file_name = f"{date.strftime('%Y%m%d')}.npy"
+        temp_path = os.path.join(self.store_folder, f"{file_name}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npy")
+        np.save(temp_path, np.asarray(values))
+        os.replace(temp_path, os.path.join(self.store_folder, file_name))
+        with self._lock:
+            key = date.strftime('%Y%m%d')
+            self.days[key] = {'file': file_name, 'signature': signature, 'last_used': time.time(),
+                              'created': datetime.now().isoformat(timespec='seconds')}
+            self._changed['days'].add(key)
+            self._removed['days'].discard(key)
+
+    def evict(self):
+        """
+        Elimina los días que no se usan hace más de max_age_days (con su archivo .npy) y los checksums
+        memorizados de archivos que ya no existen o que tampoco se usan. Devuelve el número de días eliminados.
+        """
+        removed = 0
+        with self._lock:
+            limit = time.time() - self.max_age_days * 86400 if self.max_age_days is not None else None
+            for key, entry in list(self.days.items()):
+                if limit is None or entry.get('last_used', 0) >= limit:
+                    continue
+                path = os.path.join(self.store_folder, entry['file'])
+                if os.path.exists(path):
+                    os.remove(path)
+                del self.days[key]
+                self._changed['days'].discard(key)
+                self._removed['days'].add(key)
+                removed += 1
+            for file_path, entry in list(self.files.items()):
+                if os.path.exists(file_path) and (limit is None or entry.get('last_used', 0) >= limit):
+                    continue
+                del self.files[file_path]
+                self._changed['files'].discard(file_path)
+                self._removed['files'].add(file_path)
+        return removed
+
+    def save(self):
+        """
+        Escribe el índice del almacén en disco de forma atómica. Como en InputCache, sólo se aplican los cambios
+        de esta instancia sobre el índice actual, para no perder los de otros procesos que usan el almacén al
+        mismo tiempo (ver Backfill); el archivo temporal es propio de cada proceso.
+        """
+        os.makedirs(self.store_folder, exist_ok=True)
+        # El bloqueo del archivo .lock hace que la lectura, la mezcla y el reemplazo del índice no se intercalen
+        # con los de otro proceso
+        with self._lock, open(f"{self.index_path}.lock", 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            content = self.read_index()
+            for section, entries in (('days', self.days), ('files', self.files)):
+                for key in self._removed[section]:
+                    content[section].pop(key, None)
+                for key in self._changed[section]:
+                    content[section][key] = entries[key]
+                self._changed[section].clear()
+                self._removed[section].clear()
+            self.days, self.files = content['days'], content['files']
+            temp_path = f"{self.index_path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump(content, index_file, indent=2)
+            os.replace(temp_path, self.index_path)
@@ -0,0 +1,106 @@
+import numpy as np
+import rasterio
+from rasterio.enums import Interleaving
+from rasterio.windows import Window
+
+"""
+Clase que lee la primera banda de los GeoTIFF diarios sólo en la ventana del dominio, directamente desde los
+bloques del archivo (memory-map) cuando no están comprimidos
+"""
+
+
+class GeoTiffReader:
+    def __init__(self, bounds=None, padding=2):
+        """
+        Inicializa el lector.
+
+        Parámetros:
+        - bounds: Caja (lat_min, lat_max, lon_min, lon_max) que se lee de cada archivo (None lee la banda completa).
+        - padding: Celdas del GeoTIFF que se agregan a cada lado de la caja.
+        """
+        self.bounds = bounds
+        self.padding = padding
+
+    def grid(self, src):
+        """
+        Ventana de lectura y coordenadas (lat, lon) de sus filas y columnas. Las coordenadas se calculan como
+        hasta ahora a partir de la transformación afín (esquina superior izquierda de cada píxel), así que la
+        ventana es un recorte exacto de la grilla completa.
+        """
+        latitudes = src.transform[5] + src.transform[4] * np.arange(src.height)
+        longitudes = src.transform[2] + src.transform[0] * np.arange(src.width)
+        if self.bounds is None:
+            return Window(0, 0, src.width, src.height), latitudes, longitudes
+
+        lat_min, lat_max, lon_min, lon_max = self.bounds
+        # Se amplía la caja un píxel para no perder la celda que la contiene si es más chica que un píxel
+        lat_step, lon_step = abs(src.transform[4]), abs(src.transform[0])
+        rows = np.flatnonzero((latitudes >= lat_min - lat_step) & (latitudes <= lat_max + lat_step))
+        cols = np.flatnonzero((longitudes >= lon_min - lon_step) & (longitudes <= lon_max + lon_step))
+        if rows.size == 0 or cols.size == 0:
+            raise ValueError(f"El archivo {src.name} no cubre la caja {self.bounds}")
+        row_start, row_stop = max(int(rows[0]) - self.padding, 0), min(int(rows[-1]) + 1 + self.padding, src.height)
+        col_start, col_stop = max(int(cols[0]) - self.padding, 0), min(int(cols[-1]) + 1 + self.padding, src.width)
+        window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+        return window, latitudes[row_start:row_stop], longitudes[col_start:col_stop]
+
+    def read(self, file_path, out=None):
+        """
+        Lee la ventana de la primera banda de un GeoTIFF. Devuelve (datos, lat, lon); con out (un arreglo de la
+        forma de la ventana, por ejemplo un día de un arreglo (tiempo, lat, lon) ya reservado) los datos se
+        escriben ahí sin copias intermedias.
+        """
+        with rasterio.open(file_path) as src:
+            window, latitudes, longitudes = self.grid(src)
+            shape = (int(window.height), int(window.width))
+            if out is not None and out.shape != shape:
+                raise ValueError(f"La ventana de {file_path} {shape} no coincide con la de los demás días {out.shape}")
+            target = out if out is not None else np.empty(shape, dtype=src.dtypes[0])
+            if not self.read_mapped(file_path, src, window, target):
+                if target.dtype == np.dtype(src.dtypes[0]):
+                    src.read(1, window=window, out=target)
+                else:
+                    target[...] = src.read(1, window=window)
+        return target, latitudes, longitudes
+
+    def read_mapped(self, file_path, src, window, target):
+        """
+        Copia la ventana a target leyendo con np.memmap sólo los bloques (strips o tiles) que la cubren, sin
+        pasar por GDAL. Devuelve False si el archivo no lo permite (compresión, bandas intercaladas por píxel
+        o bloques sin posición en el archivo) y hay que leerlo con rasterio.
+        """
+        if src.driver != 'GTiff' or src.compression is not None or (src.count > 1 and src.interleaving != Interleaving.band):
+            return False
+        with open(file_path, 'rb') as tiff_file:
+            byte_order = {b'II': '<', b'MM': '>'}.get(tiff_file.read(2))
+        if byte_order is None:
+            return False
+
+        dtype = np.dtype(src.dtypes[0]).newbyteorder(byte_order)
+        block_height, block_width = src.block_shapes[0]
+        row_start, col_start = int(window.row_off), int(window.col_off)
+        row_stop, col_stop = row_start + int(window.height), col_start + int(window.width)
+
+        blocks = []
+        for block_row in range(row_start // block_height, (row_stop - 1) // block_height + 1):
+            for block_col in range(col_start // block_width, (col_stop - 1) // block_width + 1):
+                offset = src.get_tag_item(f'BLOCK_OFFSET_{block_col}_{block_row}', 'TIFF', bidx=1)
+                size = src.get_tag_item(f'BLOCK_SIZE_{block_col}_{block_row}', 'TIFF', bidx=1)
+                if not offset or not size or int(offset) == 0:
+                    return False
+                # El último strip puede tener menos filas; los tiles siempre están completos
+                rows = min(block_height, int(size) // (block_width * dtype.itemsize))
+                blocks.append((block_row, block_col, int(offset), rows))
+
+        # Un solo mapeo del archivo; cada bloque es una vista sobre él
+        mapped = np.memmap(file_path, dtype=np.uint8, mode='r')
+        try:
+            for block_row, block_col, offset, rows in blocks:
+                block = np.ndarray((rows, block_width), dtype=dtype, buffer=mapped, offset=offset)
+                top, left = block_row * block_height, block_col * block_width
+                r0, r1 = max(row_start, top), min(row_stop, top + rows)
+                c0, c1 = max(col_start, left), min(col_stop, left + block_width)
+                target[r0 - row_start:r1 - row_start, c0 - col_start:c1 - col_start] = block[r0 - top:r1 - top, c0 - left:c1 - left]
+        finally:
+            del mapped
+        return True
@@ -1,12 +1,67 @@
-from urllib import request, error
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from netCDF4 import Dataset
 import pandas as pd
 from datetime import timedelta
 import os
 import xarray as xr
+import numpy as np
 from tqdm import tqdm
+from earthdata_session import EarthdataSession
+from mask_index import MaskIndex
+from storage_profile import StorageProfile
+from telemetry import Telemetry
+from time_series_writer import TimeSeriesWriter
 
 class IMERGData:
+    # Grilla global de IMERG a 0.1°: lon de -179.95 a 179.95 (3600) y lat de -89.95 a 89.95 (1800)
+    LON_ORIGIN = -179.95
+    LAT_ORIGIN = -89.95
+    RESOLUTION = 0.1
+    N_LON = 3600
+    N_LAT = 1800
+
+    def __init__(self, timeout=300):
+        """
+        Inicializa la clase con el tiempo máximo de espera (segundos) de cada descarga.
+        """
+        self.timeout = timeout
+        self._netcdf_lock = threading.Lock()
+
+    def domain_hyperslab(self, mask_file_path, padding=2):
+        """
+        Calcula los rangos de índices (lon, lat) de la grilla de IMERG que cubren los píxeles de la máscara,
+        ampliados en 'padding' celdas por cada lado. Devuelve (lon_ini, lon_fin, lat_ini, lat_fin), inclusivos.
+        mask_file_path puede ser una lista de máscaras (varios países); se cubren todas.
+        """
+        bounds = []
+        for path in ([mask_file_path] if isinstance(mask_file_path, str) else mask_file_path):
+            try:
+                bounds.append(MaskIndex.load(path).bounds)
+            except ValueError:
+                raise ValueError(f"La máscara {path} no tiene píxeles con valor 1")
+        lat_min, lat_max = min(bound[0] for bound in bounds), max(bound[1] for bound in bounds)
+        lon_min, lon_max = min(bound[2] for bound in bounds), max(bound[3] for bound in bounds)
+
+        def index(value, origin):
+            return int(np.round((value - origin) / self.RESOLUTION))
+
+        lon_ini = max(index(lon_min, self.LON_ORIGIN) - padding, 0)
+        lon_fin = min(index(lon_max, self.LON_ORIGIN) + padding, self.N_LON - 1)
+        lat_ini = max(index(lat_min, self.LAT_ORIGIN) - padding, 0)
+        lat_fin = min(index(lat_max, self.LAT_ORIGIN) + padding, self.N_LAT - 1)
+        return lon_ini, lon_fin, lat_ini, lat_fin
+
+    def opendap_constraint(self, hyperslab=None):
+        """
+        Construye la restricción OPeNDAP para pedir sólo el hiperslab del dominio (o la grilla global si es None).
+        """
+        if hyperslab is None:
+            hyperslab = (0, self.N_LON - 1, 0, self.N_LAT - 1)
+        lon_ini, lon_fin, lat_ini, lat_fin = hyperslab
+        return (f'precipitation[0:1:0][{lon_ini}:1:{lon_fin}][{lat_ini}:1:{lat_fin}],'
+                f'time[0:1:0],lon[{lon_ini}:1:{lon_fin}],lat[{lat_ini}:1:{lat_fin}]')
 
     def generate_month_year_range(self,initial_date, final_date):
         result = []
@@ -17,70 +72,76 @@ class IMERGData:
             current_date = current_date.replace(day=1)
         return result
 
-    def imerg(self, ini_date, fin_date, download_folder, output_folder, mask_file_path):
-        username = os.getenv('IMERG_USERNAME')
-        password = os.getenv('IMERG_PWD')
-        redirectHandler = request.HTTPRedirectHandler()
-        cookieProcessor = request.HTTPCookieProcessor()
-        passwordManager = request.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(
-            None, "https://urs.earthdata.nasa.gov", username, password)
-        authHandler = request.HTTPBasicAuthHandler(passwordManager)
-        opener = request.build_opener(
-            redirectHandler, cookieProcessor, authHandler)
-        request.install_opener(opener)
-        
-        # Checking if folders exist
-        if not os.path.exists(download_folder):
-            os.makedirs(download_folder)
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
+    def imerg_url(self, date, constraint):
+        """
+        Construye la URL OPeNDAP del archivo diario de IMERG Late para una fecha.
+        """
+        year = date.year
+        month = str(date.month).zfill(2)
+        day = str(date.day).zfill(2)
+        return f'https://gpm1.gesdisc.eosdis.nasa.gov/opendap/hyrax/GPM_L3/GPM_3IMERGDL.07/{year}/{month}/3B-DAY-L.MS.MRG.3IMERG.{year}{month}{day}-S000000-E235959.V07B.nc4.nc4?{constraint}'
 
-        month_year_range = self.generate_month_year_range(ini_date, fin_date)
-        days_array = [str(day).zfill(2) for day in range(1, 32)]
+    def validate_content(self, content, filename):
+        """
+        Valida en memoria la respuesta de OPeNDAP antes de escribirla. Devuelve un mensaje de error o None.
+        """
+        # netCDF/HDF5 no es seguro entre hilos: la validación se hace de a un archivo
+        with self._netcdf_lock:
+            try:
+                imerg_nc = Dataset(filename, memory=content)
+            except OSError as e:
+                return f'{filename} is not a valid NetCDF file: {e}'
+            try:
+                if 'lat' not in imerg_nc.dimensions or 'lon' not in imerg_nc.dimensions:
+                    return f'lat/lon not found in {filename}'
+                if 'precipitation' not in imerg_nc.variables:
+                    return f'precipitation not found in {filename}'
+            finally:
+                imerg_nc.close()
+        return None
 
-        for i, month_year in enumerate(month_year_range):
-            [month, year] = month_year.split('-')
+    def fetch_day(self, session, date, constraint, download_folder):
+        """
+        Descarga un día de IMERG con la sesión compartida, lo valida en memoria y lo escribe en disco.
+        Devuelve el checksum MD5 del archivo si quedó disponible, o None.
+        """
+        filename = f'{download_folder}IMERG_LATE{date.strftime("%Y%m%d")}.nc'
+        response = session.get(self.imerg_url(date, constraint), timeout=self.timeout)
+        retries = getattr(response.raw, 'retries', None)
+        if retries is not None and retries.history:
+            Telemetry.count('retries', len(retries.history))
 
-            if i == 0:
-                days = [str(day).zfill(2) for day in range(ini_date.day, fin_date.day)]
-            elif i == len(month_year_range) - 1:
-                days = [str(day).zfill(2) for day in range(1, fin_date.day + 1)]
-            else:
-                days = days_array
-
-            total_iterations = len(days)
-            bar_format = '{l_bar}{bar}| {n:.0f}/{total:.0f} [{elapsed}<{remaining}, {rate_fmt}]'
-
-            with tqdm(total=total_iterations, desc="Descargando datos de precipitación de IMERG", bar_format=bar_format) as pbar:
-                for day in days:
-                    try:
-                        url = f'https://gpm1.gesdisc.eosdis.nasa.gov/opendap/hyrax/GPM_L3/GPM_3IMERGDL.07/{year}/{month}/3B-DAY-L.MS.MRG.3IMERG.{year}{month}{day}-S000000-E235959.V07B.nc4.nc4?precipitation[0:1:0][0:1:3599][0:1:1799]'            
-                        filename = f'{download_folder}IMERG_LATE{year}{month}{day}.nc'
-                        request.urlretrieve(url, filename)
-                        pbar.update(1)
-
-                        imerg_nc = Dataset(filename)
-
-                        if 'lat' not in imerg_nc.dimensions or 'lon' not in imerg_nc.dimensions:
-                            print(f'lat/lon not found in {filename}')
-                            imerg_nc.close()
-                            os.remove(filename)
-                            continue
-
-                        if 'precipitation' not in imerg_nc.variables:
-                            print(f'precipitation not found in {filename}')
-                            imerg_nc.close()
-                            os.remove(filename)
-                            continue
-
-                    except error.HTTPError as e:
-                        if e.code == 404:
-                            print(f'Fechas no disponibles en IMERG para {year}-{month}-{day}. Pruebe con otro rango de fechas')
-                        else:
-                            print(e)
-                    except Exception as e:
-                        print(e)
+        if response.status_code == 404:
+            print(f'Fechas no disponibles en IMERG para {date.strftime("%Y-%m-%d")}. Pruebe con otro rango de fechas')
+            return None
+        response.raise_for_status()
+
+        message = self.validate_content(response.content, filename)
+        if message is not None:
+            print(message)
+            return None
+
+        with open(filename + '.part', 'wb') as file:
+            file.write(response.content)
+        os.replace(filename + '.part', filename)
+        Telemetry.count('files_downloaded')
+        Telemetry.count('bytes_downloaded', len(response.content))
+        return hashlib.md5(response.content).hexdigest()
+
+    def imerg(self, ini_date, fin_date, download_folder, output_folder, mask_file_path, padding=2, workers=4, cookie_file=None, cache=None):
+        """
+        Descarga los archivos diarios de IMERG del rango de fechas en paralelo con una sesión autenticada
+        y los une, recortados a la máscara, en IMERG_Honduras.nc.
+
+        Parámetros:
+        - workers: Número de descargas simultáneas.
+        - cookie_file: Archivo opcional donde se guardan las cookies de Earthdata entre ejecuciones.
+        - cache: InputCache opcional; los días ya descargados en ejecuciones anteriores no se vuelven a pedir
+          y los archivos se leen directamente de la caché en lugar de download_folder.
+        """
+        download_folder = self.download(ini_date, fin_date, download_folder, mask_file_path, padding, workers, cookie_file, cache)
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
 
         try:
             # Merging, cropping, and writing file
@@ -89,10 +150,84 @@ class IMERGData:
                         print("Error al tratar de unir archivos .nc de precipitación. Verificar si la descarga fue correcta (disponibilidad de fechas en IMERG)")
                         print(e)
 
-    def merge_nc_files(self, start_date, end_date, download_folder, output_folder, mask_file_path):
+    def cache_variable(self, hyperslab):
+        """
+        Nombre de la variable de IMERG en la caché de insumos: el contenido depende del hiperslab pedido,
+        así que forma parte de la clave.
+        """
+        return 'precipitation_' + '_'.join(str(index) for index in hyperslab) if hyperslab is not None else 'precipitation'
+
+    def download(self, ini_date, fin_date, download_folder, mask_file_path, padding=2, workers=4, cookie_file=None, cache=None):
+        """
+        Descarga los archivos diarios de IMERG del rango de fechas (parámetros como en imerg) y devuelve la
+        carpeta donde quedaron: download_folder, o la carpeta de la caché si se usa una.
+        """
+        session = EarthdataSession(os.getenv('IMERG_USERNAME'), os.getenv('IMERG_PWD'),
+                                   pool_size=workers, cookie_file=cookie_file)
+
+        # Sólo se pide al servidor la ventana que cubre la máscara
+        hyperslab = self.domain_hyperslab(mask_file_path, padding) if mask_file_path is not None else None
+        constraint = self.opendap_constraint(hyperslab)
+
+        dates = list(pd.date_range(start=ini_date, end=fin_date - timedelta(days=1)))
+
+        if cache is not None:
+            variable = self.cache_variable(hyperslab)
+            download_folder = cache.folder_for('IMERG', variable) + '/'
+            dates = [date for date in dates if cache.get('IMERG', variable, date) is None]
+
+        # Checking if folders exist
+        if not os.path.exists(download_folder):
+            os.makedirs(download_folder)
+        bar_format = '{l_bar}{bar}| {n:.0f}/{total:.0f} [{elapsed}<{remaining}, {rate_fmt}]'
+
+        def fetch(date):
+            try:
+                checksum = self.fetch_day(session, date, constraint, download_folder)
+            except Exception as e:
+                tqdm.write(f'Error al descargar IMERG para {date.strftime("%Y-%m-%d")}: {e}')
+                return None
+            if checksum is not None and cache is not None:
+                cache.put('IMERG', variable, date, f'{download_folder}IMERG_LATE{date.strftime("%Y%m%d")}.nc', checksum=checksum)
+            return checksum
+
+        with session, tqdm(total=len(dates), desc="Descargando datos de precipitación de IMERG", bar_format=bar_format) as pbar:
+            # El primer día se descarga solo para autenticarse una vez con Earthdata; el resto reutiliza las cookies
+            pending = dates
+            while pending:
+                authenticated = fetch(pending[0])
+                pbar.update(1)
+                pending = pending[1:]
+                if authenticated:
+                    session.save_cookies()
+                    break
+
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for _ in executor.map(fetch, pending):
+                    pbar.update(1)
+
+        if cache is not None:
+            cache.save()
+        return download_folder
+
+    def merge_nc_files(self, start_date, end_date, download_folder, output_folder, mask_file_path, stream=False, profile=None, output_name='IMERG_Honduras.nc'):
+        """
+        Une los archivos diarios de IMERG recortados a la máscara en IMERG_Honduras.nc.
+
+        Parámetros:
+        - stream: Si es True cada día se abre de forma perezosa, se recorta a la máscara y se escribe al final del
+          archivo antes de abrir el siguiente, en lugar de unir todos los días en memoria antes de recortar.
+        - profile: Perfil de almacenamiento de IMERG_Honduras.nc (ver StorageProfile).
+        - output_name: Nombre del archivo de salida en output_folder.
+        """
         # Generar la lista de fechas
         date_range = pd.date_range(start=start_date, end=end_date - timedelta(days=1))
 
+        if stream:
+            self.stream_nc_files(date_range, download_folder, output_folder, mask_file_path, profile, output_name)
+            print("Precipitación usando IMERG para Honduras guardado en: ", output_folder)
+            return
+
         # Crear una lista para almacenar los datasets
         datasets = []
         times = []
@@ -109,6 +244,7 @@ class IMERGData:
             if os.path.exists(filename):
                 # Abrir el archivo y agregarlo a la lista de datasets
                 ds = xr.open_dataset(filename)
+                Telemetry.count_read(filename)
                 datasets.append(ds)
                 times.append(date)
             else:
@@ -122,18 +258,36 @@ class IMERGData:
         combined_ds['precipitation'].attrs['units'] = 'mm/day'
         combined_ds.attrs['units'] = 'mm/day'
 
-        mask_file = mask_file_path
-        ds_mask = xr.open_dataset(mask_file)
-
         # Aplicar la máscara a los datos globales
-        ds_global_honduras = combined_ds.where(ds_mask['mask'] == 1, drop=True)
-        ds_global_honduras.to_netcdf(f'{output_folder}/IMERG_Honduras.nc')
+        ds_global_honduras = MaskIndex.load(mask_file_path).crop(combined_ds)
+        StorageProfile.get(profile).to_netcdf(ds_global_honduras, f'{output_folder}/{output_name}')
+        Telemetry.count_written(f'{output_folder}/{output_name}')
         print("Precipitación usando IMERG para Honduras guardado en: ", output_folder)
 
         # Cerrar los datasets
         for ds in datasets:
             ds.close()
-        ds_mask.close()
 
+    def stream_nc_files(self, date_range, download_folder, output_folder, mask_file_path, profile=None, output_name='IMERG_Honduras.nc'):
+        """
+        Versión por días de merge_nc_files: sólo hay un día recortado en memoria a la vez.
+        """
+        mask = MaskIndex.load(mask_file_path)
+
+        with TimeSeriesWriter(f'{output_folder}/{output_name}', profile=profile) as writer:
+            for date in date_range:
+                filename = f'{download_folder}IMERG_LATE{date.strftime("%Y%m%d")}.nc'
+                if not os.path.exists(filename):
+                    print(f'File not found: {filename}')
+                    continue
 
+                Telemetry.count_read(filename)
+                with xr.open_dataset(filename) as ds:
+                    # El recorte se aplica sobre el archivo sin leer; sólo se leen las celdas de la máscara
+                    day = mask.crop(ds.isel(time=slice(0, 1)).assign_coords(time=[date]))
+                    day['precipitation'].attrs['units'] = 'mm/day'
+                    day.attrs['units'] = 'mm/day'
+                    writer.append(day.load())
 
+        if writer.length == 0:
+            raise ValueError(f"No se encontraron archivos de IMERG para unir en {download_folder}")
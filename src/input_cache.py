@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # fcntl no existe en Windows: el índice se guarda sin bloqueo entre procesos
+    fcntl = None
+
+"""
+Clase que mantiene una caché de insumos descargados compartida entre ejecuciones
+"""
+
+
+class InputCache:
+    def __init__(self, cache_folder, max_size_gb=None, max_age_days=None):
+        """
+        Inicializa la caché. Los archivos se guardan como cache_folder/<fuente>/<variable>/<archivo> y se
+        indexan por (fuente, variable, fecha) en cache_folder/index.json.
+
+        Parámetros:
+        - cache_folder: Carpeta raíz de la caché.
+        - max_size_gb: Tamaño máximo de la caché; al desalojar se eliminan primero los archivos usados hace más tiempo.
+        - max_age_days: Antigüedad máxima (desde el último uso) de un archivo en la caché.
+        """
+        self.cache_folder = cache_folder
+        self.max_size_gb = max_size_gb
+        self.max_age_days = max_age_days
+        self.index_path = os.path.join(cache_folder, "index.json")
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._removed = set()
+        self.entries = self.read_index()
+
+    def read_index(self):
+        """
+        Lee el índice de la caché desde disco.
+        """
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path, 'r', encoding='utf-8') as index_file:
+            return json.load(index_file)
+
+    def key(self, source, variable, date):
+        """
+        Clave de un insumo en el índice.
+        """
+        return f"{source}/{variable}/{date.strftime('%Y%m%d')}"
+
+    def folder_for(self, source, variable):
+        """
+        Carpeta donde se guardan los archivos de una fuente y variable.
+        """
+        folder = os.path.join(self.cache_folder, source, variable)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def get(self, source, variable, date, checksum=None):
+        """
+        Devuelve la ruta del archivo en caché, o None si no existe, está incompleto o su checksum no coincide.
+        """
+        with self._lock:
+            entry = self.entries.get(self.key(source, variable, date))
+            if entry is None or not os.path.exists(entry['path']):
+                return None
+            if os.path.getsize(entry['path']) != entry['size']:
+                return None
+            if checksum is not None and entry.get('checksum') != checksum:
+                return None
+            entry['last_used'] = time.time()
+            self._changed.add(self.key(source, variable, date))
+            return entry['path']
+
+    def put(self, source, variable, date, file_path, checksum=None):
+        """
+        Registra un archivo en la caché. Si el archivo está fuera de la carpeta de la fuente y variable,
+        se mueve a ella. Devuelve la ruta final del archivo.
+        """
+        folder = self.folder_for(source, variable)
+        target = os.path.join(folder, os.path.basename(file_path))
+        if os.path.abspath(file_path) != os.path.abspath(target):
+            shutil.move(file_path, target)
+
+        now = time.time()
+        key = self.key(source, variable, date)
+        with self._lock:
+            self._changed.add(key)
+            self._removed.discard(key)
+            self.entries[key] = {
+                'path': target,
+                'size': os.path.getsize(target),
+                'checksum': checksum,
+                'created': now,
+                'last_used': now
+            }
+        return target
+
+    @staticmethod
+    def link(cached_path, target_path):
+        """
+        Enlaza (o copia si no es posible) un archivo de la caché en la carpeta de una ejecución.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(target_path)), exist_ok=True)
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        try:
+            os.link(cached_path, target_path)
+        except OSError:
+            shutil.copy2(cached_path, target_path)
+        return target_path
+
+    def evict(self):
+        """
+        Elimina los archivos más antiguos que max_age_days y, si la caché supera max_size_gb, los usados
+        hace más tiempo hasta quedar por debajo del límite. Devuelve el número de archivos eliminados.
+        """
+        removed = 0
+        with self._lock:
+            now = time.time()
+            by_last_use = sorted(self.entries.items(), key=lambda item: item[1]['last_used'])
+            total_size = sum(entry['size'] for _, entry in by_last_use)
+            max_size = self.max_size_gb * 1024 ** 3 if self.max_size_gb is not None else None
+
+            for key, entry in by_last_use:
+                too_old = self.max_age_days is not None and now - entry['last_used'] > self.max_age_days * 86400
+                too_big = max_size is not None and total_size > max_size
+                if not (too_old or too_big):
+                    continue
+                if os.path.exists(entry['path']):
+                    os.remove(entry['path'])
+                total_size -= entry['size']
+                del self.entries[key]
+                self._changed.discard(key)
+                self._removed.add(key)
+                removed += 1
+        return removed
+
+    def save(self):
+        """
+        Escribe el índice de la caché en disco de forma atómica. Sólo se aplican los cambios de esta instancia
+        sobre el índice actual, para no perder los de otras etapas que usan la caché al mismo tiempo (las
+        descargas de IMERG y MSWX corren en procesos distintos); el archivo temporal es propio de cada proceso.
+        """
+        os.makedirs(self.cache_folder, exist_ok=True)
+        # El bloqueo del archivo .lock hace que la lectura, la mezcla y el reemplazo del índice no se intercalen
+        # con los de otro proceso
+        with self._lock, open(f"{self.index_path}.lock", 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self.read_index()
+            for key in self._removed:
+                entries.pop(key, None)
+            for key in self._changed:
+                entries[key] = self.entries[key]
+            self.entries = entries
+            self._changed.clear()
+            self._removed.clear()
+            temp_path = os.path.join(self.cache_folder, f".{os.path.basename(self.index_path)}.{os.getpid()}.tmp")
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump(entries, index_file, indent=2)
+            os.replace(temp_path, self.index_path)
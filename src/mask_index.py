@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import xarray as xr
+
+"""
+Clase que carga una sola vez por proceso la máscara del país y recorta los datos con índices enteros
+"""
+
+
+class MaskIndex:
+    # Máscaras ya cargadas en este proceso, por ruta, tamaño y fecha de modificación
+    _loaded = {}
+
+    def __init__(self, lat, lon, values, source=None):
+        """
+        Inicializa el índice a partir de la grilla de la máscara.
+
+        Parámetros:
+        - lat, lon: Vectores de coordenadas de la máscara.
+        - values: Grilla (lat, lon) de la máscara; los píxeles del país tienen valor 1.
+        - source: Archivo de la máscara (sólo para los mensajes de error).
+        """
+        self.source = source
+        self.lat = np.asarray(lat)
+        self.lon = np.asarray(lon)
+        self.values = np.asarray(values)
+        self.inside = self.values == 1
+        if not self.inside.any():
+            raise ValueError("La máscara no tiene píxeles con valor 1")
+
+        # Filas y columnas con al menos un píxel del país (las que conserva where(mask == 1, drop=True))
+        self.rows = np.flatnonzero(self.inside.any(axis=1))
+        self.cols = np.flatnonzero(self.inside.any(axis=0))
+        self.lat_slice = slice(int(self.rows[0]), int(self.rows[-1]) + 1)
+        self.lon_slice = slice(int(self.cols[0]), int(self.cols[-1]) + 1)
+        # Índices planos (lat, lon) de los píxeles del país en la grilla de la máscara
+        self.pixels = np.flatnonzero(self.inside)
+
+    @classmethod
+    def load(cls, mask_file_path, variable='mask'):
+        """
+        Devuelve el índice de una máscara NetCDF, leyéndola sólo la primera vez en el proceso (o si el archivo cambió).
+        """
+        stat = os.stat(mask_file_path)
+        key = (os.path.abspath(mask_file_path), variable, stat.st_size, stat.st_mtime)
+        if key not in cls._loaded:
+            with xr.open_dataset(mask_file_path) as ds_mask:
+                mask = ds_mask[variable].transpose('lat', 'lon')
+                cls._loaded[key] = cls(ds_mask['lat'].values, ds_mask['lon'].values, mask.values, source=mask_file_path)
+        return cls._loaded[key]
+
+    @property
+    def bounds(self):
+        """
+        Coordenadas extremas (lat_min, lat_max, lon_min, lon_max) de los píxeles del país.
+        """
+        lats, lons = self.lat[self.rows], self.lon[self.cols]
+        return float(lats.min()), float(lats.max()), float(lons.min()), float(lons.max())
+
+    def window(self, lat_min, lat_max, lon_min, lon_max):
+        """
+        Slices (lat, lon) de la grilla de la máscara que cubren una caja de coordenadas.
+        """
+        rows = np.flatnonzero((self.lat >= lat_min) & (self.lat <= lat_max))
+        cols = np.flatnonzero((self.lon >= lon_min) & (self.lon <= lon_max))
+        if rows.size == 0 or cols.size == 0:
+            raise ValueError(f"La caja (lat {lat_min} a {lat_max}, lon {lon_min} a {lon_max}) no cubre ninguna "
+                             f"{'fila' if rows.size == 0 else 'columna'} de la máscara {self.source or ''}".rstrip())
+        return slice(int(rows.min()), int(rows.max()) + 1), slice(int(cols.min()), int(cols.max()) + 1)
+
+    @staticmethod
+    def match(values, targets):
+        """
+        Pares de posiciones (en values, en targets) de las coordenadas que están en ambos vectores, en el orden
+        de values. La comparación es exacta, como la alineación de xarray.
+        """
+        lookup = {value: position for position, value in enumerate(np.asarray(targets).tolist())}
+        pairs = [(position, lookup[value]) for position, value in enumerate(np.asarray(values).tolist()) if value in lookup]
+        pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def crop(self, ds, lat_dim='lat', lon_dim='lon'):
+        """
+        Recorta un Dataset o DataArray a los píxeles del país, con el mismo resultado que
+        ds.where(mask == 1, drop=True): primero se seleccionan con índices enteros las filas y columnas del
+        país (sólo se leen esas celdas si los datos no están cargados) y la máscara se aplica sobre esa ventana.
+        """
+        lat_positions, rows = self.match(ds[lat_dim].values, self.lat[self.rows])
+        lon_positions, cols = self.match(ds[lon_dim].values, self.lon[self.cols])
+        inside = self.inside[np.ix_(self.rows[rows], self.cols[cols])]
+
+        # Como where(drop=True), se quitan las filas y columnas sin píxeles del país en la grilla de los datos
+        keep_rows, keep_cols = inside.any(axis=1), inside.any(axis=0)
+        window = ds.isel({lat_dim: self.as_indexer(lat_positions[keep_rows]), lon_dim: self.as_indexer(lon_positions[keep_cols])})
+        return window.where(xr.DataArray(inside[np.ix_(keep_rows, keep_cols)], dims=(lat_dim, lon_dim)))
+
+    @staticmethod
+    def as_indexer(positions):
+        """
+        Usa un slice si las posiciones son consecutivas y si no un arreglo de enteros.
+        """
+        if positions.size and np.array_equal(positions, np.arange(positions[0], positions[-1] + 1)):
+            return slice(int(positions[0]), int(positions[-1]) + 1)
+        return positions
@@ -1,9 +1,35 @@
 from datetime import datetime, timedelta
 from imerg_data import IMERGData
 from mswx_data import MSWXData
+from sync_manifest import SyncManifest
+from input_cache import InputCache
+from domain import Domain
+from et0_store import ET0Store
+from mask_index import MaskIndex
+from data_sources import GoogleDriveSource, OpendapSource, LocalMirrorSource
+from stage_scheduler import StageScheduler
+from task_queue import FileBroker, LocalBroker, QueueExecutor
+from telemetry import Telemetry
 from tools import Tools
+from zarr_store import ZarrStore
 import os, sys
 
+
+def env_number(name, default=None, cast=int):
+    """
+    Lee una variable de entorno numérica; si no está definida devuelve default. Un valor que no es un número
+    no impide importar el módulo: se informa la variable y se usa default.
+    """
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        print(f"Valor inválido para {name}: '{value}' (se esperaba un número {'entero' if cast is int else 'decimal'}); se usa {default}")
+        return default
+
+
 class Master:
     #Today date for use in folders
     TODAY = datetime.now().date().strftime('%Y%m%d')
@@ -18,6 +44,68 @@ class Master:
     HONDURAS_SHP_PATH=""
     HONDURAS_REGIONS_PATH=""
     HONDURAS_MUNICIPALITIES_PATH=""
+    REGION_INDEX_FOLDER=""
+    #Google Drive folder with the MSWX variables and the variables used
+    MSWX_FOLDER_ID = "14no0Wkoat3guyvVnv-LccXOEoxQqDRy7"
+    MSWX_VARIABLES = {
+        "Tmax": "Tmax_variable_id",
+        "Tmin": "Tmin_variable_id",
+        "RelHum": "RelHum_variable_id",
+        "Wind": "Wind_variable_id",
+        "SWd": "SWd_variable_id",
+        "Temp": "Temp_variable_id"
+    }
+    #Input sources: drive/opendap (default) or mirror (pre-staged daily files in a local or shared folder)
+    MSWX_SOURCE = os.getenv('MSWX_SOURCE', 'drive')
+    MSWX_MIRROR_PATH = os.getenv('MSWX_MIRROR_PATH', '')
+    IMERG_SOURCE = os.getenv('IMERG_SOURCE', 'opendap')
+    IMERG_MIRROR_PATH = os.getenv('IMERG_MIRROR_PATH', '')
+    #Number of simultaneous MSWX downloads
+    MSWX_WORKERS = env_number('MSWX_WORKERS', MSWXData.WORKERS)
+    #Extra IMERG cells requested around the mask on each side
+    IMERG_PADDING = env_number('IMERG_PADDING', 2)
+    #Read only the window of the domain mask from the forecast GeoTIFFs (0 or 1) and extra GeoTIFF cells around it on each side
+    FORECAST_WINDOW = bool(env_number('FORECAST_WINDOW', 1))
+    FORECAST_PADDING = env_number('FORECAST_PADDING', 2)
+    #Number of simultaneous IMERG downloads
+    IMERG_WORKERS = env_number('IMERG_WORKERS', 4)
+    #Input cache eviction limits (unlimited when not set)
+    INPUT_CACHE_MAX_GB = env_number('INPUT_CACHE_MAX_GB', cast=float)
+    INPUT_CACHE_MAX_AGE_DAYS = env_number('INPUT_CACHE_MAX_AGE_DAYS', cast=float)
+    #Format of the municipalities table: csv or parquet
+    MUNICIPALITIES_TABLE_FORMAT = os.getenv('MUNICIPALITIES_TABLE_FORMAT', 'csv')
+    #Merge the daily files one day at a time (stream, default) or all together in memory (memory)
+    MERGE_STREAM = os.getenv('MERGE_MODE', 'stream') == 'stream'
+    #Storage profile of the NetCDF outputs: default, compressed or packed
+    NETCDF_PROFILE = os.getenv('NETCDF_PROFILE', 'default')
+    #Output backend: netcdf (default) or zarr (also updates a long-lived Zarr store, by default output/store.zarr)
+    OUTPUT_BACKEND = os.getenv('OUTPUT_BACKEND', 'netcdf')
+    ZARR_STORE_PATH = os.getenv('ZARR_STORE_PATH', '')
+    #Keep the ET0 of each day between runs (output/et0_store/) and only compute the new or changed days (0 or 1)
+    ET0_STORE = bool(env_number('ET0_STORE', 1))
+    #Days without use after which a day is removed from the ET0 store (default: kept forever)
+    ET0_STORE_MAX_AGE_DAYS = env_number('ET0_STORE_MAX_AGE_DAYS', cast=float)
+    #Number of stages run at the same time and how: process or queue (task queue shared by several nodes)
+    STAGE_WORKERS = env_number('ETL_STAGE_WORKERS', 4)
+    STAGE_EXECUTOR = os.getenv('ETL_STAGE_EXECUTOR', 'process')
+    #Number of processes that render the figures
+    PLOT_WORKERS = env_number('PLOT_WORKERS', 4)
+    #Save a cProfile dump of each stage in output/<TODAY>/profiles/ (0 or 1)
+    PROFILE_STAGES = bool(env_number('ETL_PROFILE', 0))
+    #Stages that download or compute the observed data (the rest are post data process)
+    DATA_STAGES = ('imerg_download', 'imerg', 'mswx_download', 'et0')
+    #JSON file with the domains (countries) processed in one run; by default only Honduras
+    DOMAINS_CONFIG = os.getenv('DOMAINS_CONFIG', '')
+    #Task queue broker (file or local), folder shared by the nodes (default workspace/queue/) and seconds without heartbeat before a task is requeued
+    QUEUE_BROKER = os.getenv('ETL_QUEUE_BROKER', 'file')
+    QUEUE_PATH = os.getenv('ETL_QUEUE_PATH', '')
+    QUEUE_LEASE_SECONDS = env_number('ETL_QUEUE_LEASE_SECONDS', 600.0, cast=float)
+    #Workers run by the coordinator itself (default 0 with the file broker and ETL_STAGE_WORKERS with the local broker)
+    QUEUE_LOCAL_WORKERS = env_number('ETL_QUEUE_LOCAL_WORKERS')
+    #Run the file broker without signing the tasks (0 or 1); otherwise ETL_QUEUE_KEY is required
+    QUEUE_UNSIGNED = bool(env_number('ETL_QUEUE_UNSIGNED', 0))
+    #Seconds after which the coordinator warns about tasks that no worker claimed
+    QUEUE_UNCLAIMED_SECONDS = env_number('ETL_QUEUE_UNCLAIMED_SECONDS', 60.0, cast=float)
 
 
     def __init__(self, central_date, workspace_path=None, path_shp_crop_honduras=None, 
@@ -25,6 +113,10 @@ class Master:
         """
         Inicializa la clase con los parametros del usuario, así como también la construcción de los diferentes directorios.
         """
+        # La configuración queda en la instancia para que las etapas que ejecutan otros nodos (cola de tareas)
+        # usen la del coordinador y no las variables de entorno ni la fecha del worker
+        self.__dict__.update({name: value for name, value in vars(Master).items() if name.isupper()})
+
         self.WORKSPACE = workspace_path if workspace_path is not None else "../workspace/"
         self.CONFIG_FOLDER = os.path.join(self.WORKSPACE, "config/")
         self.INPUTS_FOLDER = os.path.join(self.WORKSPACE, "input/")
@@ -33,6 +125,7 @@ class Master:
         self.INPUTS_FORECAST_DATA = path_forecast_files if path_forecast_files is not None else os.path.join(self.INPUTS_FOLDER, "forecast_data/")
         self.HONDURAS_SHP_PATH = path_shp_crop_honduras if path_shp_crop_honduras is not None else os.path.join(self.CONFIG_FOLDER, "mask_honduras/")
         self.HONDURAS_REGIONS_PATH = path_shp_crop_honduras_regions if path_shp_crop_honduras_regions is not None else os.path.join(self.HONDURAS_SHP_PATH, "regions_shapefile/")
+        self.REGION_INDEX_FOLDER = os.path.join(self.CONFIG_FOLDER, "region_index/")
         self.HONDURAS_MUNICIPALITIES_PATH = path_shp_crop_honduras_municipalities if path_shp_crop_honduras_municipalities is not None else os.path.join(self.HONDURAS_SHP_PATH, "municipalities_shapefile/")
 
         self.FIN_DATE = datetime.strptime(central_date, "%Y-%m-%d").date()
@@ -42,139 +135,313 @@ class Master:
         print("fecha de fin: ",self.FIN_DATE)
     
 
+    def output_path(self, relative_path):
+        """
+        Ruta de un archivo dentro de la carpeta de salidas de la ejecución.
+        """
+        return f"{self.OUTPUTS_FOLDER}{self.TODAY}/{relative_path}"
+
     """
     MSXW data process
     """
     def run_mswx_data_proccess(self, ini_date, fin_date):
-        tools = Tools()
-        print("Creando archivo credentials.json a partir de las variables de entorno...")
-        tools.create_gcc_json(f"{self.CONFIG_FOLDER}credentials.json")
-        credentials_file = os.path.join(f"{self.CONFIG_FOLDER}credentials.json")
-        folder_id = "14no0Wkoat3guyvVnv-LccXOEoxQqDRy7"  
-        
-        var_mswx = {
-            "Tmax": "Tmax_variable_id",
-            "Tmin": "Tmin_variable_id",
-            "RelHum": "RelHum_variable_id",
-            "Wind": "Wind_variable_id",
-            "SWd": "SWd_variable_id",
-            "Temp": "Temp_variable_id"
-        }
-
-        google_drive_mswx = MSWXData(credentials_file)
-        folders = google_drive_mswx.list_folders_in_folder(folder_id, var_mswx)
-
-        for folder in folders:
-            google_drive_mswx.list_files_in_daily_folder(folder['id'], ini_date, fin_date, os.path.join(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}"), folder['title'])
-
-        google_drive_mswx.calculate_et0(ini_date, fin_date, inputdatapath=os.path.join(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/MSWX/"), outputpath=os.path.join(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/"), mask_file_path=f'{self.HONDURAS_SHP_PATH}mask_mswx_hnd.nc4')
+        self.download_mswx_data(ini_date, fin_date)
+        self.calculate_mswx_et0(ini_date, fin_date)
+
+    def mswx_source(self):
+        """
+        Fuente de los archivos de MSWX según MSWX_SOURCE: 'drive' (Google Drive) o 'mirror' (MSWX_MIRROR_PATH).
+        """
+        if self.MSWX_SOURCE == 'mirror':
+            return LocalMirrorSource(self.MSWX_MIRROR_PATH, "{variable}/%Y%j.nc", variables=self.MSWX_VARIABLES)
+        if self.MSWX_SOURCE != 'drive':
+            raise ValueError(f"Fuente de MSWX no soportada: {self.MSWX_SOURCE}. Use 'drive' o 'mirror'.")
+        manifest = SyncManifest(os.path.join(self.INPUTS_DOWNLOADED_DATA, "mswx_manifest.json"))
+        return GoogleDriveSource(os.path.join(f"{self.CONFIG_FOLDER}credentials.json"), self.MSWX_FOLDER_ID, self.MSWX_VARIABLES,
+                                 self.input_cache(), manifest=manifest, workers=self.MSWX_WORKERS)
+
+    def download_mswx_data(self, ini_date, fin_date):
+        if self.MSWX_SOURCE == 'drive':
+            print("Creando archivo credentials.json a partir de las variables de entorno...")
+            Tools().create_gcc_json(f"{self.CONFIG_FOLDER}credentials.json")
+
+        files = self.mswx_source().fetch(ini_date, fin_date)
+
+        # ET0 lee directamente de la carpeta de la fuente; sólo Temp se enlaza en la carpeta de la ejecución
+        # porque translate_julian_dates renombra sus archivos
+        MSWXData().link_files([file for file in files if file['variable'] == 'Temp'], os.path.join(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}"))
+
+    def calculate_mswx_et0(self, ini_date, fin_date, domain=None):
+        domain = domain if domain is not None else self.domains()[0]
+        mswx = MSWXData()
+        store = ET0Store(os.path.join(self.OUTPUTS_FOLDER, "et0_store/", domain.folder), max_age_days=self.ET0_STORE_MAX_AGE_DAYS) if self.ET0_STORE else None
+        window = domain.et0_window if domain.et0_window is not None else MaskIndex.load(domain.mask).bounds
+        mswx.calculate_et0(ini_date, fin_date, inputdatapath=self.mswx_source().folder, outputpath=self.output_path(domain.output("MSWX/")), mask_file_path=domain.mask, profile=self.NETCDF_PROFILE, store=store,
+                           window=window, output_name=f"ET0_{domain.name}.nc")
 
     """
     IMERG data process
     """  
-    def run_imerg_data_process(self, ini_date, fin_date):
-        imerg_process = IMERGData()
-        try:
-            imerg_process.imerg(ini_date, fin_date, os.path.join(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/IMERG/"), os.path.join(f"{self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/"), mask_file_path=f'{self.HONDURAS_SHP_PATH}mask_mswx_hnd.nc4')
-        except:
-            print("Error al crear archivo IMERG_Honduras.nc de precipitación observada. Revisar si la descarga de IMERG fue correcta y se creó el archivo IMERG_Honduras.nc")
-        
+    def imerg_source(self):
+        """
+        Fuente de los archivos de IMERG según IMERG_SOURCE: 'opendap' (GES DISC) o 'mirror' (IMERG_MIRROR_PATH).
+        Con OPeNDAP se descarga una sola ventana que cubre las máscaras de todos los dominios.
+        """
+        if self.IMERG_SOURCE == 'mirror':
+            return LocalMirrorSource(self.IMERG_MIRROR_PATH, "IMERG_LATE%Y%m%d.nc", variables=['precipitation'])
+        if self.IMERG_SOURCE != 'opendap':
+            raise ValueError(f"Fuente de IMERG no soportada: {self.IMERG_SOURCE}. Use 'opendap' o 'mirror'.")
+        masks = [domain.mask for domain in self.domains()]
+        return OpendapSource(os.path.join(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/IMERG/"), masks[0] if len(masks) == 1 else masks,
+                             padding=self.IMERG_PADDING, workers=self.IMERG_WORKERS, cookie_file=os.path.join(self.CONFIG_FOLDER, "earthdata_cookies.json"),
+                             cache=self.input_cache())
+
+    def download_imerg_data(self, ini_date, fin_date):
+        self.imerg_source().fetch(ini_date, fin_date)
+
+    def run_imerg_data_process(self, ini_date, fin_date, domain=None):
+        domain = domain if domain is not None else self.domains()[0]
+        output_folder = self.output_path(domain.output("IMERG/"))
+        os.makedirs(output_folder, exist_ok=True)
+        IMERGData().merge_nc_files(ini_date, fin_date, self.imerg_source().folder, output_folder, domain.mask, stream=self.MERGE_STREAM, profile=self.NETCDF_PROFILE,
+                                   output_name=f"IMERG_{domain.name}.nc")
+
+    """
+    Domains
+    """
+    def domains(self):
+        """
+        Dominios del ETL: los de DOMAINS_CONFIG o, si no se indica, sólo Honduras con las rutas de los argumentos.
+        """
+        if self.DOMAINS_CONFIG:
+            return Domain.load(self.DOMAINS_CONFIG)
+        return [Domain("Honduras", f'{self.HONDURAS_SHP_PATH}mask_mswx_hnd.nc4', f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp",
+                       f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", forecast_folder=self.INPUTS_FORECAST_DATA,
+                       et0_window=(12.5, 16.5, -90, -83))]
+
+    """
+    Stages
+    """
+    def build_stages(self, ini_date, fin_date):
+        """
+        Declara las etapas del ETL y sus dependencias. Las descargas de IMERG y MSWX se hacen una sola vez
+        para todos los dominios y el resto de las etapas se repite por dominio; las etapas que no comparten
+        datos pueden ejecutarse al mismo tiempo.
+        """
+        tools = Tools()
+        scheduler = StageScheduler(workers=self.STAGE_WORKERS, executor=self.STAGE_EXECUTOR,
+                                   profile_folder=self.output_path("profiles/") if self.PROFILE_STAGES else None,
+                                   queue=self.task_queue() if self.STAGE_EXECUTOR == 'queue' else None)
+        temp_folder = f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/MSWX/Temp/"
+
+        # Descargas compartidas por todos los dominios
+        scheduler.add('imerg_download', self.download_imerg_data, ini_date, fin_date,
+                      error_message="Error al descargar los datos de IMERG. Revisar las credenciales de Earthdata y la conexión con GES DISC")
+        scheduler.add('mswx_download', self.download_mswx_data, ini_date, fin_date,
+                      error_message="Error al descargar los datos de MSWX. Verificar las credenciales de Google Drive")
+        scheduler.add('temp_dates', tools.translate_julian_dates, temp_folder, deps=['mswx_download'])
+
+        cubes = []
+        for domain in self.domains():
+            cubes += self.add_domain_stages(scheduler, tools, domain, ini_date, fin_date, temp_folder)
+
+        # Almacén Zarr con las series observadas y de pronóstico (un solo proceso escribe los metadatos consolidados)
+        if self.OUTPUT_BACKEND == 'zarr':
+            scheduler.add('zarr_store', self.update_zarr_store, [(group, file) for group, _, file in cubes], after=[stage for _, stage, _ in cubes],
+                          error_message="Error al actualizar el almacén Zarr. Verificar que zarr esté instalado y que las fechas sean continuas con las del almacén")
+        elif self.OUTPUT_BACKEND != 'netcdf':
+            raise ValueError(f"Backend de salida no soportado: {self.OUTPUT_BACKEND}. Use 'netcdf' o 'zarr'.")
+        return scheduler
+
+    def add_domain_stages(self, scheduler, tools, domain, ini_date, fin_date, temp_folder):
+        """
+        Agrega las etapas de un dominio: IMERG, ET0, temperatura, pronósticos, regiones, gráficos y tabla por
+        municipio. Devuelve los productos del dominio como tuplas (grupo del almacén Zarr, etapa, archivo).
+        """
+        name = domain.name
+        stage = domain.stage
+
+        def output(relative_path):
+            return self.output_path(domain.output(relative_path))
+
+        # Datos observados
+        scheduler.add(stage('imerg'), self.run_imerg_data_process, ini_date, fin_date, domain, deps=['imerg_download'],
+                      outputs=[output(f"IMERG/IMERG_{name}.nc")],
+                      error_message=f"Error al crear archivo IMERG_{name}.nc de precipitación observada. Revisar si la descarga de IMERG fue correcta y se creó el archivo IMERG_{name}.nc")
+        scheduler.add(stage('et0'), self.calculate_mswx_et0, ini_date, fin_date, domain, deps=['mswx_download'],
+                      outputs=[output(f"MSWX/ET0_{name}.nc")],
+                      error_message="Error al calcular ET0 con los datos de MSWX. Verificar la existencia de los archivos descargados")
+        scheduler.add(stage('temp_merge'), tools.merge_files, ini_date, fin_date, temp_folder, output("MSWX/Temp.nc"), "nc", "grados celcius", variable_name='air_temperature',
+                      stream=self.MERGE_STREAM, mask_file_path=domain.mask, profile=self.NETCDF_PROFILE,
+                      deps=['temp_dates'], outputs=[output("MSWX/Temp.nc")],
+                      error_message="Error al tratar de unir archivos .nc de /MSWX/Temp/. Verificar la existencia de los archivos")
+        scheduler.add(stage('temp_crop'), tools.country_crop, output("MSWX/Temp.nc"), domain.mask, output(f"MSWX/Temp_{name}.nc"), profile=self.NETCDF_PROFILE,
+                      deps=[stage('temp_merge')], outputs=[output(f"MSWX/Temp_{name}.nc")],
+                      error_message="Error al tratar de recortar el archivo /MSWX/Temp.nc. Verificar la existencia del archivo")
+
+        # Pronósticos (sólo si el dominio tiene carpeta de pronósticos)
+        forecasts = [
+            ('forecast_rain', "RAIN", f"forecast/RAIN_forecast_{name}.nc", "mm/day", 'precipitation'),
+            ('forecast_et0', "ET0", f"forecast/ET0_forecast_{name}.nc", "mm/day", 'ET0'),
+            ('forecast_t2', "T2", f"forecast/Temperature_forecast_{name}.nc", "grados celcius", 'air_temperature')
+        ] if domain.forecast_folder is not None else []
+        bounds = MaskIndex.load(domain.mask).bounds if forecasts and self.FORECAST_WINDOW else None
+        for forecast, folder, file, units, variable in forecasts:
+            scheduler.add(stage(forecast), tools.merge_files, ini_date, fin_date, f"{domain.forecast_folder}{folder}/{folder}_", output(file), "tif", units, variable_name=variable, stream=self.MERGE_STREAM, profile=self.NETCDF_PROFILE,
+                          bounds=bounds, padding=self.FORECAST_PADDING,
+                          outputs=[output(file)],
+                          error_message=f"Error al tratar de unir archivos .tif de {folder}/{folder}. Verificar la existencia de los archivos")
+
+        # Recorte por regiones de cada producto
+        prefix = name.lower()
+        products = [
+            ('et0', f"MSWX/ET0_{name}.nc", "ET0", f"figures/et0_{prefix}_observado_"),
+            ('imerg', f"IMERG/IMERG_{name}.nc", "precipitation", f"figures/precipitation_{prefix}_observado_"),
+            ('forecast_et0', f"forecast/ET0_forecast_{name}.nc", "ET0", f"figures/et0_{prefix}_forecast_"),
+            ('forecast_rain', f"forecast/RAIN_forecast_{name}.nc", "precipitation", f"figures/precipitation_{prefix}_forecast_"),
+            ('temp_crop', f"MSWX/Temp_{name}.nc", "air_temperature", f"figures/temperature_{prefix}_observado_"),
+            ('forecast_t2', f"forecast/Temperature_forecast_{name}.nc", "air_temperature", f"figures/temperature_{prefix}_forecast_")
+        ]
+        products = [product for product in products if stage(product[0]) in scheduler.stages]
+        plots = []
+        for product, file, variable, figure_prefix in products:
+            regions_file = file.replace(".nc", "_regions.nc")
+            scheduler.add(stage(f'regions_{product}'), tools.regions_crop, output(file), domain.regions_shapefile, output(regions_file), domain.region_column, index_folder=self.REGION_INDEX_FOLDER, profile=self.NETCDF_PROFILE,
+                          deps=[stage(product)], outputs=[output(regions_file)],
+                          error_message=f"Error al tratar de recortar las regiones en el archivo /{file}. Verificar la existencia del archivo")
+            plots.append((output(regions_file), variable, output(figure_prefix)))
+
+        # Gráficos por región de todos los productos en un solo lote; se generan los de los archivos que existan
+        regions_files = ", ".join(os.path.basename(file).replace(".nc", "_regions.nc") for _, file, _, _ in products)
+        scheduler.add(stage('plots'), self.plot_files, plots, output("figures/"), after=[stage(f'regions_{product}') for product, _, _, _ in products],
+                      error_message=f"Error al tratar de generar los gráficos. Verificar la existencia de los archivos de entrada ({regions_files})")
+
+        # Tabla por municipio
+        specs = [
+            (output(f"MSWX/Temp_{name}.nc"), "air_temperature", "avg", "air-temperature_obs_c_avg"),
+            (output(f"MSWX/Temp_{name}.nc"), "air_temperature", "avg", "air-temperature_for_c_avg"),
+            (output(f"MSWX/ET0_{name}.nc"), "ET0", "avg", "et0_obs_mm-day_avg"),
+            (output(f"forecast/ET0_forecast_{name}.nc"), "ET0", "avg", "et0_for_mm-day_avg"),
+            (output(f"IMERG/IMERG_{name}.nc"), "precipitation", "acc", "precipitation-cal_obs_mm-day_acc"),
+            (output(f"forecast/RAIN_forecast_{name}.nc"), "precipitation", "acc", "precipitation-cal_for_mm-day_acc")
+        ]
+        if domain.forecast_folder is None:
+            specs = [spec for spec in specs if "/forecast/" not in spec[0]]
+        table_file = output(f"daily_mean_municipalities.{self.MUNICIPALITIES_TABLE_FORMAT}")
+        scheduler.add(stage('municipalities'), tools.build_municipality_table, domain.municipalities_shapefile, specs, domain.municipality_region_column, domain.municipality_column,
+                      output_file=table_file, output_format=self.MUNICIPALITIES_TABLE_FORMAT, index_folder=self.REGION_INDEX_FOLDER,
+                      deps=[stage(product) for product in ('temp_crop', 'et0', 'forecast_et0', 'imerg', 'forecast_rain') if stage(product) in scheduler.stages], outputs=[table_file],
+                      error_message="Error al tratar de escribir el CSV de promedio diario por municipalidad. Verificar la existencia de los archivos de entrada")
+
+        # Productos del almacén Zarr: un grupo por producto (dentro de un grupo por dominio si hay varios)
+        return [(product if not domain.folder else f"{name}/{product}", stage(product), output(file)) for product, file, _, _ in products]
+
+    def plot_files(self, plots, figures_folder):
+        failed = Tools().plot_nc_files(plots, workers=self.PLOT_WORKERS)
+        print(f"Plot files save on: {figures_folder}")
+        if failed:
+            raise RuntimeError(f"No se pudieron graficar: {', '.join(failed)}")
+
+    def zarr_store_path(self):
+        return self.ZARR_STORE_PATH or os.path.join(self.OUTPUTS_FOLDER, "store.zarr")
+
+    def update_zarr_store(self, cubes):
+        """
+        Agrega al almacén Zarr los días nuevos o modificados de cada producto de la ejecución.
+        """
+        store = ZarrStore(self.zarr_store_path())
+        missing = []
+        for group, file in cubes:
+            if os.path.exists(file):
+                store.update(file, group)
+            else:
+                missing.append(file)
+        if missing:
+            raise FileNotFoundError(f"No se agregaron al almacén Zarr: {', '.join(missing)}")
+
+    def task_queue(self):
+        """
+        Cola de tareas de ETL_STAGE_EXECUTOR=queue: con el broker 'file' las tareas quedan en una carpeta
+        compartida y las ejecutan los workers de cualquier nodo (python worker.py); 'local' la ejecuta sólo
+        con los workers de este coordinador.
+        """
+        if self.QUEUE_BROKER == 'local':
+            broker = LocalBroker()
+        elif self.QUEUE_BROKER == 'file':
+            # La clave se lee del entorno y no se guarda en la instancia, que viaja en las tareas
+            broker = FileBroker(self.queue_path(), lease_seconds=self.QUEUE_LEASE_SECONDS, key=os.getenv('ETL_QUEUE_KEY'),
+                                allow_unsigned=self.QUEUE_UNSIGNED)
+        else:
+            raise ValueError(f"Broker de la cola no soportado: {self.QUEUE_BROKER}. Use 'file' o 'local'.")
+        local_workers = self.QUEUE_LOCAL_WORKERS
+        if local_workers is None:
+            local_workers = self.STAGE_WORKERS if self.QUEUE_BROKER == 'local' else 0
+        return QueueExecutor(broker, local_workers=local_workers, unclaimed_seconds=self.QUEUE_UNCLAIMED_SECONDS)
+
+    def queue_path(self):
+        return self.QUEUE_PATH or os.path.join(self.WORKSPACE, "queue/")
+
+    def run(self, ini_date, fin_date):
+        """
+        Ejecuta todas las etapas del ETL según sus dependencias y devuelve el estado de cada una.
+        """
+        return self.run_stages(ini_date, fin_date)
+
+    def run_stages(self, ini_date, fin_date, selected=None):
+        """
+        Ejecuta las etapas seleccionadas (por defecto todas) y escribe el reporte de rendimiento de la
+        ejecución en output/<TODAY>/run_report.json.
+        """
+        scheduler = self.build_stages(ini_date, fin_date)
+        with Telemetry.measure('run') as run_record:
+            status = scheduler.run(selected=selected)
+        run_record.pop('counters')
+        self.print_status({name: status[name] for name in (selected if selected is not None else status)})
+
+        records = [scheduler.records.get(name, {'stage': name, 'status': status[name]})
+                   for name in scheduler.stages if selected is None or name in selected]
+        Telemetry.write_report(self.output_path("run_report.json"), records, ini_date=ini_date, fin_date=fin_date,
+                               executor=self.STAGE_EXECUTOR, workers=self.STAGE_WORKERS, run=run_record)
+        print(f"Reporte de rendimiento guardado en: {self.output_path('run_report.json')}")
+        return status
+
+    def print_status(self, status):
+        failed = [name for name, state in status.items() if state != 'done']
+        if failed:
+            print("Etapas con errores u omitidas: " + ", ".join(f"{name} ({status[name]})" for name in failed))
+        else:
+            print("Todas las etapas terminaron correctamente.")
 
     """
     Post data process
     """
     def post_data_process(self, ini_date, fin_date):
-        try:
-            tools = Tools()
-            tools.translate_julian_dates(f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/MSWX/Temp/")
-        except Exception as e:
-               print(e)
-
-        try:
-            print("Merging forecast and observed temperature files...")
-            #tools.merge_files(datetime(2024, 11, 15).date(), datetime(2024, 11, 24).date(), f"{self.INPUTS_FORECAST_DATA}RAIN/RAIN_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras.nc", "tif", "mm/day",variable_name='precipitation')
-            #tools.merge_files(datetime(2024, 11, 15).date(), datetime(2024, 11, 24).date(), f"{self.INPUTS_FORECAST_DATA}ET0/ET0_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras.nc", "tif", "mm/day", variable_name='ET0')
-            #tools.merge_files(datetime(2024, 11, 15).date(), datetime(2024, 11, 24).date(), f"{self.INPUTS_FORECAST_DATA}T2/T2_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/Temperature_forecast_Honduras.nc", "tif", "grados celcius", variable_name='air_temperature')
-            tools.merge_files(ini_date, fin_date, f"{self.INPUTS_FORECAST_DATA}RAIN/RAIN_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras.nc", "tif", "mm/day",variable_name='precipitation')
-            tools.merge_files(ini_date, fin_date, f"{self.INPUTS_FORECAST_DATA}ET0/ET0_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras.nc", "tif", "mm/day", variable_name='ET0')
-            tools.merge_files(ini_date, fin_date, f"{self.INPUTS_FORECAST_DATA}T2/T2_", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/Temperature_forecast_Honduras.nc", "tif", "grados celcius", variable_name='air_temperature')
-            tools.merge_files(ini_date, fin_date, f"{self.INPUTS_DOWNLOADED_DATA}{self.TODAY}/MSWX/Temp/", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp.nc", "nc", "grados celcius", variable_name='air_temperature')
-            print(f"Merged files save on: {self.OUTPUTS_FOLDER}{self.TODAY}/forecast/")
-            print("Merging forecast and observed temperature files end.")
-
-        except Exception as e:
-                        print("Error al tratar de unir archivos .nc de RAIN/RAIN, ET0/ET0, T2/T2 o /MSWX/Temp/. Verificar la existencia de los archivos")
-                        print(e)
-
-        try:
-            print("Cropping observed Temp for Honduras...")
-            tools.country_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp.nc", f"{self.HONDURAS_SHP_PATH}mask_mswx_hnd.nc4", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras.nc")
-            print(f"Cropped Temp save on: {self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/")
-            print("Cropping observed Temp for Honduras end.")
-        except Exception as e:
-                        print("Error al tratar de recortar el archivo /MSWX/Temp.nc. Verificar la existencia del archivo")
-                        print(e)
-
-        try:
-            print("Cropping regions...")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/ET0_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/ET0_Honduras_regions.nc", "Nombre")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/IMERG_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/IMERG_Honduras_regions.nc", "Nombre")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras_regions.nc", "Nombre")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras_regions.nc", "Nombre")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras_regions.nc", "Nombre")
-            tools.regions_crop(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/Temperature_forecast_Honduras.nc", f"{self.HONDURAS_REGIONS_PATH}Regiones_productoras_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/Temperature_forecast_Honduras_regions.nc", "Nombre")
-            print(f"Cropped regions save on: {self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/")
-            print(f"Cropped regions save on: {self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/")
-            print(f"Cropped regions save on: {self.OUTPUTS_FOLDER}{self.TODAY}/forecast/")
-            print("Cropping regions end.")
-
-        except Exception as e:
-                        print("Error al tratar de recortar las regiones en los archivos /MSWX/ET0_Honduras.nc, /IMERG/IMERG_Honduras.nc, /forecast/ET0_forecast_Honduras.nc, /forecast/RAIN_forecast_Honduras.nc, /MSWX/Temp_Honduras.nc o /forecast/Temperature_forecast_Honduras.nc. Verificar la existencia de los archivos")
-                        print(e)
-
-        try:
-            print("Plotting files...")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras.nc", "air_temperature", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/temperature_honduras_observado_")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/IMERG_Honduras.nc", "precipitationCal", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/precipitation_honduras_observado_")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/ET0_Honduras.nc", "ET0", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/et0_honduras_observado_")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/Temperature_forecast_Honduras.nc", "air_temperature", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/temperature_honduras_forecast_")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras.nc", "ET0", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/et0_honduras_forecast_")
-            tools.plot_nc_file(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras.nc", "precipitation", save_path=f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/precipitation_honduras_forecast_")
-            print(f"Plot files save on: {self.OUTPUTS_FOLDER}{self.TODAY}/figures/")
-            print("Plotting files end.")
-        except Exception as e:
-                        print("Error al tratar de generar los gráficos. Verificar la existencia de los archivos de entrada (Temp_Honduras.nc, IMERG_Honduras.nc, ET0_Honduras.nc, Temperature_forecast_Honduras.nc, ET0_forecast_Honduras.nc, RAIN_forecast_Honduras.nc)")
-                        print(e)
-
-        try:
-            print("Writting CSV file for daily mean for municipalities...")
-            temp = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras.nc", "air_temperature", "NAME_1", "NAME_2", "c", "air-temperature_obs")
-            temp_forecast = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/Temp_Honduras.nc", "air_temperature", "NAME_1", "NAME_2", "c","air-temperature_for")
-            et0_mswx = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/MSWX/ET0_Honduras.nc", "ET0", "NAME_1", "NAME_2", "mm-day", "et0_obs")
-            et0_forecast = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/ET0_forecast_Honduras.nc", "ET0", "NAME_1", "NAME_2", "mm-day","et0_for")
-            prep_imerg = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/IMERG/IMERG_Honduras.nc", "precipitationCal", "NAME_1", "NAME_2", "mm-day", "precipitation-cal_obs")
-            prep_forecast = tools.calculate_daily_mean_per_municipality(f"{self.HONDURAS_MUNICIPALITIES_PATH}Municipios_reg_prod_HN.shp", f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/RAIN_forecast_Honduras.nc", "precipitation", "NAME_1", "NAME_2", "mm-day", "precipitation-cal_for")
-
-            merged_df = temp.merge(temp_forecast, on=["region", "municipio"])
-            merged_df = merged_df.merge(et0_mswx, on=["region", "municipio"])
-            merged_df = merged_df.merge(et0_forecast, on=["region", "municipio"])
-            merged_df = merged_df.merge(prep_imerg, on=["region", "municipio"])
-            merged_df = merged_df.merge(prep_forecast, on=["region", "municipio"])
-            merged_df.to_csv(f"{self.OUTPUTS_FOLDER}{self.TODAY}/daily_mean_municipalities.csv", index=False, encoding='utf-8-sig')
-            print(f"CSV file for daily mean for municipalities save on: {self.OUTPUTS_FOLDER}{self.TODAY}/daily_mean_municipalities.csv")
-            print("Writting CSV file for daily mean for municipalities end.")
-
-        except Exception as e:
-                        print("Error al tratar de escribir el CSV de promedio diario por municipalidad. Verificar la existencia de los archivos de entrada")
-                        print(e)
+        post_stages = [name for name in self.build_stages(ini_date, fin_date).stages if name.split('@')[0] not in self.DATA_STAGES]
+        return self.run_stages(ini_date, fin_date, selected=post_stages)
 
 
+    def input_cache(self):
+        """
+        Caché de insumos descargados compartida entre ejecuciones.
+        """
+        return InputCache(os.path.join(self.INPUTS_DOWNLOADED_DATA, "cache/"), max_size_gb=self.INPUT_CACHE_MAX_GB, max_age_days=self.INPUT_CACHE_MAX_AGE_DAYS)
+
+    def evict_input_cache(self):
+        """
+        Aplica la política de desalojo de la caché de insumos.
+        """
+        cache = self.input_cache()
+        removed = cache.evict()
+        cache.save()
+        if removed:
+            print(f"Se eliminaron {removed} archivos de la caché de insumos")
+
     def creates_folders(self):
-           #Creates output forecast and figures folders
-        if not os.path.exists(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/"):
-            os.makedirs(f"{self.OUTPUTS_FOLDER}{self.TODAY}/forecast/")
-        if not os.path.exists(f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/"):
-            os.makedirs(f"{self.OUTPUTS_FOLDER}{self.TODAY}/figures/")
+           #Creates output forecast and figures folders of every domain
+        for domain in self.domains():
+            for folder in ("forecast/", "figures/", "MSWX/"):
+                if not os.path.exists(self.output_path(domain.output(folder))):
+                    os.makedirs(self.output_path(domain.output(folder)))
 
 if __name__ == "__main__":
     variable = os.getenv('ETL_EXEC')
@@ -196,13 +463,6 @@ if __name__ == "__main__":
         main = Master(central_date, workspace_path, path_shp_crop_honduras, path_shp_crop_honduras_regions, path_shp_crop_honduras_municipalities, path_forecast_files)
         main.creates_folders()
 
-        print("IMERG data process begin...")
-        main.run_imerg_data_process(main.INI_DATE, main.FIN_DATE)
-        print("IMERG data process end.")
-
-        print("MSWX data process begin...")
-        main.run_mswx_data_proccess(main.INI_DATE, main.FIN_DATE)
-        print("MSWX data process end.")
-
-        main.post_data_process(main.INI_DATE, main.FIN_DATE)
+        main.run(main.INI_DATE, main.FIN_DATE)
+        main.evict_input_cache()
     
\ No newline at end of file
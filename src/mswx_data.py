@@ -1,7 +1,12 @@
 import os
-import math
+import random
+import threading
+import time
+import httplib2
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaIoBaseDownload
 from datetime import datetime, timedelta
 import netCDF4 as nc
@@ -9,6 +14,11 @@ import numpy as np
 from tqdm import tqdm
 import pandas as pd
 import xarray as xr
+from et0_engine import PenmanMonteith
+from input_cache import InputCache
+from mask_index import MaskIndex
+from storage_profile import StorageProfile
+from telemetry import Telemetry
 
 """
 Clase que usa Google Drive para la descarga de datos NRT de MSWX
@@ -16,219 +26,420 @@ Clase que usa Google Drive para la descarga de datos NRT de MSWX
 
 
 class MSWXData:
-    def __init__(self, credentials_file):
+    SCOPES = ['https://www.googleapis.com/auth/drive']
+    # Códigos HTTP de Google Drive que se consideran transitorios y se reintentan
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    # Campos pedidos al listar archivos en Drive
+    LIST_FIELDS = "nextPageToken, files(id, name, md5Checksum, size, modifiedTime)"
+    # Descargas simultáneas por defecto (MSWX_WORKERS en Master)
+    WORKERS = 6
+
+    def __init__(self, credentials_file=None, workers=None, max_retries=5, backoff=1.0, manifest=None, cache=None):
         """
         Inicializa la clase con las credenciales para Google Drive.
+
+        Parámetros:
+        - credentials_file: Ruta al archivo credentials.json (None para usar sólo el cálculo de ET0).
+        - workers: Número de descargas simultáneas (por defecto WORKERS).
+        - max_retries: Número máximo de reintentos ante errores 429/5xx o de conexión.
+        - backoff: Espera base en segundos del backoff exponencial.
+        - manifest: SyncManifest opcional para sincronizar de forma incremental.
+        - cache: InputCache opcional compartida entre ejecuciones; los archivos se descargan en ella.
         """
-        self.drive = self.authenticate_drive(credentials_file)
+        self.credentials_file = credentials_file
+        self.workers = workers if workers is not None else self.WORKERS
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.manifest = manifest
+        self.cache = cache
+        self.retries = 0
+        self._local = threading.local()
+        self._retries_lock = threading.Lock()
+        self.drive = self.authenticate_drive(credentials_file) if credentials_file is not None else None
 
     def authenticate_drive(self, credentials_file):
         """
         Autentica y construye el servicio de Google Drive.
         """
-        SCOPES = ['https://www.googleapis.com/auth/drive']
         credentials = service_account.Credentials.from_service_account_file(
-            credentials_file, scopes=SCOPES)
-        return build('drive', 'v3', credentials=credentials)
+            credentials_file, scopes=self.SCOPES)
+        return build('drive', 'v3', credentials=credentials, cache_discovery=False)
+
+    def thread_drive(self):
+        """
+        Devuelve un servicio de Google Drive propio del hilo actual, ya que el objeto de
+        googleapiclient no es seguro entre hilos.
+        """
+        if not hasattr(self._local, 'drive'):
+            self._local.drive = self.authenticate_drive(self.credentials_file)
+        return self._local.drive
+
+    def execute_with_retry(self, action, description):
+        """
+        Ejecuta action() reintentando con backoff exponencial ante errores transitorios de Google Drive.
+
+        Parámetros:
+        - action: Función sin argumentos que realiza la llamada a la API.
+        - description: Texto para identificar la operación en los mensajes.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return action()
+            except HttpError as e:
+                if e.resp.status not in self.RETRY_STATUS or attempt == self.max_retries:
+                    raise
+                reason = f"HTTP {e.resp.status}"
+            except (ConnectionError, TimeoutError, httplib2.HttpLib2Error) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(e).__name__
+            wait = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+            with self._retries_lock:
+                self.retries += 1
+            Telemetry.count('retries')
+            tqdm.write(f"Reintentando {description} en {wait:.1f} s ({reason}, intento {attempt + 1}/{self.max_retries})")
+            time.sleep(wait)
+
+    def list_all(self, query, description):
+        """
+        Lista todos los archivos que cumplen una consulta recorriendo todas las páginas (nextPageToken)
+        y pidiendo sólo los campos necesarios.
+        """
+        files = []
+        page_token = None
+        while True:
+            response = self.execute_with_retry(
+                lambda: self.drive.files().list(q=query, fields=self.LIST_FIELDS, pageSize=1000, pageToken=page_token,
+                                                supportsAllDrives=True, includeItemsFromAllDrives=True).execute(),
+                description)
+            files += response.get('files', [])
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return files
 
     def list_folders_in_folder(self, folder_id, var_mswx):
         """
-        Lista las carpetas dentro de una carpeta específica en Google Drive.
+        Lista las carpetas dentro de una carpeta específica en Google Drive. Si hay manifiesto,
+        los IDs de las carpetas se toman de su caché.
         """
+        if self.manifest is not None:
+            cached = [{'title': title, 'id': self.manifest.get_folder(folder_id, title)} for title in var_mswx.keys()]
+            if all(folder['id'] for folder in cached):
+                return cached
+
         query = f"'{folder_id}' in parents and mimeType = 'application/vnd.google-apps.folder' and trashed=false"
-        results = self.drive.files().list(q=query, supportsAllDrives=True,
-                                   includeItemsFromAllDrives=True).execute()
-        file_list = results.get('files', [])
+        file_list = self.list_all(query, f"listado de {folder_id}")
 
         folders = []
         for file in file_list:
             title = file['name']
             if title in var_mswx.keys():
                 folders.append({'title': title, 'id': file['id']})
+                if self.manifest is not None:
+                    self.manifest.set_folder(folder_id, title, file['id'])
 
         return folders
 
-    def list_files_in_daily_folder(self, folder_id, ini_date, fin_date, download_folder, folder_title):
+    def find_daily_folder(self, folder_id, folder_title):
         """
-        Lista los archivos dentro de la carpeta 'Daily' y los descarga si están dentro del rango de fechas.
+        Devuelve el ID de la carpeta 'Daily' de una variable (usando la caché del manifiesto si existe).
         """
+        if self.manifest is not None and self.manifest.get_folder(folder_id, 'Daily'):
+            return self.manifest.get_folder(folder_id, 'Daily')
+
         query = f"'{folder_id}' in parents and name = 'Daily' and trashed=false"
-        results = self.drive.files().list(q=query, supportsAllDrives=True,
-                                   includeItemsFromAllDrives=True).execute()
-        daily_folder = results.get('files', [])
+        daily_folder = self.list_all(query, f"carpeta Daily de {folder_title}")
 
-        if len(daily_folder) == 1:
-            daily_folder_id = daily_folder[0]['id']
-            print(
-                f"Archivos y carpetas dentro de la carpeta 'Daily' (ID: {daily_folder_id}):")
-
-            daily_files = self.drive.files().list(
-                q=f"'{daily_folder_id}' in parents and trashed=false",
-                supportsAllDrives=True, includeItemsFromAllDrives=True).execute().get('files', [])
-
-            base_download_dir = os.path.join(download_folder, 'MSWX')
-            if not os.path.exists(base_download_dir):
-                os.makedirs(base_download_dir)
-
-            date_range = [(ini_date + timedelta(days=i)).strftime('%Y%j')
-                           for i in range((fin_date - ini_date).days + 1)]
-            date_range.pop()
-
-            total_iterations = len(date_range)
-            bar_format = '{l_bar}{bar}| {n:.0f}/{total:.0f} [{elapsed}<{remaining}, {rate_fmt}]'
-
-            with tqdm(total=total_iterations, desc=f"Descargando datos de {folder_title} NRT de MSWX", bar_format=bar_format) as pbar:
-                for file in daily_files:
-                    file_date_str = file['name'][:7]
-                    if file_date_str in date_range and file['name'].endswith('.nc'):
-                        variable_name = file['name'].split('_')[0]
-                        variable_download_dir = os.path.join(
-                            base_download_dir, folder_title)
-                        if not os.path.exists(variable_download_dir):
-                            os.makedirs(variable_download_dir)
-
-                        self.download_file(
-                            file['id'], file['name'], variable_download_dir)
-                        pbar.update(1)
-        else:
+        if len(daily_folder) != 1:
+            return None
+        if self.manifest is not None:
+            self.manifest.set_folder(folder_id, 'Daily', daily_folder[0]['id'])
+        return daily_folder[0]['id']
+
+    def list_daily_files(self, folder_id, ini_date, fin_date, download_folder, folder_title, retry=True):
+        """
+        Lista los archivos dentro de la carpeta 'Daily' que están dentro del rango de fechas y devuelve
+        las descargas como diccionarios con 'id', 'name', 'folder', 'variable' y los metadatos de Drive en 'file'.
+        Si la carpeta del manifiesto ya no existe se vuelve a resolver una sola vez (retry).
+        """
+        daily_folder_id = self.find_daily_folder(folder_id, folder_title)
+        if daily_folder_id is None:
             print(
                 f"No se encontró la carpeta 'Daily' dentro de la carpeta con ID: {folder_id}")
+            return []
+
+        print(
+            f"Archivos y carpetas dentro de la carpeta 'Daily' (ID: {daily_folder_id}):")
+
+        date_range = [(ini_date + timedelta(days=i)).strftime('%Y%j')
+                      for i in range((fin_date - ini_date).days + 1)]
+        date_range.pop()
+
+        # Los nombres empiezan por el año, así que se filtra por prefijo en el servidor
+        years = sorted({date[:4] for date in date_range})
+        names_query = " or ".join(f"name contains '{year}'" for year in years)
+        query = f"'{daily_folder_id}' in parents and ({names_query}) and trashed=false"
+        try:
+            daily_files = self.list_all(query, f"archivos diarios de {folder_title}")
+        except HttpError as e:
+            if e.resp.status != 404 or self.manifest is None or not retry:
+                raise
+            # La carpeta en caché ya no existe: se vuelve a resolver una vez; si sigue sin existir (o no hay
+            # permisos) se informa el error original
+            self.manifest.forget_folder(folder_id, 'Daily')
+            try:
+                return self.list_daily_files(folder_id, ini_date, fin_date, download_folder, folder_title, retry=False)
+            except HttpError as retry_error:
+                if retry_error.resp.status == 404:
+                    raise e
+                raise
+
+        variable_download_dir = os.path.join(download_folder, 'MSWX', folder_title)
+        os.makedirs(variable_download_dir, exist_ok=True)
+
+        tasks = []
+        for file in daily_files:
+            file_date_str = file['name'][:7]
+            if file_date_str in date_range and file['name'].endswith('.nc'):
+                tasks.append({'id': file['id'], 'name': file['name'], 'folder': variable_download_dir,
+                              'variable': folder_title, 'file': file})
+        return tasks
+
+    def list_files_in_daily_folder(self, folder_id, ini_date, fin_date, download_folder, folder_title):
+        """
+        Lista los archivos dentro de la carpeta 'Daily' y los descarga si están dentro del rango de fechas.
+        """
+        tasks = self.list_daily_files(folder_id, ini_date, fin_date, download_folder, folder_title)
+        return self.sync_files(tasks, desc=f"Descargando datos de {folder_title} NRT de MSWX")
+
+    def sync_files(self, tasks, desc="Descargando datos NRT de MSWX"):
+        """
+        Descarga sólo los archivos nuevos o modificados según el manifiesto y la caché de insumos (todos si no
+        hay ninguno de los dos) y registra en ellos las versiones descargadas. Devuelve la lista de archivos que fallaron.
+        """
+        pending = [task for task in tasks if self.needs_download(task)]
+        print(f"{len(tasks) - len(pending)} archivos de MSWX ya sincronizados, {len(pending)} por descargar")
+
+        def record(task):
+            path = os.path.join(task['folder'], task['name'])
+            if self.manifest is not None:
+                self.manifest.record(task['variable'], task['file'], path)
+            if self.cache is not None:
+                self.cache.put('MSWX', task['variable'], self.file_date(task['name']), path,
+                               checksum=task['file'].get('md5Checksum'))
+
+        try:
+            return self.download_files(pending, desc=desc, on_done=record)
+        finally:
+            if self.manifest is not None:
+                self.manifest.save()
+            if self.cache is not None:
+                self.cache.save()
+
+    def needs_download(self, task):
+        """
+        Indica si un archivo listado en Drive debe descargarse.
+        """
+        if self.manifest is None and self.cache is None:
+            return True
+        if self.manifest is not None and self.manifest.needs_download(task['variable'], task['file'], os.path.join(task['folder'], task['name'])):
+            return True
+        return self.cache is not None and self.cache.get('MSWX', task['variable'], self.file_date(task['name']),
+                                                         checksum=task['file'].get('md5Checksum')) is None
+
+    def file_date(self, file_name):
+        """
+        Fecha de un archivo diario de MSWX a partir de su nombre (YYYYjjj.nc).
+        """
+        return datetime.strptime(file_name[:7], '%Y%j').date()
+
+    def link_files(self, tasks, run_folder):
+        """
+        Enlaza (o copia si no es posible) los archivos sincronizados en la carpeta de la ejecución,
+        con la estructura run_folder/MSWX/<variable>/<archivo>.
+        """
+        for task in tasks:
+            source = os.path.join(task['folder'], task['name'])
+            if not os.path.exists(source):
+                continue
+            InputCache.link(source, os.path.join(run_folder, 'MSWX', task['variable'], task['name']))
+
+    def download_files(self, tasks, desc="Descargando datos NRT de MSWX", on_done=None):
+        """
+        Descarga en paralelo una lista de archivos con una sola barra de progreso. Un error en un archivo
+        no detiene el resto; se devuelve la lista de archivos que no se pudieron descargar.
+
+        Parámetros:
+        - tasks: Lista de diccionarios con 'id', 'name' y 'folder' (devueltos por list_daily_files).
+        - desc: Descripción de la barra de progreso.
+        - on_done: Función opcional que se llama (en el hilo principal) con cada tarea descargada.
+        """
+        failed = []
+        bar_format = '{l_bar}{bar}| {n:.0f}/{total:.0f} [{elapsed}<{remaining}, {rate_fmt}]'
+
+        with tqdm(total=len(tasks), desc=desc, bar_format=bar_format) as pbar:
+            with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+                futures = {executor.submit(self.download_file, task['id'], task['name'], task['folder']): task
+                           for task in tasks}
+                for future in as_completed(futures):
+                    task = futures[future]
+                    try:
+                        future.result()
+                        if on_done is not None:
+                            on_done(task)
+                    except Exception as e:
+                        tqdm.write(f"Error al descargar {task['name']} en {task['folder']}: {e}")
+                        failed.append(task)
+                    pbar.update(1)
+        return failed
 
     def download_file(self, file_id, file_name, download_folder_path):
         """
-        Descarga un archivo de Google Drive.
+        Descarga un archivo de Google Drive usando el servicio del hilo actual. El archivo se escribe
+        primero como .part y se renombra al terminar, para no dejar archivos incompletos.
         """
-        request = self.drive.files().get_media(fileId=file_id)
         file_path = os.path.join(download_folder_path, file_name)
-        with open(file_path, 'wb') as file:
-            downloader = MediaIoBaseDownload(file, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
-                # if status:
-                   # print(f"Descargado {int(status.progress() * 100)}%.")
-        # print(f"Descargado archivo: {file_name}")
+        partial_path = file_path + '.part'
+
+        def download():
+            request = self.thread_drive().files().get_media(fileId=file_id)
+            with open(partial_path, 'wb') as file:
+                downloader = MediaIoBaseDownload(file, request)
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+
+        self.execute_with_retry(download, file_name)
+        os.replace(partial_path, file_path)
+        Telemetry.count('files_downloaded')
+        Telemetry.count('bytes_downloaded', os.path.getsize(file_path))
+
+    # Variables de MSWX que se leen para el cálculo de ET0: carpeta -> nombre de la variable en el archivo
+    ET0_VARIABLES = {
+        "Tmax": "air_temperature",
+        "Tmin": "air_temperature",
+        "RelHum": "relative_humidity",
+        "Wind": "wind_speed",
+        "SWd": "downward_shortwave_radiation"
+    }
+
+    def read_window(self, inputdatapath, t, lat_slice, lon_slice):
+        """
+        Lee sólo la ventana (lat_slice, lon_slice) del primer tiempo de los cinco archivos de MSWX de un día.
+        Los archivos se cierran al terminar la lectura.
+        """
+        window = {}
+        for (folder, variable), file_path in zip(self.ET0_VARIABLES.items(), self.input_files(inputdatapath, t)):
+            with nc.Dataset(file_path) as dataset:
+                window[folder] = dataset.variables[variable][0, lat_slice, lon_slice]
+            Telemetry.count_read(file_path, nbytes=window[folder].nbytes)
+        return window
+
+    def input_files(self, inputdatapath, t):
+        """
+        Rutas de los archivos de MSWX que usa el cálculo de ET0 de un día (t en formato %Y%j).
+        """
+        return [inputdatapath + folder + "/" + str(int(t)) + ".nc" for folder in self.ET0_VARIABLES]
 
-    def calculate_et0(self, ini_date, fin_date, inputdatapath, outputpath, mask_file_path, pressure=101.325):
+    def calculate_et0(self, ini_date, fin_date, inputdatapath, outputpath, mask_file_path, pressure=101.325, float32=False, profile=None, store=None,
+                      window=None, output_name="ET0_Honduras.nc"):
         """
         Calcula la evapotranspiración (ET0) utilizando el método de Penman-Monteith para los últimos 10 días.
+        El cálculo se hace sobre toda la grilla a la vez con PenmanMonteith; float32=True reduce la precisión a float32.
+        De cada archivo se lee sólo la ventana del dominio y los archivos del día siguiente se leen en segundo
+        plano mientras se calcula el día actual. El archivo se guarda con el perfil de almacenamiento profile
+        (ver StorageProfile).
+
+        Con store (un ET0Store) sólo se calculan los días que no están en el almacén o cuyos archivos de
+        entrada cambiaron; el resto de la ventana se toma del almacén.
+
+        window es la caja (lat_min, lat_max, lon_min, lon_max) del cálculo (por defecto la de Honduras) y
+        output_name el nombre del archivo de salida en outputpath.
         """
         date_range = pd.date_range(start=ini_date, end=fin_date - timedelta(days=1))
-        dates_list = [date.strftime('%Y%j') for date in date_range]
-        doy_list = [int(date.strftime('%j')) for date in date_range]
 
         os.makedirs(outputpath, exist_ok=True)
 
-        # Archivo de máscara de Honduras
-        mask_file = mask_file_path
-        nc_file = nc.Dataset(mask_file)
-        lat = nc_file.variables["lat"][:]
-        lon = nc_file.variables["lon"][:]
-        mask = nc_file.variables["mask"][:]
-
-        # Inicializa una lista para almacenar los datos de ET0 con dimensión temporal
-        ET0_list = []
+        lat_min, lat_max, lon_min, lon_max = window if window is not None else (12.5, 16.5, -90, -83)
+
+        # Máscara del país (se lee una sola vez por proceso); la ventana del dominio se calcula una sola vez
+        mask_index = MaskIndex.load(mask_file_path)
+        lat, lon = mask_index.lat, mask_index.lon
+        lat_slice, lon_slice = mask_index.window(lat_min, lat_max, lon_min, lon_max)
+        mask = mask_index.values[lat_slice, lon_slice]
+
+        engine = PenmanMonteith(pressure=pressure, float32=float32)
+
+        # ET0 de cada día calculado o tomado del almacén
+        ET0_days = {}
+        signatures = {}
+        pending = list(date_range)
+        if store is not None:
+            settings = {'pressure': pressure, 'float32': float32, 'mask': store.checksum(mask_file_path),
+                        'lat': [int(lat_slice.start), int(lat_slice.stop)], 'lon': [int(lon_slice.start), int(lon_slice.stop)]}
+            pending = []
+            for date in date_range:
+                try:
+                    signatures[date] = store.signature(self.input_files(inputdatapath, date.strftime('%Y%j')), settings)
+                except FileNotFoundError as e:
+                    print(f"Error: No se encontró el archivo {e.filename}. No se podrá calcular para {date.strftime('%Y%j')}")
+                    print(f"Consulte https://www.gloh2o.org/mswx/ para validar los datos")
+                    continue
+                stored = store.get(date, signatures[date])
+                if stored is None:
+                    pending.append(date)
+                else:
+                    ET0_days[date] = stored
+            print(f"ET0: {len(ET0_days)} días tomados del almacén, {len(pending)} días por calcular")
+            Telemetry.count('et0_days_stored', len(ET0_days))
 
         print('Leyendo datos de entrada para cálculo de ET0...')
-        total_iterations = len(dates_list) * len(lat)
+        total_iterations = len(pending)
         bar_format = '{l_bar}{bar}| {n:.0f}/{total:.0f} [{elapsed}<{remaining}, {rate_fmt}]'
-        with tqdm(total=total_iterations, desc=f"Calculando ET0", bar_format=bar_format) as pbar:
-            for t in dates_list:
+        with tqdm(total=total_iterations, desc=f"Calculando ET0", bar_format=bar_format) as pbar, \
+                ThreadPoolExecutor(max_workers=1) as reader:
+            def prefetch(date):
+                return reader.submit(self.read_window, inputdatapath, date.strftime('%Y%j'), lat_slice, lon_slice)
+
+            next_window = prefetch(pending[0]) if len(pending) else None
+            for k, date in enumerate(pending):
+                t = date.strftime('%Y%j')
+                current_window = next_window
+                next_window = prefetch(pending[k + 1]) if k + 1 < len(pending) else None
                 try:
-                    tmax_file = nc.Dataset(inputdatapath + "Tmax/" + str(int(t)) + ".nc")
-                    tmax = tmax_file.variables["air_temperature"][:]
-                    tmax = tmax[0, :, :]
-
-                    tmin_file = nc.Dataset(inputdatapath + "Tmin/" + str(int(t)) + ".nc")
-                    tmin = tmin_file.variables["air_temperature"][:]
-                    tmin = tmin[0, :, :]
-
-                    temperature = (tmax + tmin) / 2
-
-                    rh_file = nc.Dataset(inputdatapath + "RelHum/" + str(int(t)) + ".nc")
-                    humidity = rh_file.variables["relative_humidity"][:]
-                    humidity = humidity[0, :, :]
-
-                    wind_file = nc.Dataset(inputdatapath + "Wind/" + str(int(t)) + ".nc")
-                    wind_speed = wind_file.variables["wind_speed"][:]
-                    wind_speed = wind_speed[0, :, :]
-
-                    swd_file = nc.Dataset(inputdatapath + "SWd/" + str(int(t)) + ".nc")
-                    solar_radiation = swd_file.variables["downward_shortwave_radiation"][:]
-                    solar_radiation = solar_radiation[0, :, :]
+                    window = current_window.result()
                 except FileNotFoundError as e:
                     print(f"Error: No se encontró el archivo {e.filename}. No se podrá calcular para {t}")
                     print(f"Consulte https://www.gloh2o.org/mswx/ para validar los datos")
-                    continue
-
-
-                rows = np.size(lat)
-                cols = np.size(lon)
-                myET0 = np.empty((rows, cols))
-                myET0[:] = np.nan
-
-                doy = doy_list.pop(0)
-
-                for i in range(len(lat)):
-                    for j in range(len(lon)):
-                        if mask[i, j] == 1:
-                            mytas = temperature[i, j]
-                            myrh = humidity[i, j]
-                            myws = wind_speed[i, j]
-                            mysr = solar_radiation[i, j] * 0.0864
-
-                            es = 0.6108 * math.exp(17.27 * mytas / (mytas + 237.3))
-                            ea = (myrh / 100) * es
-
-                            delta = 4098 * es / (mytas + 237.3) ** 2
-                            gamma = 0.665 * 10 ** (-3) * pressure / 0.622
-
-                            latitude = lat[i]
-
-                            dr = 1 + 0.033 * math.cos(2 * math.pi / 365 * doy)
-                            delta_s = 0.409 * math.sin(2 * math.pi / 365 * doy - 1.39)
-                            omega_s = math.acos(-math.tan(latitude * math.pi / 180) * math.tan(delta_s))
-                            Ra = (24 * 60 / math.pi) * 0.082 * dr * (omega_s * math.sin(latitude * math.pi / 180) * math.sin(
-                                delta_s) + math.cos(latitude * math.pi / 180) * math.cos(delta_s) * math.sin(omega_s))
-
-                            Rns = 0.77 * mysr
-                            Rnl = 4.903 * 10 ** (-9) * ((mytas + 273.16) ** 4) * (
-                                0.34 - 0.14 * math.sqrt(ea)) * (1.35 * (mysr / Ra) - 0.35)
-
-                            Rn = Rns - Rnl
-                            G = 0
-
-                            ET0 = (0.408 * delta * (Rn - G) + gamma * (900 / (mytas + 273))
-                                * myws * (es - ea)) / (delta + gamma * (1 + 0.34 * myws))
-
-                            myET0[i][j] = ET0
                     pbar.update(1)
+                    continue
 
-                lat_min = 12.5
-                lat_max = 16.5
-                lon_min = -90
-                lon_max = -83
+                region_data = engine.et0_grid(window["Tmax"], window["Tmin"], window["RelHum"], window["Wind"],
+                                              window["SWd"], lat[lat_slice], date.dayofyear, mask)
+                ET0_days[date] = region_data
+                if store is not None:
+                    store.put(date, region_data, signatures[date])
+                Telemetry.count('et0_days_computed')
+                pbar.update(1)
 
-                lon_indices = np.nonzero((lon >= lon_min) & (lon <= lon_max))[0]
-                lat_indices = np.nonzero((lat >= lat_min) & (lat <= lat_max))[0]
-                myET0 = np.array(myET0)
-                region_data = myET0[np.ix_(lat_indices, lon_indices)]
-                ET0_list.append(region_data)
+        if store is not None:
+            removed = store.evict()
+            if removed:
+                print(f"Se eliminaron {removed} días del almacén de ET0")
+            store.save()
 
         # Convertir la lista de ET0 a un array numpy con una dimensión de tiempo
-        ET0_array = np.array(ET0_list)
-
-        # Ajustar date_range para que coincida con los datos disponibles
-        valid_date_range = date_range[:len(ET0_array)]
+        valid_dates = sorted(ET0_days)
+        ET0_array = np.array([ET0_days[date] for date in valid_dates])
 
         # Crear un DataArray de xarray
         ET0_da = xr.DataArray(
             ET0_array,
             dims=['time', 'lat', 'lon'],
             coords={
-                'time': valid_date_range,
-                'lat': lat[lat_indices],
-                'lon': lon[lon_indices]
+                'time': pd.DatetimeIndex(valid_dates),
+                'lat': lat[lat_slice],
+                'lon': lon[lon_slice]
             },
             name='ET0'
         )
@@ -249,8 +460,9 @@ class MSWXData:
         ds.attrs['created'] = datetime.now().strftime('%Y-%m-%d')
 
         # Guardar el Dataset a un archivo .nc
-        output_file = os.path.join(outputpath, "ET0_Honduras.nc")
-        ds.to_netcdf(output_file, mode='w', format='NETCDF4')
+        output_file = os.path.join(outputpath, output_name)
+        StorageProfile.get(profile).to_netcdf(ds, output_file, mode='w', format='NETCDF4')
+        Telemetry.count_written(output_file)
         print("ETC save on: ", outputpath)
         
 
@@ -0,0 +1,125 @@
+import numpy as np
+import xarray as xr
+from region_index import RegionIndex
+
+"""
+Clase que lee y escribe los archivos por región (*_regions.nc) en formato compacto: una sola grilla con los
+datos y el índice de píxeles de cada región, en lugar de una copia de la grilla por región
+"""
+
+
+class RegionFile:
+    # Valor del atributo region_layout de los archivos compactos
+    LAYOUT = 'pixel_index'
+
+    def __init__(self, dataset, lat_dim='lat', lon_dim='lon'):
+        """
+        Inicializa el lector a partir de un Dataset ya abierto (ver RegionFile.open).
+
+        Parámetros:
+        - dataset: Dataset con las variables de datos y las coordenadas region, region_indptr y region_pixels.
+        - lat_dim, lon_dim: Dimensiones de la grilla a la que se refieren los índices de píxeles.
+        """
+        self.dataset = dataset
+        self.lat_dim = lat_dim
+        self.lon_dim = lon_dim
+        indices = dataset['region_pixels'].values
+        self.index = RegionIndex([str(name) for name in dataset['region'].values], dataset['region_indptr'].values,
+                                 indices, np.ones(indices.size), (dataset.sizes[lat_dim], dataset.sizes[lon_dim]))
+
+    @classmethod
+    def open(cls, file_path, **kwargs):
+        """
+        Abre un archivo por región compacto; kwargs se pasan a xr.open_dataset.
+        """
+        dataset = xr.open_dataset(file_path, **kwargs)
+        lat_dim, lon_dim = dataset.attrs.get('region_grid', 'lat lon').split()
+        return cls(dataset, lat_dim, lon_dim)
+
+    @classmethod
+    def is_compact(cls, dataset):
+        return dataset.attrs.get('region_layout') == cls.LAYOUT
+
+    @classmethod
+    def build(cls, data, index, lat_dim='lat', lon_dim='lon'):
+        """
+        Construye el Dataset compacto de una variable: los datos quedan en su grilla, con NaN fuera de todas
+        las regiones, y los píxeles de cada región se guardan en formato CSR (region_indptr, region_pixels).
+        Las regiones pueden superponerse.
+
+        Parámetros:
+        - data: DataArray con las dimensiones lat_dim y lon_dim.
+        - index: RegionIndex de las regiones sobre esa grilla.
+        """
+        covered = np.zeros(index.shape[0] * index.shape[1], dtype=bool)
+        covered[index.indices] = True
+        covered = xr.DataArray(covered.reshape(index.shape), dims=(lat_dim, lon_dim))
+
+        ds = data.where(covered).to_dataset()
+        ds = ds.assign_coords(region=index.names,
+                              region_indptr=('region_edge', index.indptr),
+                              region_pixels=('region_pixel', index.indices))
+        ds['region_pixels'].attrs['long_name'] = f'Índice plano ({lat_dim}, {lon_dim}) de los píxeles de cada región'
+        ds['region_indptr'].attrs['long_name'] = 'Los píxeles de la región k son region_pixels[region_indptr[k]:region_indptr[k + 1]]'
+        ds.attrs['region_layout'] = cls.LAYOUT
+        ds.attrs['region_grid'] = f'{lat_dim} {lon_dim}'
+        return ds
+
+    @property
+    def names(self):
+        return self.index.names
+
+    def position(self, region):
+        return self.names.index(region) if isinstance(region, str) else int(region)
+
+    def region(self, variable_name, region):
+        """
+        Vista de una región como en el formato anterior: la grilla completa con NaN fuera de la región.
+
+        Parámetros:
+        - variable_name: Variable a leer.
+        - region: Nombre o posición de la región.
+        """
+        position = self.position(region)
+        mask = np.zeros(self.index.shape[0] * self.index.shape[1], dtype=bool)
+        mask[self.index.indices[self.index.indptr[position]:self.index.indptr[position + 1]]] = True
+        mask = xr.DataArray(mask.reshape(self.index.shape), dims=(self.lat_dim, self.lon_dim))
+        return self.dataset[variable_name].where(mask).assign_coords(region=self.names[position])
+
+    def dense(self, variable_name):
+        """
+        Variable con la dimensión 'region' del formato anterior (región x grilla). Ocupa región veces la
+        memoria de la variable; para estadísticas por región usar statistics.
+        """
+        masks = xr.DataArray(self.index.masks(), dims=('region', self.lat_dim, self.lon_dim), coords={'region': self.names})
+        data = self.dataset[variable_name]
+        return data.where(masks).transpose('region', *data.dims)
+
+    def statistics(self, variable_name):
+        """
+        Promedio y desviación estándar espacial (ddof=0, sin contar los NaN) de cada región, con sólo los
+        píxeles de la región. Devuelve dos arreglos (región, ...) con las demás dimensiones de la variable
+        en su orden (por ejemplo (región, tiempo)).
+        """
+        data = self.dataset[variable_name]
+        other = [dim for dim in data.dims if dim not in (self.lat_dim, self.lon_dim)]
+        values = data.transpose(*other, self.lat_dim, self.lon_dim).values.astype(np.float64)
+        gathered = values.reshape(values.shape[:-2] + (-1,))[..., self.index.indices]
+
+        valid = ~np.isnan(gathered)
+        count = self.index.segment_sum(valid.astype(np.float64))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.index.segment_sum(np.where(valid, gathered, 0)) / count
+            sizes = np.diff(self.index.indptr)
+            deviation = np.where(valid, gathered - np.repeat(np.nan_to_num(mean), sizes, axis=-1), 0)
+            std = np.sqrt(self.index.segment_sum(deviation ** 2) / count)
+        return np.moveaxis(mean, -1, 0), np.moveaxis(std, -1, 0)
+
+    def close(self):
+        self.dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,226 @@
+import os
+import glob
+import hashlib
+import uuid
+import numpy as np
+import geopandas as gpd
+import shapely
+from affine import Affine
+from rasterio import features
+
+"""
+Clase que guarda qué píxeles de una grilla pertenecen a cada polígono de un shapefile
+"""
+
+
+class RegionIndex:
+    # Índices ya cargados en este proceso, por clave
+    _loaded = {}
+
+    def __init__(self, names, indptr, indices, weights, shape):
+        """
+        Inicializa el índice en formato CSR: los píxeles (índices planos de la grilla) de la región k son
+        indices[indptr[k]:indptr[k + 1]], con sus pesos en weights.
+
+        Parámetros:
+        - names: Nombres de las regiones.
+        - indptr, indices, weights: Arreglos CSR de píxeles y pesos por región.
+        - shape: Forma (lat, lon) de la grilla.
+        """
+        self.names = list(names)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.shape = tuple(int(size) for size in shape)
+
+    @staticmethod
+    def grid_transform(lat, lon):
+        """
+        Transformación afín de una grilla regular definida por sus vectores de centros de celda.
+        """
+        # Resolución promedio de la grilla, igual que rioxarray
+        dx = float(lon[-1] - lon[0]) / (len(lon) - 1) if len(lon) > 1 else 1.0
+        dy = float(lat[-1] - lat[0]) / (len(lat) - 1) if len(lat) > 1 else -1.0
+        return Affine(dx, 0, float(lon[0]) - dx / 2, 0, dy, float(lat[0]) - dy / 2)
+
+    @staticmethod
+    def shapefile_hash(shapefile):
+        """
+        Hash del contenido del shapefile y sus archivos asociados (.dbf, .prj, ...).
+        """
+        digest = hashlib.sha1()
+        stem = os.path.splitext(shapefile)[0]
+        for path in sorted(glob.glob(glob.escape(stem) + '.*')):
+            with open(path, 'rb') as file:
+                digest.update(os.path.basename(path).encode())
+                digest.update(file.read())
+        return digest.hexdigest()
+
+    @classmethod
+    def cache_key(cls, shapefile, lat, lon, name_column, mode):
+        """
+        Clave del índice: definición de la grilla + hash del shapefile + columna de nombres + modo.
+        """
+        digest = hashlib.sha1()
+        digest.update(np.asarray(lat, dtype=np.float64).tobytes())
+        digest.update(np.asarray(lon, dtype=np.float64).tobytes())
+        digest.update(cls.shapefile_hash(shapefile).encode())
+        digest.update(f"{name_column}|{mode}".encode())
+        return digest.hexdigest()
+
+    @classmethod
+    def load(cls, shapefile, lat, lon, name_column, cache_folder=None, mode='center', regions=None):
+        """
+        Devuelve el índice de regiones de un shapefile sobre una grilla, construyéndolo sólo si no está
+        en memoria ni en cache_folder.
+
+        Parámetros:
+        - shapefile: Ruta al shapefile de regiones.
+        - lat, lon: Vectores de coordenadas de la grilla.
+        - name_column: Columna del shapefile con el nombre de cada región.
+        - cache_folder: Carpeta donde se guardan los índices entre ejecuciones (opcional).
+        - mode: 'center' incluye los píxeles cuyo centro cae en el polígono (igual que rio.clip);
+          'fraction' incluye todos los píxeles que tocan el polígono con la fracción cubierta como peso.
+        - regions: GeoDataFrame del shapefile ya leído, para no volver a leerlo si hay que construir el índice.
+        """
+        key = cls.cache_key(shapefile, lat, lon, name_column, mode)
+        if key in cls._loaded:
+            return cls._loaded[key]
+
+        cache_file = os.path.join(cache_folder, f"{key}.npz") if cache_folder is not None else None
+        if cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file, allow_pickle=False) as content:
+                index = cls(content['names'], content['indptr'], content['indices'], content['weights'], content['shape'])
+        else:
+            index = cls.build(shapefile, lat, lon, name_column, mode, regions)
+            # Otro proceso pudo guardar el mismo índice mientras se construía este
+            if cache_file is not None and not os.path.exists(cache_file):
+                index.save(cache_file)
+
+        cls._loaded[key] = index
+        return index
+
+    @classmethod
+    def build(cls, shapefile, lat, lon, name_column, mode='center', regions=None):
+        """
+        Rasteriza cada polígono del shapefile sobre la grilla.
+        """
+        if mode not in ('center', 'fraction'):
+            raise ValueError(f"Modo de índice de regiones no soportado: {mode}")
+
+        if regions is None:
+            regions = gpd.read_file(shapefile)
+        if regions.crs is not None and regions.crs.to_epsg() != 4326:
+            regions = regions.to_crs("EPSG:4326")
+
+        shape = (len(lat), len(lon))
+        transform = cls.grid_transform(lat, lon)
+
+        names = []
+        indptr = [0]
+        indices = []
+        weights = []
+        for _, region in regions.iterrows():
+            if mode == 'center':
+                inside = features.geometry_mask([region.geometry], out_shape=shape, transform=transform, invert=True)
+                pixels = np.flatnonzero(inside)
+                fractions = np.ones(pixels.size)
+            else:
+                pixels, fractions = cls.coverage_fractions(region.geometry, shape, transform)
+            names.append(str(region[name_column]))
+            indices.append(pixels)
+            weights.append(fractions)
+            indptr.append(indptr[-1] + pixels.size)
+
+        indices = np.concatenate(indices) if indices else np.empty(0, dtype=np.int64)
+        weights = np.concatenate(weights) if weights else np.empty(0)
+        return cls(names, indptr, indices, weights, shape)
+
+    @staticmethod
+    def coverage_fractions(geometry, shape, transform):
+        """
+        Calcula la fracción de cada píxel cubierta por un polígono. Devuelve los índices planos de los
+        píxeles que lo tocan y sus fracciones.
+        """
+        if geometry is None or geometry.is_empty:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        # Sólo se evalúan los píxeles de la caja envolvente del polígono
+        minx, miny, maxx, maxy = geometry.bounds
+        inverse = ~transform
+        cols = [(inverse * (x, y))[0] for x in (minx, maxx) for y in (miny, maxy)]
+        rows = [(inverse * (x, y))[1] for x in (minx, maxx) for y in (miny, maxy)]
+        col_ini, col_fin = max(int(np.floor(min(cols))), 0), min(int(np.ceil(max(cols))), shape[1])
+        row_ini, row_fin = max(int(np.floor(min(rows))), 0), min(int(np.ceil(max(rows))), shape[0])
+        if col_ini >= col_fin or row_ini >= row_fin:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        row_grid, col_grid = np.meshgrid(np.arange(row_ini, row_fin), np.arange(col_ini, col_fin), indexing='ij')
+        row_grid, col_grid = row_grid.ravel(), col_grid.ravel()
+        x_edges = transform.c + transform.a * np.stack([col_grid, col_grid + 1])
+        y_edges = transform.f + transform.e * np.stack([row_grid, row_grid + 1])
+        boxes = shapely.box(x_edges.min(axis=0), y_edges.min(axis=0), x_edges.max(axis=0), y_edges.max(axis=0))
+
+        fractions = shapely.area(shapely.intersection(boxes, geometry)) / abs(transform.a * transform.e)
+        covered = fractions > 0
+        return (row_grid[covered] * shape[1] + col_grid[covered]).astype(np.int64), fractions[covered]
+
+    def save(self, cache_file):
+        """
+        Guarda el índice en un archivo .npz.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+        # Archivo temporal propio de cada escritura: las etapas que usan la misma grilla pueden guardar el
+        # mismo índice al mismo tiempo desde varios procesos
+        temp_path = f"{cache_file}.{os.getpid()}.{uuid.uuid4().hex}.tmp.npz"
+        try:
+            np.savez(temp_path, names=np.array(self.names), indptr=self.indptr, indices=self.indices,
+                     weights=self.weights, shape=np.array(self.shape))
+            os.replace(temp_path, cache_file)
+        except OSError:
+            # Si otro proceso ya guardó el índice, su archivo es igual de válido
+            if not os.path.exists(cache_file):
+                raise
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def masks(self):
+        """
+        Máscaras booleanas (región, lat, lon) de todas las regiones.
+        """
+        masks = np.zeros((len(self.names), self.shape[0] * self.shape[1]), dtype=bool)
+        rows = np.repeat(np.arange(len(self.names)), np.diff(self.indptr))
+        masks[rows, self.indices] = True
+        return masks.reshape(len(self.names), *self.shape)
+
+    def segment_sum(self, data):
+        """
+        Suma por región de datos alineados con indices (última dimensión), equivalente al producto por la
+        matriz dispersa región x píxel. Las regiones sin píxeles quedan en 0.
+        """
+        out = np.zeros(data.shape[:-1] + (len(self.names),))
+        nonempty = np.diff(self.indptr) > 0
+        if nonempty.any():
+            out[..., nonempty] = np.add.reduceat(data, self.indptr[:-1][nonempty], axis=-1)
+        return out
+
+    def zonal_mean(self, values, area=None):
+        """
+        Promedio ponderado por región de una o varias grillas, ignorando los píxeles sin dato.
+
+        Parámetros:
+        - values: Arreglo (..., lat, lon), por ejemplo (tiempo, lat, lon).
+        - area: Área relativa de cada píxel (lat, lon) que multiplica los pesos (opcional).
+        Devuelve un arreglo (..., región); las regiones sin datos quedan en NaN.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.reshape(values.shape[:-2] + (-1,))
+        weights = self.weights if area is None else self.weights * np.asarray(area, dtype=np.float64).ravel()[self.indices]
+
+        gathered = flat[..., self.indices]
+        valid = ~np.isnan(gathered)
+        numerator = self.segment_sum(np.where(valid, gathered, 0) * weights)
+        denominator = self.segment_sum(valid * weights)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(denominator > 0, numerator / denominator, np.nan)
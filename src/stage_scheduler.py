@@ -0,0 +1,160 @@
+import os
+from telemetry import Telemetry
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+"""
+Clase que ejecuta las etapas del ETL como un grafo de dependencias
+"""
+
+
+class StageScheduler:
+    def __init__(self, workers=4, executor='process', profile_folder=None, queue=None):
+        """
+        Inicializa el planificador.
+
+        Parámetros:
+        - workers: Número de etapas que se pueden ejecutar al mismo tiempo.
+        - executor: 'process' (por defecto, las etapas corren en procesos separados) o 'queue' (las etapas se
+          publican en una cola de tareas y las ejecutan los workers de cualquier nodo). No hay ejecutor por
+          hilos: HDF5/netCDF no se puede usar desde varios hilos a la vez.
+        - profile_folder: Carpeta donde se guarda el perfil de cProfile de cada etapa (opcional).
+        - queue: QueueExecutor de la cola de tareas (sólo con executor='queue'); todas las etapas listas se
+          publican a la vez, así que workers no aplica.
+        """
+        if executor not in ('process', 'queue'):
+            raise ValueError(f"Ejecutor no soportado: {executor}. Use 'process' o 'queue'.")
+        if executor == 'queue' and queue is None:
+            raise ValueError("El ejecutor 'queue' necesita una cola de tareas (QueueExecutor).")
+        self.workers = workers
+        self.executor = executor
+        self.profile_folder = profile_folder
+        self.queue = queue
+        self.stages = {}
+        self.records = {}
+
+    def add(self, name, func, *args, deps=(), after=(), outputs=(), error_message=None, **kwargs):
+        """
+        Agrega una etapa al grafo.
+
+        Parámetros:
+        - name: Nombre único de la etapa.
+        - func, args, kwargs: Función a ejecutar y sus argumentos (deben poder serializarse con pickle
+          si el ejecutor es 'process').
+        - deps: Nombres de las etapas que deben terminar bien antes de ejecutar esta.
+        - after: Nombres de las etapas que deben terminar (bien o mal) antes de ejecutar esta; su fallo no
+          omite esta etapa.
+        - outputs: Archivos que la etapa debe generar; si falta alguno la etapa se considera fallida.
+        - error_message: Mensaje que se muestra si la etapa falla.
+        """
+        if name in self.stages:
+            raise ValueError(f"La etapa '{name}' ya existe.")
+        self.stages[name] = {
+            'func': func, 'args': args, 'kwargs': kwargs, 'deps': tuple(deps),
+            'after': tuple(after), 'outputs': tuple(outputs), 'error_message': error_message
+        }
+
+    def dependents(self, name, include_after=False):
+        """
+        Devuelve todas las etapas que dependen (directa o indirectamente) de una etapa. Con include_after
+        también se siguen las dependencias de orden (after).
+        """
+        found = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            for other, stage in self.stages.items():
+                linked = stage['deps'] + stage['after'] if include_after else stage['deps']
+                if current in linked and other not in found:
+                    found.add(other)
+                    pending.append(other)
+        return found
+
+    def validate(self):
+        """
+        Verifica que las dependencias existan y que el grafo no tenga ciclos.
+        """
+        for name, stage in self.stages.items():
+            for dep in stage['deps'] + stage['after']:
+                if dep not in self.stages:
+                    raise ValueError(f"La etapa '{name}' depende de '{dep}', que no existe.")
+        for name in self.stages:
+            if name in self.dependents(name, include_after=True):
+                raise ValueError(f"La etapa '{name}' forma parte de un ciclo de dependencias.")
+
+    def run(self, selected=None):
+        """
+        Ejecuta las etapas: cada una empieza apenas terminan sus dependencias, las independientes corren en
+        paralelo y un fallo sólo omite las etapas que dependen de la que falló.
+
+        Parámetros:
+        - selected: Nombres de las etapas a ejecutar (por defecto todas). Las etapas no seleccionadas se
+          consideran ya ejecutadas.
+        Devuelve un diccionario {etapa: 'done' | 'failed' | 'skipped'}; las métricas de cada etapa ejecutada
+        quedan en self.records.
+        """
+        self.validate()
+        selected = set(self.stages) if selected is None else set(selected)
+        status = {name: 'done' for name in self.stages if name not in selected}
+        running = {}
+
+        if self.executor == 'queue':
+            executor = self.queue
+        else:
+            executor = ProcessPoolExecutor(max_workers=max(1, self.workers))
+        with executor as pool:
+            while len(status) < len(self.stages) or running:
+                for name, stage in self.stages.items():
+                    if name in status or name in running.values():
+                        continue
+                    if all(status.get(dep) == 'done' for dep in stage['deps']) and all(dep in status for dep in stage['after']):
+                        print(f"Etapa '{name}' iniciada...")
+                        future = pool.submit(run_stage, name, stage['func'], stage['args'], stage['kwargs'], stage['outputs'], self.profile_folder)
+                        running[future] = name
+
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        record, error = future.result()
+                    except Exception as e:
+                        record, error = {'stage': name}, str(e)
+                    record['status'] = 'failed' if error is not None else 'done'
+                    self.records[name] = record
+                    if error is None:
+                        status[name] = 'done'
+                        print(f"Etapa '{name}' terminada en {record['wall_seconds']} s.")
+                    else:
+                        status[name] = 'failed'
+                        if self.stages[name]['error_message']:
+                            print(self.stages[name]['error_message'])
+                        print(f"La etapa '{name}' falló: {error}")
+                        for dependent in sorted(self.dependents(name)):
+                            if dependent not in status:
+                                status[dependent] = 'skipped'
+                                print(f"Se omite la etapa '{dependent}' porque depende de '{name}'")
+        return status
+
+
+def run_stage(name, func, args, kwargs, outputs, profile_folder=None):
+    """
+    Ejecuta una etapa midiendo sus métricas y verifica que haya generado sus archivos de salida. Las salidas
+    de una ejecución anterior del mismo día se borran antes, para que no pasen por salidas de esta etapa.
+    Devuelve (registro de métricas, mensaje de error o None); el error se devuelve como texto para que
+    siempre pueda enviarse de vuelta al proceso principal.
+    """
+    error = None
+    with Telemetry.measure(name, profile_folder) as record:
+        try:
+            for output in outputs:
+                if os.path.isfile(output):
+                    os.remove(output)
+            func(*args, **kwargs)
+            missing = [output for output in outputs if not os.path.exists(output)]
+            if missing:
+                raise FileNotFoundError(f"La etapa '{name}' no generó: {', '.join(missing)}")
+        except Exception as e:
+            error = str(e) or repr(e)
+    return record, error
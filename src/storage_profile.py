@@ -0,0 +1,163 @@
+import json
+import numpy as np
+
+"""
+Clase que define cómo se guardan las variables de los NetCDF de salida (compresión, tipo de dato y chunks)
+"""
+
+
+class StorageProfile:
+    # Pasos de tiempo y celdas (lat, lon) de cada chunk en el perfil de series de tiempo: leer la serie de una
+    # región sólo toca los chunks de sus celdas
+    TIME_CHUNK = 90
+    SPATIAL_CHUNK = 16
+
+    # Rango válido de las variables que se empaquetan como enteros cuando no se conocen los datos de antemano
+    # (escritura por días); los pronósticos pueden traer valores algo negativos de lluvia
+    VALID_RANGES = {
+        'ET0': (-5.0, 30.0),
+        'ET0_sum': (0.0, 3000.0),
+        'precipitation': (-100.0, 1000.0),
+        'air_temperature': (-60.0, 60.0),
+    }
+
+    PACKED_FILL = -32768
+
+    def __init__(self, name, compression=False, complevel=4, shuffle=True, dtype=None, chunking=None):
+        """
+        Inicializa el perfil.
+
+        Parámetros:
+        - name: Nombre del perfil (se guarda en los atributos del archivo).
+        - compression: Comprime las variables con zlib.
+        - complevel: Nivel de compresión zlib (1 a 9).
+        - shuffle: Aplica el filtro shuffle antes de comprimir.
+        - dtype: None (se conserva el tipo), 'float32' o 'int16' (empaquetado con scale_factor y add_offset).
+        - chunking: None (chunks por defecto de la librería) o 'timeseries'.
+        """
+        if dtype not in (None, 'float32', 'int16'):
+            raise ValueError(f"Tipo de dato no soportado en el perfil {name}: {dtype}")
+        if chunking not in (None, 'timeseries'):
+            raise ValueError(f"Chunking no soportado en el perfil {name}: {chunking}")
+        self.name = name
+        self.compression = compression
+        self.complevel = complevel
+        self.shuffle = shuffle
+        self.dtype = dtype
+        self.chunking = chunking
+
+    @classmethod
+    def get(cls, profile=None):
+        """
+        Devuelve un perfil a partir de su nombre (None es 'default') o el mismo perfil si ya es un StorageProfile.
+        """
+        if isinstance(profile, StorageProfile):
+            return profile
+        name = profile or 'default'
+        if name not in PROFILES:
+            raise ValueError(f"Perfil de almacenamiento no soportado: {name}. Use uno de {', '.join(PROFILES)}")
+        return PROFILES[name]
+
+    def settings(self):
+        return {'compression': 'zlib' if self.compression else None, 'complevel': self.complevel if self.compression else None,
+                'shuffle': self.shuffle if self.compression else None, 'dtype': self.dtype, 'chunking': self.chunking}
+
+    def chunks(self, variable, time_dim='time', unlimited=False):
+        """
+        Chunks de una variable para el perfil de series de tiempo: la dimensión de tiempo completa (hasta
+        TIME_CHUNK pasos), un elemento de las demás dimensiones y bloques de SPATIAL_CHUNK celdas en lat/lon.
+        """
+        chunks = []
+        for dim, size in zip(variable.dims, variable.shape):
+            if dim == time_dim:
+                chunks.append(self.TIME_CHUNK if unlimited else max(1, min(size, self.TIME_CHUNK)))
+            elif dim in ('lat', 'lon', 'x', 'y'):
+                chunks.append(max(1, min(size, self.SPATIAL_CHUNK)))
+            else:
+                chunks.append(1)
+        return tuple(chunks)
+
+    def packing(self, name, variable, stream=False):
+        """
+        Devuelve (scale_factor, add_offset) para empaquetar una variable en int16, a partir del rango de los
+        datos o, al escribir por días, de VALID_RANGES. Devuelve None si no se puede empaquetar.
+        """
+        if stream or variable.size == 0:
+            if name not in self.VALID_RANGES:
+                return None
+            low, high = self.VALID_RANGES[name]
+        else:
+            values = np.asarray(variable.values, dtype=np.float64)
+            if not np.isfinite(values).any():
+                return None
+            low, high = float(np.nanmin(values)), float(np.nanmax(values))
+        # Se reserva el menor entero para _FillValue
+        scale_factor = (high - low) / (2 ** 16 - 2) if high > low else 1.0
+        add_offset = (high + low) / 2
+        return scale_factor, add_offset
+
+    def encoding(self, ds, time_dim='time', stream=False):
+        """
+        Codificación de to_netcdf para las variables de datos de un Dataset. No modifica el Dataset: la
+        codificación de cada variable reemplaza en to_netcdf la heredada del archivo de entrada.
+
+        Parámetros:
+        - ds: Dataset a guardar.
+        - time_dim: Nombre de la dimensión de tiempo.
+        - stream: True si el archivo se escribe por días sobre una dimensión de tiempo ilimitada.
+        """
+        if self.name == 'default':
+            return {}
+
+        encoding = {}
+        for name, variable in ds.data_vars.items():
+            if not np.issubdtype(variable.dtype, np.number):
+                continue
+            settings = {}
+            if self.compression:
+                settings.update({'zlib': True, 'complevel': self.complevel, 'shuffle': self.shuffle})
+            if self.chunking == 'timeseries' and variable.ndim > 0:
+                settings['chunksizes'] = self.chunks(variable, time_dim, unlimited=stream and time_dim in variable.dims)
+
+            packing = self.packing(name, variable, stream) if self.dtype == 'int16' else None
+            if packing is not None:
+                settings.update({'dtype': 'int16', 'scale_factor': packing[0], 'add_offset': packing[1], '_FillValue': self.PACKED_FILL})
+            elif self.dtype is not None and np.issubdtype(variable.dtype, np.floating):
+                settings.update({'dtype': 'float32', '_FillValue': np.float32(np.nan)})
+            encoding[name] = settings
+        return encoding
+
+    def limits(self, encoding):
+        """
+        Valores mínimo y máximo que se pueden representar en cada variable empaquetada de una codificación.
+        """
+        limits = {}
+        for name, settings in encoding.items():
+            if 'scale_factor' in settings:
+                span = (2 ** 15 - 1) * settings['scale_factor']
+                limits[name] = (settings['add_offset'] - span, settings['add_offset'] + span)
+        return limits
+
+    def apply(self, ds, time_dim='time', stream=False):
+        """
+        Registra el perfil en los atributos del Dataset y devuelve la codificación para to_netcdf.
+        """
+        ds.attrs['storage_profile'] = self.name
+        ds.attrs['storage_profile_settings'] = json.dumps(self.settings())
+        return self.encoding(ds, time_dim, stream)
+
+    def to_netcdf(self, ds, output_file, **kwargs):
+        """
+        Guarda un Dataset con este perfil.
+        """
+        ds.to_netcdf(output_file, encoding=self.apply(ds), **kwargs)
+
+
+PROFILES = {
+    # Como hasta ahora: tipos de los datos, sin compresión y con los chunks por defecto
+    'default': StorageProfile('default'),
+    # float32 comprimido con chunks para leer series de tiempo por región
+    'compressed': StorageProfile('compressed', compression=True, dtype='float32', chunking='timeseries'),
+    # Enteros de 16 bits con scale_factor/add_offset, comprimidos, con chunks de series de tiempo
+    'packed': StorageProfile('packed', compression=True, dtype='int16', chunking='timeseries'),
+}
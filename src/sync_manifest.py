@@ -0,0 +1,85 @@
+import os
+import json
+from datetime import datetime
+
+"""
+Clase que guarda el estado de sincronización de los archivos descargados de Google Drive
+"""
+
+
+class SyncManifest:
+    # Campos de Google Drive que identifican una versión de un archivo
+    VERSION_FIELDS = ('id', 'md5Checksum', 'size', 'modifiedTime')
+
+    def __init__(self, manifest_path):
+        """
+        Inicializa el manifiesto a partir de un archivo JSON (se crea vacío si no existe).
+
+        Parámetros:
+        - manifest_path: Ruta al archivo JSON del manifiesto.
+        """
+        self.manifest_path = manifest_path
+        self.folders = {}
+        self.files = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as manifest_file:
+                content = json.load(manifest_file)
+            self.folders = content.get('folders', {})
+            self.files = content.get('files', {})
+
+    def save(self):
+        """
+        Escribe el manifiesto en disco de forma atómica.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        content = {
+            'updated': datetime.now().isoformat(timespec='seconds'),
+            'folders': self.folders,
+            'files': self.files
+        }
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(content, manifest_file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def get_folder(self, parent_id, name):
+        """
+        Devuelve el ID en caché de la carpeta 'name' dentro de 'parent_id', o None.
+        """
+        return self.folders.get(f"{parent_id}/{name}")
+
+    def set_folder(self, parent_id, name, folder_id):
+        """
+        Guarda en caché el ID de la carpeta 'name' dentro de 'parent_id'.
+        """
+        self.folders[f"{parent_id}/{name}"] = folder_id
+
+    def forget_folder(self, parent_id, name):
+        """
+        Elimina de la caché una carpeta que ya no es válida.
+        """
+        self.folders.pop(f"{parent_id}/{name}", None)
+
+    def needs_download(self, variable, file, local_path):
+        """
+        Indica si un archivo de Drive es nuevo o cambió respecto a la copia local registrada.
+
+        Parámetros:
+        - variable: Nombre de la variable (carpeta) a la que pertenece el archivo.
+        - file: Metadatos de Drive del archivo (id, name, md5Checksum, size, modifiedTime).
+        - local_path: Ruta donde debería estar la copia local.
+        """
+        entry = self.files.get(variable, {}).get(file['name'])
+        if entry is None or not os.path.exists(local_path):
+            return True
+        if any(entry.get(field) != file.get(field) for field in self.VERSION_FIELDS):
+            return True
+        return 'size' in file and os.path.getsize(local_path) != int(file['size'])
+
+    def record(self, variable, file, local_path):
+        """
+        Registra la versión descargada de un archivo.
+        """
+        entry = {field: file.get(field) for field in self.VERSION_FIELDS}
+        entry['path'] = local_path
+        self.files.setdefault(variable, {})[file['name']] = entry
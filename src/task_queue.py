@@ -0,0 +1,458 @@
+import os
+import re
+import hmac
+import json
+import time
+import uuid
+import pickle
+import random
+import socket
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+"""
+Cola de tareas para repartir las etapas del ETL entre varios nodos: brokers intercambiables (carpeta compartida
+o memoria), el ejecutor que usa el coordinador en lugar de un pool de procesos y el worker que toma las tareas
+"""
+
+
+class TaskBroker(ABC):
+    """
+    Interfaz de un broker. Las tareas y sus resultados viajan como bytes (pickle): put publica una tarea,
+    claim entrega cada tarea a un solo worker aunque varios la pidan al mismo tiempo, complete guarda el
+    resultado y result lo devuelve al coordinador cuando la tarea terminó.
+    """
+    # Segundos sin señal de vida tras los que una tarea tomada vuelve a la cola (None: nunca)
+    lease_seconds = None
+
+    @abstractmethod
+    def put(self, task_id, payload):
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id):
+        """
+        Toma la tarea más antigua pendiente; devuelve (task_id, payload, lease_seconds) o None si no hay
+        tareas. lease_seconds es el plazo que fijó el coordinador al publicar la tarea: el worker renueva su
+        señal de vida según ese plazo y no según su propia configuración.
+        """
+
+    def heartbeat(self, task_id):
+        """
+        Indica que el worker que tomó la tarea sigue ejecutándola.
+        """
+
+    @abstractmethod
+    def complete(self, task_id, outcome):
+        pass
+
+    @abstractmethod
+    def result(self, task_id):
+        """
+        Devuelve el resultado de una tarea (bytes) o None si aún no termina.
+        """
+
+    def discard(self, task_id):
+        """
+        Borra el resultado de una tarea ya entregada al coordinador.
+        """
+
+    def requeue_expired(self):
+        """
+        Devuelve a la cola las tareas cuyo worker dejó de dar señales de vida y devuelve sus identificadores.
+        """
+        return []
+
+    def is_pending(self, task_id):
+        """
+        Indica si la tarea sigue en la cola sin que ningún worker la haya tomado.
+        """
+        return False
+
+
+class FileBroker(TaskBroker):
+    def __init__(self, queue_folder, lease_seconds=600, key=None, allow_unsigned=False):
+        """
+        Inicializa un broker sobre una carpeta compartida por todos los nodos (disco local o NFS). Cada tarea es
+        un archivo que pasa de pending/ a running/ con os.rename, que es atómico: si varios workers intentan
+        tomar la misma tarea sólo uno lo logra. El resultado se escribe en results/.
+
+        Parámetros:
+        - queue_folder: Carpeta de la cola.
+        - lease_seconds: Segundos sin señal de vida (fecha de modificación del archivo en running/) tras los
+          que la tarea vuelve a pending/ para que la tome otro worker. Lo fija el coordinador: se guarda en
+          cada tarea que publica y sólo el coordinador devuelve tareas a la cola.
+        - key: Clave compartida con la que se firman (HMAC-SHA256) las tareas y los resultados; los archivos
+          sin una firma válida no se deserializan. Es obligatoria salvo con allow_unsigned.
+        - allow_unsigned: Acepta trabajar sin clave. Entonces nada se verifica y cualquiera que pueda escribir en
+          la carpeta puede ejecutar código en los workers y en el coordinador.
+        """
+        if not key and not allow_unsigned:
+            raise ValueError(f"La cola {queue_folder} necesita una clave para firmar las tareas (ETL_QUEUE_KEY); "
+                             "para usarla sin firmas defina ETL_QUEUE_UNSIGNED=1")
+        self.queue_folder = queue_folder
+        self.lease_seconds = lease_seconds
+        self.key = key.encode() if isinstance(key, str) else key
+        self.pending_folder = os.path.join(queue_folder, "pending/")
+        self.running_folder = os.path.join(queue_folder, "running/")
+        self.results_folder = os.path.join(queue_folder, "results/")
+        for folder in (self.pending_folder, self.running_folder, self.results_folder):
+            os.makedirs(folder, exist_ok=True)
+
+    def write(self, path, content):
+        """
+        Escribe un archivo de forma atómica: los demás nodos nunca ven un archivo a medio escribir.
+        """
+        temp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{socket.gethostname()}.{os.getpid()}.tmp")
+        with open(temp_path, 'wb') as output_file:
+            output_file.write(content)
+        os.replace(temp_path, path)
+
+    def signature(self, header, content):
+        return hmac.new(self.key, header + b"\n" + content, hashlib.sha256).hexdigest() if self.key else ''
+
+    def pack(self, content, **header):
+        """
+        Antepone a los bytes de una tarea o resultado una línea JSON con sus datos (header) y su firma.
+        """
+        header = json.dumps(header, sort_keys=True).encode()
+        return json.dumps({'header': header.decode(), 'signature': self.signature(header, content)}).encode() + b"\n" + content
+
+    def unpack(self, path, data):
+        """
+        Separa la línea de datos de un archivo de la cola y verifica su firma; devuelve (header, bytes).
+        """
+        line, _, content = data.partition(b"\n")
+        try:
+            envelope = json.loads(line)
+            header = envelope['header'].encode()
+            valid = hmac.compare_digest(envelope['signature'], self.signature(header, content))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise ValueError(f"El archivo {path} no tiene el formato de la cola")
+        if not valid:
+            raise ValueError(f"La firma del archivo {path} no es válida (revise ETL_QUEUE_KEY)")
+        return json.loads(header), content
+
+    def put(self, task_id, payload):
+        self.write(os.path.join(self.pending_folder, f"{task_id}.task"), self.pack(payload, lease_seconds=self.lease_seconds))
+
+    def claim(self, worker_id):
+        for name in sorted(os.listdir(self.pending_folder)):
+            if not name.endswith('.task'):
+                continue
+            running_path = os.path.join(self.running_folder, name)
+            try:
+                os.rename(os.path.join(self.pending_folder, name), running_path)
+            except FileNotFoundError:
+                # Otro worker la tomó primero
+                continue
+            # La fecha de modificación es la señal de vida de la tarea
+            os.utime(running_path)
+            task_id = name[:-len('.task')]
+            with open(running_path, 'rb') as task_file:
+                data = task_file.read()
+            try:
+                header, payload = self.unpack(running_path, data)
+            except ValueError as e:
+                # La tarea no se ejecuta; el coordinador que la publicó recibe el error como resultado
+                print(e)
+                self.complete(task_id, pickle.dumps(('failed', str(e))))
+                continue
+            return task_id, payload, header.get('lease_seconds')
+        return None
+
+    def heartbeat(self, task_id):
+        try:
+            os.utime(os.path.join(self.running_folder, f"{task_id}.task"))
+        except FileNotFoundError:
+            pass
+
+    def complete(self, task_id, outcome):
+        task_paths = (os.path.join(self.running_folder, f"{task_id}.task"), os.path.join(self.pending_folder, f"{task_id}.task"))
+        # Si otro worker ya entregó la tarea (se ejecutó dos veces tras volver a la cola) el coordinador pudo
+        # haber recogido y borrado su resultado: este se descarta para no dejarlo huérfano en results/
+        if not any(os.path.exists(path) for path in task_paths):
+            return
+        self.write(os.path.join(self.results_folder, f"{task_id}.result"), self.pack(outcome))
+        # Si la tarea se devolvió a la cola mientras se ejecutaba, se retira para no ejecutarla otra vez
+        for path in task_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def result(self, task_id):
+        result_path = os.path.join(self.results_folder, f"{task_id}.result")
+        try:
+            with open(result_path, 'rb') as result_file:
+                data = result_file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            return self.unpack(result_path, data)[1]
+        except ValueError as e:
+            return pickle.dumps(('failed', str(e)))
+
+    def discard(self, task_id):
+        try:
+            os.remove(os.path.join(self.results_folder, f"{task_id}.result"))
+        except FileNotFoundError:
+            pass
+
+    def is_pending(self, task_id):
+        return os.path.exists(os.path.join(self.pending_folder, f"{task_id}.task"))
+
+    def requeue_expired(self):
+        if self.lease_seconds is None:
+            return []
+        requeued = []
+        now = time.time()
+        for name in os.listdir(self.running_folder):
+            running_path = os.path.join(self.running_folder, name)
+            try:
+                expired = name.endswith('.task') and now - os.path.getmtime(running_path) > self.lease_seconds
+                if expired:
+                    os.rename(running_path, os.path.join(self.pending_folder, name))
+                    requeued.append(name[:-len('.task')])
+            except FileNotFoundError:
+                continue
+        return requeued
+
+
+class LocalBroker(TaskBroker):
+    def __init__(self):
+        """
+        Inicializa un broker en memoria con la misma interfaz que FileBroker, para ejecutar la cola en un solo
+        coordinador (sus workers locales, ver QueueExecutor). Las tareas también se serializan con pickle, así que
+        una tarea que funciona con este broker funciona en otros nodos.
+        """
+        self._lock = threading.Lock()
+        self.pending = deque()
+        self.running = {}
+        self.results = {}
+
+    def put(self, task_id, payload):
+        with self._lock:
+            self.pending.append((task_id, payload))
+
+    def claim(self, worker_id):
+        with self._lock:
+            if not self.pending:
+                return None
+            task_id, payload = self.pending.popleft()
+            self.running[task_id] = worker_id
+            return task_id, payload, self.lease_seconds
+
+    def complete(self, task_id, outcome):
+        with self._lock:
+            self.running.pop(task_id, None)
+            self.results[task_id] = outcome
+
+    def result(self, task_id):
+        with self._lock:
+            return self.results.get(task_id)
+
+    def discard(self, task_id):
+        with self._lock:
+            self.results.pop(task_id, None)
+
+    def is_pending(self, task_id):
+        with self._lock:
+            return any(pending_id == task_id for pending_id, _ in self.pending)
+
+
+class QueueExecutor:
+    def __init__(self, broker, local_workers=0, poll_seconds=1.0, unclaimed_seconds=60):
+        """
+        Ejecutor con la interfaz de ProcessPoolExecutor (submit devuelve un Future) que publica cada llamada
+        como una tarea del broker; los Future se completan cuando algún worker entrega el resultado.
+
+        Parámetros:
+        - broker: TaskBroker de la cola.
+        - local_workers: Workers que el mismo coordinador ejecuta mientras está abierto (cada tarea corre en un
+          proceso propio, porque HDF5/netCDF no se puede usar desde varios hilos a la vez); con FileBroker
+          pueden ser 0 si las tareas las toman los workers de otros nodos (worker.py).
+        - poll_seconds: Intervalo de consulta de los resultados.
+        - unclaimed_seconds: Segundos tras los que se avisa (y se vuelve a avisar) si hay tareas que ningún
+          worker tomó, por ejemplo porque no hay ningún worker.py ejecutándose.
+        """
+        self.broker = broker
+        self.local_workers = local_workers
+        self.poll_seconds = poll_seconds
+        self.unclaimed_seconds = unclaimed_seconds
+        self.futures = {}
+        self.submitted = {}
+        self._warned = None
+        self._lock = threading.Lock()
+        self._stop = None
+        self._threads = []
+        self._pool = None
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        label = args[0] if args and isinstance(args[0], str) else getattr(func, '__name__', 'task')
+        label = re.sub(r'[^\w@-]', '_', label)
+        task_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}-{label}"
+        try:
+            payload = pickle.dumps((func, args, kwargs))
+        except Exception as e:
+            future.set_exception(e)
+            return future
+        with self._lock:
+            self.futures[task_id] = future
+            self.submitted[task_id] = time.monotonic()
+        self.broker.put(task_id, payload)
+        return future
+
+    def poll(self):
+        """
+        Entrega los resultados disponibles a sus Future y devuelve a la cola las tareas vencidas.
+        """
+        for task_id in self.broker.requeue_expired():
+            print(f"La tarea {task_id} no dio señales de vida; vuelve a la cola")
+        with self._lock:
+            waiting = list(self.futures.items())
+        for task_id, future in waiting:
+            outcome = self.broker.result(task_id)
+            if outcome is None:
+                continue
+            status, value = pickle.loads(outcome)
+            self.broker.discard(task_id)
+            with self._lock:
+                self.futures.pop(task_id, None)
+                self.submitted.pop(task_id, None)
+            if status == 'done':
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+        self.warn_unclaimed()
+
+    def warn_unclaimed(self):
+        """
+        Avisa, como máximo una vez cada unclaimed_seconds, si hay tareas publicadas hace más de
+        unclaimed_seconds que ningún worker tomó.
+        """
+        if self.unclaimed_seconds is None:
+            return
+        now = time.monotonic()
+        if self._warned is not None and now - self._warned < self.unclaimed_seconds:
+            return
+        with self._lock:
+            old = [task_id for task_id, submitted in self.submitted.items() if now - submitted > self.unclaimed_seconds]
+        unclaimed = [task_id for task_id in old if self.broker.is_pending(task_id)]
+        if unclaimed:
+            self._warned = now
+            where = f" en {self.broker.queue_folder}" if hasattr(self.broker, 'queue_folder') else ""
+            print(f"Advertencia: {len(unclaimed)} tareas{where} llevan más de {self.unclaimed_seconds:.0f} s sin que "
+                  f"ningún worker las tome (¿hay algún worker.py ejecutándose?): {', '.join(unclaimed[:3])}"
+                  f"{'...' if len(unclaimed) > 3 else ''}")
+
+    def poll_loop(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.poll_seconds)
+
+    def __enter__(self):
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self.poll_loop, daemon=True)]
+        self._pool = ProcessPoolExecutor(max_workers=self.local_workers) if self.local_workers else None
+        self._threads += [threading.Thread(target=QueueWorker(self.broker, poll_seconds=self.poll_seconds, pool=self._pool).run, args=(self._stop,), daemon=True)
+                          for _ in range(self.local_workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+        self.poll()
+
+
+class QueueWorker:
+    def __init__(self, broker, worker_id=None, poll_seconds=1.0, idle_seconds=None, pool=None):
+        """
+        Inicializa un worker que toma tareas del broker, las ejecuta y entrega su resultado.
+
+        Parámetros:
+        - broker: TaskBroker de la cola.
+        - worker_id: Identificador del worker (por defecto <host>-<pid>-<hilo>).
+        - poll_seconds: Espera entre consultas cuando no hay tareas.
+        - idle_seconds: Segundos sin tareas tras los que el worker termina (None: no termina).
+        - pool: ProcessPoolExecutor donde se ejecutan las tareas (por defecto en el mismo hilo del worker).
+        """
+        self.broker = broker
+        self.worker_id = worker_id
+        self.poll_seconds = poll_seconds
+        self.idle_seconds = idle_seconds
+        self.pool = pool
+
+    def run(self, stop=None):
+        """
+        Ejecuta tareas hasta que se active el evento stop o pasen idle_seconds sin tareas. Devuelve el número
+        de tareas ejecutadas.
+        """
+        worker_id = self.worker_id or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        executed = 0
+        idle_since = time.monotonic()
+        while stop is None or not stop.is_set():
+            claimed = self.broker.claim(worker_id)
+            if claimed is None:
+                if self.idle_seconds is not None and time.monotonic() - idle_since > self.idle_seconds:
+                    break
+                # Espera con variación para que los workers no consulten la cola siempre en el mismo orden
+                wait_seconds = self.poll_seconds * random.uniform(0.5, 1.5)
+                if stop is not None:
+                    stop.wait(wait_seconds)
+                else:
+                    time.sleep(wait_seconds)
+                continue
+
+            task_id, payload, lease_seconds = claimed
+            print(f"Worker {worker_id}: tarea {task_id} iniciada...")
+            self.broker.complete(task_id, self.execute(task_id, payload, lease_seconds))
+            executed += 1
+            idle_since = time.monotonic()
+        return executed
+
+    def execute(self, task_id, payload, lease_seconds=None):
+        """
+        Ejecuta una tarea mientras otro hilo renueva su señal de vida (tres veces por cada plazo lease_seconds
+        de la tarea); devuelve el resultado serializado.
+        """
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(lease_seconds / 3):
+                self.broker.heartbeat(task_id)
+
+        beater = threading.Thread(target=heartbeat, daemon=True) if lease_seconds else None
+        if beater is not None:
+            beater.start()
+        try:
+            return self.pool.submit(run_task, payload).result() if self.pool is not None else run_task(payload)
+        except Exception as e:
+            return pickle.dumps(('failed', str(e) or repr(e)))
+        finally:
+            done.set()
+
+
+def run_task(payload):
+    """
+    Ejecuta una tarea serializada (función, args, kwargs) y devuelve su resultado serializado:
+    ('done', valor) o ('failed', mensaje).
+    """
+    try:
+        func, args, kwargs = pickle.loads(payload)
+        outcome = ('done', func(*args, **kwargs))
+    except Exception as e:
+        outcome = ('failed', str(e) or repr(e))
+    try:
+        return pickle.dumps(outcome)
+    except Exception as e:
+        return pickle.dumps(('failed', f"No se pudo serializar el resultado de la tarea: {e}"))
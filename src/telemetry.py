@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import socket
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # resource no existe en Windows: no se reporta la memoria máxima y el CPU se mide con process_time
+    resource = None
+
+"""
+Clase que registra métricas de rendimiento por etapa del ETL
+"""
+
+
+class Telemetry:
+    # Contadores del proceso (bytes, archivos, reintentos); cada etapa reporta la diferencia entre su inicio y su fin
+    _counters = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def count(cls, name, amount=1):
+        """
+        Suma amount al contador name del proceso actual, por ejemplo 'bytes_downloaded' o 'retries'.
+        """
+        with cls._lock:
+            cls._counters[name] = cls._counters.get(name, 0) + amount
+
+    @classmethod
+    def count_read(cls, path, nbytes=None):
+        """
+        Registra la lectura de un archivo; nbytes es lo leído realmente (por defecto el tamaño del archivo).
+        """
+        cls.count('files_read')
+        cls.count('bytes_read', cls.file_size(path) if nbytes is None else int(nbytes))
+
+    @classmethod
+    def count_written(cls, path):
+        """
+        Registra la escritura de un archivo con su tamaño final.
+        """
+        cls.count('files_written')
+        cls.count('bytes_written', cls.file_size(path))
+
+    @staticmethod
+    def file_size(path):
+        """
+        Tamaño de un archivo o, si es una carpeta, de todos sus archivos (0 si no existe).
+        """
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    @classmethod
+    def counters(cls):
+        with cls._lock:
+            return dict(cls._counters)
+
+    @staticmethod
+    def resource_usage():
+        """
+        Devuelve (segundos de CPU, memoria máxima en MB) del proceso y de sus procesos hijos ya terminados.
+        """
+        if resource is None:
+            return time.process_time(), None
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        scale = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+        return cpu, max(own.ru_maxrss, children.ru_maxrss) / scale
+
+    @classmethod
+    @contextmanager
+    def measure(cls, name, profile_folder=None):
+        """
+        Mide una etapa: tiempo real, tiempo de CPU, memoria máxima y la diferencia de los contadores.
+        Entrega el diccionario del registro, que se completa al salir del bloque. Con profile_folder
+        se guarda además el perfil de cProfile de la etapa en <profile_folder>/<name>.prof.
+
+        ru_maxrss es el máximo de toda la vida del proceso, y los procesos del pool ejecutan varias etapas:
+        process_peak_rss_mb es ese máximo al terminar la etapa (incluye lo que usaron etapas anteriores del
+        mismo proceso) y peak_rss_increase_mb cuánto lo subió la etapa respecto de su valor al iniciar (0 si
+        la etapa no superó un máximo anterior).
+        """
+        record = {'stage': name, 'host': socket.gethostname(), 'pid': os.getpid(), 'started': datetime.now().isoformat(timespec='seconds')}
+        counters = cls.counters()
+        cpu, start_rss = cls.resource_usage()
+        profiler = cProfile.Profile() if profile_folder else None
+        wall = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                os.makedirs(profile_folder, exist_ok=True)
+                record['profile'] = os.path.join(profile_folder, f"{name}.prof")
+                profiler.dump_stats(record['profile'])
+            record['wall_seconds'] = round(time.perf_counter() - wall, 3)
+            end_cpu, peak_rss = cls.resource_usage()
+            record['cpu_seconds'] = round(end_cpu - cpu, 3)
+            record['process_peak_rss_mb'] = round(peak_rss, 1) if peak_rss is not None else None
+            record['peak_rss_increase_mb'] = round(peak_rss - start_rss, 1) if peak_rss is not None else None
+            after = cls.counters()
+            record['counters'] = {key: after[key] - counters.get(key, 0) for key in sorted(after) if after[key] != counters.get(key, 0)}
+
+    @staticmethod
+    def write_report(report_path, records, **run_info):
+        """
+        Escribe el reporte JSON de una ejecución con la información general y los registros de cada etapa.
+        """
+        stages = list(records)
+        totals = {}
+        for record in stages:
+            for key, value in record.get('counters', {}).items():
+                totals[key] = totals.get(key, 0) + value
+        report = {
+            'host': socket.gethostname(),
+            **run_info,
+            'totals': totals,
+            'stages': stages
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        temp_path = report_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2, default=str)
+        os.replace(temp_path, report_path)
+        return report
@@ -0,0 +1,92 @@
+import os
+import numpy as np
+import pandas as pd
+import netCDF4 as nc
+from storage_profile import StorageProfile
+from telemetry import Telemetry
+
+"""
+Clase que escribe un archivo NetCDF día a día sobre una dimensión de tiempo ilimitada
+"""
+
+
+class TimeSeriesWriter:
+    def __init__(self, output_file, time_dim='time', profile=None):
+        """
+        Inicializa el escritor. El archivo se crea con el primer append, con la misma estructura y atributos
+        que escribiría xarray para ese día, y los días siguientes se agregan al final de la dimensión de tiempo;
+        así sólo hay un día en memoria sin importar el largo de la ventana.
+
+        Parámetros:
+        - output_file: Ruta del archivo NetCDF de salida.
+        - time_dim: Nombre de la dimensión de tiempo.
+        - profile: Perfil de almacenamiento (nombre o StorageProfile) con el que se crean las variables.
+        """
+        self.output_file = output_file
+        self.time_dim = time_dim
+        self.profile = StorageProfile.get(profile)
+        self.length = 0
+        self._dataset = None
+        self._coords = None
+        self._limits = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, ds):
+        """
+        Agrega al final del archivo los pasos de tiempo de un Dataset de xarray. Todos los días deben tener
+        las mismas variables y coordenadas espaciales que el primero.
+        """
+        if self._dataset is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.output_file)), exist_ok=True)
+            encoding = self.profile.apply(ds, self.time_dim, stream=True)
+            self._limits = self.profile.limits(encoding)
+            ds = self.clip(ds)
+            ds.to_netcdf(self.output_file, mode='w', format='NETCDF4', unlimited_dims=[self.time_dim], encoding=encoding)
+            self._coords = {name: ds[name].values for name in ds.coords if self.time_dim not in ds[name].dims}
+            self._dataset = nc.Dataset(self.output_file, 'a')
+            self.length = ds.sizes[self.time_dim]
+            return
+
+        for name, values in self._coords.items():
+            if name in ds.coords and not np.array_equal(ds[name].values, values):
+                raise ValueError(f"La coordenada '{name}' de {self.output_file} cambia entre días")
+
+        ds = self.clip(ds)
+        steps = ds.sizes[self.time_dim]
+        target = slice(self.length, self.length + steps)
+        time = self._dataset.variables[self.time_dim]
+        dates = pd.to_datetime(ds[self.time_dim].values).to_pydatetime()
+        time[target] = nc.date2num(dates, units=time.units, calendar=getattr(time, 'calendar', 'standard'))
+
+        for name, variable in self._dataset.variables.items():
+            if name == self.time_dim or self.time_dim not in variable.dimensions:
+                continue
+            data = ds[name].transpose(*variable.dimensions).values
+            if np.issubdtype(data.dtype, np.floating):
+                # Los NaN se escriben como _FillValue (y se empaquetan bien si la variable usa scale_factor)
+                data = np.ma.masked_invalid(data)
+            variable[(target,) + (slice(None),) * (data.ndim - 1)] = data
+        self.length += steps
+
+    def clip(self, ds):
+        """
+        Lleva al rango representable los valores de las variables empaquetadas como enteros, que de otro modo
+        se desbordarían al escribirse (el rango se fija al crear el archivo, sin conocer los días siguientes).
+        """
+        if not self._limits:
+            return ds
+        ds = ds.copy()
+        for name, (low, high) in self._limits.items():
+            ds[name] = ds[name].clip(low, high)
+        return ds
+
+    def close(self):
+        if self._dataset is not None:
+            self._dataset.close()
+            self._dataset = None
+            Telemetry.count_written(self.output_file)
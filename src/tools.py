@@ -1,17 +1,32 @@
-import os, json
+import os, json, warnings
 import xarray as xr
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import timedelta, datetime
 import cftime
 import geopandas as gpd
-import rasterio
 from shapely.geometry import mapping
 import matplotlib.dates as mdates
+from geotiff_reader import GeoTiffReader
+from mask_index import MaskIndex
+from region_file import RegionFile
+from region_index import RegionIndex
+from storage_profile import StorageProfile
+from telemetry import Telemetry
+from time_series_writer import TimeSeriesWriter
 
 class Tools():
 
+    # Nombres en español de variables y unidades para los gráficos
+    PLOT_NAMES = {
+        "air_temperature": "temperatura del aire",
+        "precipitation": "precipitación",
+        "mm/day": "mm/día",
+    }
+
     def plot_nc_file(self, file_path, variable_name, save_path, lon_dim='lon', lat_dim='lat', time_dim='time', region_dim='region'):
         """
         Función para graficar el promedio diario y la desviación estándar de una variable en un archivo NetCDF y guardar la figura por región.
@@ -25,90 +40,192 @@ class Tools():
         - time_dim: Nombre de la dimensión de tiempo (por defecto 'time').
         - region_dim: Nombre de la dimensión de región (por defecto 'region').
         """
-        # Abrir el archivo NetCDF
-        dataset = xr.open_dataset(file_path)
-
-        # Verificar si la variable existe en el conjunto de datos
-        if variable_name not in dataset:
-            raise ValueError(f"La variable '{variable_name}' no se encuentra en el archivo.")
-
-        # Iterar sobre cada región
-        for region in dataset[region_dim].values:
-            # Filtrar los datos por la región actual
-            region_data = dataset.sel({region_dim: region})
+        stats = self.region_statistics(file_path, variable_name, lon_dim, lat_dim, time_dim, region_dim)
+        for path in self.render_region_plots(stats, save_path, range(len(stats['regions']))):
+            Telemetry.count_written(path)
 
-            # Calcular el promedio diario y la desviación estándar para la región actual
-            daily_mean = region_data[variable_name].mean(dim=[lon_dim, lat_dim])
-            daily_std = region_data[variable_name].std(dim=[lon_dim, lat_dim])
+    def plot_nc_files(self, plots, workers=4, lon_dim='lon', lat_dim='lat', time_dim='time', region_dim='region'):
+        """
+        Grafica por región varios archivos NetCDF a la vez. Las estadísticas de cada archivo se calculan para
+        todas las regiones en una sola reducción y los PNG se generan en un pool de procesos, donde cada
+        proceso reutiliza una misma figura para todos sus gráficos.
 
-            # Extraer los datos de tiempo
-            time = dataset[time_dim].values
+        Parámetros:
+        - plots: Lista de tuplas (file_path, variable_name, save_path), como en plot_nc_file.
+        - workers: Número de procesos que generan los gráficos.
+        Devuelve la lista de archivos que no se pudieron graficar.
+        """
+        jobs = []
+        failed = []
+        for file_path, variable_name, save_path in plots:
+            try:
+                stats = self.region_statistics(file_path, variable_name, lon_dim, lat_dim, time_dim, region_dim)
+            except Exception as e:
+                print(f"Error al tratar de generar los gráficos de {file_path}: {e}")
+                failed.append(file_path)
+                continue
+            # Las regiones de cada archivo se reparten entre los procesos
+            regions = range(len(stats['regions']))
+            chunk = max(1, -(-len(regions) // max(1, workers)))
+            for ini in range(0, len(regions), chunk):
+                jobs.append((file_path, stats, save_path, regions[ini:ini + chunk]))
+
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(self.render_region_plots, stats, save_path, regions): file_path for file_path, stats, save_path, regions in jobs}
+                for future in as_completed(futures):
+                    try:
+                        for path in future.result():
+                            Telemetry.count_written(path)
+                    except Exception as e:
+                        print(f"Error al tratar de generar los gráficos de {futures[future]}: {e}")
+                        failed.append(futures[future])
+        else:
+            for file_path, stats, save_path, regions in jobs:
+                try:
+                    for path in self.render_region_plots(stats, save_path, regions):
+                        Telemetry.count_written(path)
+                except Exception as e:
+                    print(f"Error al tratar de generar los gráficos de {file_path}: {e}")
+                    failed.append(file_path)
+        return sorted(set(failed))
+
+    def region_statistics(self, file_path, variable_name, lon_dim='lon', lat_dim='lat', time_dim='time', region_dim='region'):
+        """
+        Calcula el promedio diario y la desviación estándar espacial de todas las regiones de un archivo.
+        Devuelve un diccionario con el tiempo, las regiones, mean y std (región, tiempo), unidades y variable.
+        """
+        with xr.open_dataset(file_path) as dataset:
+            # Verificar si la variable existe en el conjunto de datos
+            if variable_name not in dataset:
+                raise ValueError(f"La variable '{variable_name}' no se encuentra en el archivo.")
+            Telemetry.count_read(file_path)
+
+            data = dataset[variable_name]
+            if RegionFile.is_compact(dataset):
+                # Sólo se reducen los píxeles de cada región a partir de su índice
+                regions = RegionFile(dataset, *dataset.attrs['region_grid'].split())
+                daily_mean, daily_std = regions.statistics(variable_name)
+                names = regions.names
+            else:
+                # Archivos con una copia de la grilla por región (formato anterior)
+                daily_mean = data.mean(dim=[lon_dim, lat_dim]).transpose(region_dim, time_dim).values
+                daily_std = data.std(dim=[lon_dim, lat_dim]).transpose(region_dim, time_dim).values
+                names = [str(region) for region in dataset[region_dim].values]
 
             # Convertir el tiempo de cftime.DatetimeGregorian a pandas datetime si es necesario
+            time = dataset[time_dim].values
             if isinstance(time[0], cftime.DatetimeGregorian):
                 time = np.array([np.datetime64(date.strftime('%Y-%m-%d')) for date in time])
 
-            # Obtener las unidades de la variable
-            units = dataset[variable_name].attrs.get('units', 'unidades')
-
-            # Nombres en español
-            dict = {
-                "air_temperature": "temperatura del aire",
-                "precipitation": "precipitación",
-                "mm/day": "mm/día",
+            return {
+                'variable': variable_name,
+                'units': data.attrs.get('units', 'unidades'),
+                'time': time,
+                'regions': names,
+                'mean': daily_mean,
+                'std': daily_std
             }
-            nombre_variable_final = dict[variable_name] if variable_name in dict else variable_name
-            nombre_unidades_final = dict[units] if units in dict else units
+
+    def render_region_plots(self, stats, save_path, regions):
+        """
+        Guarda un PNG por región con las estadísticas de region_statistics. Se usa una sola figura (sin pyplot,
+        con el lienzo Agg) que se limpia entre regiones.
+
+        Parámetros:
+        - stats: Estadísticas devueltas por region_statistics.
+        - save_path: Prefijo de los archivos de salida.
+        - regions: Posiciones de las regiones a graficar.
+        Devuelve las rutas de los archivos generados.
+        """
+        variable_name = stats['variable']
+        nombre_variable_final = self.PLOT_NAMES.get(variable_name, variable_name)
+        nombre_unidades_final = self.PLOT_NAMES.get(stats['units'], stats['units'])
+        time = stats['time']
+
+        written = []
+        figure = Figure(figsize=(10, 6))
+        FigureCanvasAgg(figure)
+        ax = figure.add_subplot()
+        for position in regions:
+            region = stats['regions'][position]
+            daily_mean = stats['mean'][position]
+            daily_std = stats['std'][position]
+            ax.clear()
 
             # Si la variable es 'precipitation', se grafica un gráfico de barras
             if variable_name == "precipitation":
-                # Graficar para la región actual
-                plt.figure(figsize=(10, 6))
-                plt.bar(time, daily_mean, yerr=daily_std, capsize=5, color='skyblue', label=f'{nombre_variable_final} promedio')
-                plt.xlabel('Días')
-                plt.ylabel(f'{nombre_variable_final} ({nombre_unidades_final})')
-                plt.title(f'Promedio diario de {nombre_variable_final} con desviación estándar en la región {region}')
+                ax.bar(time, daily_mean, yerr=daily_std, capsize=5, color='skyblue', label=f'{nombre_variable_final} promedio')
+                ax.set_title(f'Promedio diario de {nombre_variable_final} con desviación estándar en la región {region}')
             else:
                 # Graficar para la región actual con rango de incertidumbre
-                upper_bound = daily_mean + daily_std
-                lower_bound = np.where((daily_mean - daily_std < 0) & (variable_name == 'precipitation'), 0, daily_mean - daily_std)
-                
-                plt.figure(figsize=(10, 6))
-                plt.plot(time, daily_mean, label=f'{nombre_variable_final} promedio', color='green')
-                plt.fill_between(time, lower_bound, upper_bound, color='green', alpha=0.3, label='Rango de incertidumbre')
-                plt.xlabel('Días')
-                plt.ylabel(f'{nombre_variable_final} ({nombre_unidades_final})')
-                plt.title(f'Promedio diario de {nombre_variable_final} con rango de incertidumbre en la región {region}')
+                ax.plot(time, daily_mean, label=f'{nombre_variable_final} promedio', color='green')
+                ax.fill_between(time, daily_mean - daily_std, daily_mean + daily_std, color='green', alpha=0.3, label='Rango de incertidumbre')
+                ax.set_title(f'Promedio diario de {nombre_variable_final} con rango de incertidumbre en la región {region}')
+            ax.set_xlabel('Días')
+            ax.set_ylabel(f'{nombre_variable_final} ({nombre_unidades_final})')
 
             # Ajustar las etiquetas de fechas
-            plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=1))
-            plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
-            plt.gcf().autofmt_xdate()  # Rotar las etiquetas de fecha para mayor claridad
+            ax.xaxis.set_major_locator(mdates.DayLocator(interval=1))
+            ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+            figure.autofmt_xdate()  # Rotar las etiquetas de fecha para mayor claridad
 
-            plt.legend()
-            plt.grid(True)
+            ax.legend()
+            ax.grid(True)
 
             # Guardar la figura
-            plt.savefig(f"{save_path}{variable_name}_{region}.png")
-            plt.close()
+            figure.savefig(f"{save_path}{variable_name}_{region}.png")
+            written.append(f"{save_path}{variable_name}_{region}.png")
+        return written
 
-
-    def country_crop(self, file_to_be_cropped, mask_file, output_file):
-        
+    def country_crop(self, file_to_be_cropped, mask_file, output_file, profile=None):
+        """
+        Recorta un archivo NetCDF a los píxeles de la máscara con valor 1 y lo guarda con el perfil de
+        almacenamiento indicado (ver StorageProfile).
+        """
+        Telemetry.count_read(file_to_be_cropped)
         file_to_be_cropped = xr.open_dataset(file_to_be_cropped)
-        mask_file = mask_file
-        ds_mask = xr.open_dataset(mask_file)
 
-        # Aplicar la máscara a los datos globales
-        ds_global_honduras = file_to_be_cropped.where(ds_mask['mask'] == 1, drop=True)
-        ds_global_honduras.to_netcdf(output_file)
+        # Aplicar la máscara a los datos globales (sólo se leen las filas y columnas del país)
+        ds_global_honduras = MaskIndex.load(mask_file).crop(file_to_be_cropped)
+        StorageProfile.get(profile).to_netcdf(ds_global_honduras, output_file)
+        Telemetry.count_written(output_file)
+
+        file_to_be_cropped.close()
+
+    def time_window(self, input_file, output_file, start_date, end_date, profile=None, time_dim='time'):
+        """
+        Guarda en output_file los días de start_date a end_date - 1 de un NetCDF con dimensión de tiempo
+        (las variables sin esa dimensión se copian tal cual) con el perfil de almacenamiento indicado.
+        """
+        Telemetry.count_read(input_file)
+        with xr.open_dataset(input_file) as ds:
+            window = ds.sel({time_dim: slice(pd.Timestamp(start_date), pd.Timestamp(end_date - timedelta(days=1)))}).load()
+        if window.sizes[time_dim] == 0:
+            raise ValueError(f"El archivo {input_file} no tiene datos entre {start_date} y {end_date - timedelta(days=1)}")
+        StorageProfile.get(profile).to_netcdf(window, output_file)
+        Telemetry.count_written(output_file)
+        return output_file
+
 
-        ds_mask.close()
+    def regions_crop(self, file_to_be_cropped, shapefile, output_file, name_column, index_folder=None, profile=None):
+        """
+        Función para recortar la primera variable de un archivo NetCDF por cada región de un shapefile.
+        Los píxeles de cada región se toman de un RegionIndex que se calcula una sola vez por grilla y shapefile.
+        El archivo de salida es compacto (ver RegionFile): la variable se guarda una sola vez en su grilla, con
+        NaN fuera de las regiones, junto con el índice de píxeles de cada región.
 
-    
-    def regions_crop(self, file_to_be_cropped, shapefile, output_file, name_column):
+        Parámetros:
+        - file_to_be_cropped: Ruta al archivo NetCDF.
+        - shapefile: Ruta al shapefile de regiones.
+        - output_file: Ruta del archivo NetCDF de salida con la coordenada 'region'.
+        - name_column: Columna del shapefile con el nombre de la región.
+        - index_folder: Carpeta donde se guardan los índices de regiones entre ejecuciones (opcional).
+        - profile: Perfil de almacenamiento del archivo de salida (ver StorageProfile).
+        """
         # Abre el archivo netCDF
         ds = xr.open_dataset(file_to_be_cropped, decode_times=False)
+        Telemetry.count_read(file_to_be_cropped)
 
         # Asegúrate de que el dataset tenga las coordenadas necesarias para rioxarray
         if 'crs' not in ds.attrs:
@@ -119,127 +236,182 @@ class Tools():
         lat_dim = 'lat' if 'lat' in ds.dims else 'y'
         time_dim = 'time' if 'time' in ds.dims else None
 
-        # Configura las dimensiones espaciales
-        ds = ds.rio.set_spatial_dims(x_dim=lon_dim, y_dim=lat_dim, inplace=True)
-
-        # Abre el shapefile usando geopandas
-        regions = gpd.read_file(shapefile)
-
-        # Asegúrate de que el shapefile y el netCDF tengan el mismo sistema de coordenadas
-        if ds.rio.crs != regions.crs:
-            regions = regions.to_crs(ds.rio.crs)
-
         # Obtener la primera variable de datos del dataset
         data_var = list(ds.data_vars.keys())[0]
 
-        # Crear una lista para almacenar los datasets recortados
-        clipped_datasets = []
-        # Crear una lista para almacenar los nombres de las regiones
-        region_names = []
-
         # Obtener las unidades de la variable original
         units = ds[data_var].attrs.get('units', 'unidades no definidas')
 
-        # Iterar sobre cada región y recortar el dataset
-        for idx, region in regions.iterrows():
-            geometry = [mapping(region.geometry)]
-
-            # Crear la máscara de la región
-            mask = ds.rio.clip(geometry, drop=False)
-
-            # Asegurarse de que la máscara tenga las mismas dimensiones que el dataset original
-            mask = mask[data_var].notnull().astype(int)
-
-            # Crear una variable para la región con un nombre único basado en el nombre de la columna
-            region_name = region[name_column]
-            region_masked = xr.where(mask, ds[data_var], float('nan'))
-
-            # Añadir el atributo de unidades al dataset recortado
-            region_masked.attrs['units'] = units
-
-            # Añadir el dataset recortado a la lista
-            clipped_datasets.append(region_masked)
-            region_names.append(region_name)
+        # Píxeles de cada región (se reutiliza el índice si ya se calculó para esta grilla y shapefile)
+        index = RegionIndex.load(shapefile, ds[lat_dim].values, ds[lon_dim].values, name_column, cache_folder=index_folder)
 
-        # Combinar todos los datasets recortados en uno solo
-        combined_ds = xr.concat(clipped_datasets, dim='region')
-        combined_ds = combined_ds.assign_coords(region=region_names)
+        # Una sola copia de la variable con el índice de píxeles de cada región
+        data = ds[data_var].copy()
+        data.attrs['units'] = units
 
         # Asignar las coordenadas de tiempo si existen en el dataset original
         if time_dim:
-            combined_ds = combined_ds.assign_coords({time_dim: ds[time_dim].values})
-            combined_ds[time_dim].attrs.update(ds[time_dim].attrs)  # Preservar los atributos de tiempo
+            data = data.assign_coords({time_dim: ds[time_dim].values})
+            data[time_dim].attrs.update(ds[time_dim].attrs)  # Preservar los atributos de tiempo
 
         # Mantener los atributos del archivo original
-        combined_ds.attrs.update(ds.attrs)
+        data.attrs.update(ds.attrs)
+        combined_ds = RegionFile.build(data, index, lat_dim, lon_dim)
 
         # Guardar el resultado en un nuevo archivo netCDF
-        combined_ds.to_netcdf(output_file)
+        StorageProfile.get(profile).to_netcdf(combined_ds, output_file)
+        Telemetry.count_written(output_file)
+        ds.close()
 
         return output_file
 
-    def merge_files(self, start_date, end_date, data_folder, output_folder, file_type, units, variable_name='data'):
+    def merge_files(self, start_date, end_date, data_folder, output_folder, file_type, units, variable_name='data', stream=False, mask_file_path=None, profile=None,
+                    bounds=None, padding=2):
+        """
+        Une los archivos diarios (.nc o .tif) de un rango de fechas en un solo NetCDF con dimensión de tiempo.
+
+        Parámetros:
+        - stream: Si es True cada día se lee, se recorta y se escribe al final del archivo antes de leer el
+          siguiente, en lugar de unir todos los días en memoria; la memoria usada no depende del largo de la ventana.
+        - mask_file_path: Máscara opcional; cada día se recorta a los píxeles con valor 1 (como country_crop).
+        - profile: Perfil de almacenamiento del archivo de salida (ver StorageProfile).
+        - bounds, padding: Sólo .tif; caja (lat_min, lat_max, lon_min, lon_max) que se lee de cada archivo, con
+          padding celdas más a cada lado (ver GeoTiffReader). Sin stream, los días se escriben directamente en
+          un arreglo (tiempo, lat, lon) reservado una sola vez.
+        """
         # Generar la lista de fechas
         date_range = pd.date_range(start=start_date, end=end_date - timedelta(days=1))
 
+        if file_type not in ('nc', 'tif'):
+            print(f'Unsupported file type: {file_type}')
+            return
+
+        mask = MaskIndex.load(mask_file_path) if mask_file_path is not None else None
+        reader = GeoTiffReader(bounds, padding) if file_type == 'tif' else None
+
         # Crear una lista para almacenar los datasets
         datasets = []
         times = []
+        # Días de los .tif sin stream: arreglo (tiempo, lat, lon) que se reserva al leer el primer día
+        stack = None
+        writer = TimeSeriesWriter(output_folder, profile=profile) if stream else None
 
-        for date in date_range:
-            year = date.year
-            month = str(date.month).zfill(2)
-            day = str(date.day).zfill(2)
+        try:
+            for date in date_range:
+                year = date.year
+                month = str(date.month).zfill(2)
+                day = str(date.day).zfill(2)
+
+                # Construir el nombre del archivo
+                filename = f'{data_folder}{year}-{month}-{day}.{file_type}'
+
+                # Verificar si el archivo existe
+                if not os.path.exists(filename):
+                    print(f'File not found: {filename}')
+                    continue
+
+                Telemetry.count_read(filename)
+                if reader is not None and not stream:
+                    stack = self.read_tif_day(reader, filename, stack, len(times), len(date_range))
+                    times.append(date)
+                    continue
 
-            # Construir el nombre del archivo
-            filename = f'{data_folder}{year}-{month}-{day}.{file_type}'
+                ds = self.read_daily_file(filename, file_type, variable_name, reader=reader)
+                if mask is not None:
+                    ds = mask.crop(ds)
 
-            # Verificar si el archivo existe
-            if os.path.exists(filename):
-                if file_type == 'nc':
-                    # Abrir el archivo .nc y agregarlo a la lista de datasets
-                    ds = xr.open_dataset(filename)
+                if stream:
+                    # Se lee sólo este día (ya recortado) y se agrega al archivo de salida
+                    ds = self.as_time_step(ds, date, variable_name, units)
+                    writer.append(ds.load())
+                    ds.close()
+                else:
                     datasets.append(ds)
                     times.append(date)
-                elif file_type == 'tif':
-                    # Abrir el archivo .tif y agregarlo a la lista de datasets
-                    with rasterio.open(filename) as src:
-                        data = src.read(1)  # Leer la primera banda
-                        latitudes = src.transform[5] + src.transform[4] * np.arange(src.height)
-                        longitudes = src.transform[2] + src.transform[0] * np.arange(src.width)
-                        ds = xr.DataArray(
-                            data,
-                            dims=('lat', 'lon'),
-                            coords={
-                                'lat': latitudes,
-                                'lon': longitudes
-                            },
-                            name=variable_name
-                        ).to_dataset(name=variable_name)  # Convertir DataArray a Dataset
-                        datasets.append(ds)
-                        times.append(date)
-                else:
-                    print(f'Unsupported file type: {file_type}')
-                    return
-            else:
-                print(f'File not found: {filename}')
-
-        # Combinar todos los datasets en uno solo a lo largo de la dimensión 'time'
-        combined_ds = xr.concat(datasets, dim='time')
-        combined_ds['time'] = times  # Asignar la coordenada de tiempo
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if stream:
+            if writer.length == 0:
+                raise ValueError(f"No se encontraron archivos para unir en {data_folder}")
+            return
+
+        if reader is not None:
+            if stack is None:
+                raise ValueError(f"No se encontraron archivos para unir en {data_folder}")
+            # Los días ya están en un solo arreglo; sólo se envuelven en un Dataset (sin copias)
+            values, latitudes, longitudes = stack
+            combined_ds = xr.Dataset({variable_name: (('time', 'lat', 'lon'), values[:len(times)])},
+                                     coords={'time': times, 'lat': latitudes, 'lon': longitudes})
+            if mask is not None:
+                combined_ds = mask.crop(combined_ds)
+        else:
+            # Combinar todos los datasets en uno solo a lo largo de la dimensión 'time'
+            combined_ds = xr.concat(datasets, dim='time')
+            combined_ds['time'] = times  # Asignar la coordenada de tiempo
 
         # Asignar las unidades a la variable
         combined_ds[variable_name].attrs['units'] = units
         
         # Guardar el dataset combinado a un archivo .nc
-        combined_ds.to_netcdf(output_folder, mode='w', format='NETCDF4')
+        StorageProfile.get(profile).to_netcdf(combined_ds, output_folder, mode='w', format='NETCDF4')
+        Telemetry.count_written(output_folder)
 
         # Cerrar los datasets
         for ds in datasets:
             ds.close()
 
+    def read_tif_day(self, reader, filename, stack, position, days):
+        """
+        Lee un .tif en la posición position del arreglo (tiempo, lat, lon) de la ventana, que se reserva con el
+        primer día para days días. Devuelve (arreglo, lat, lon); todos los días deben tener la misma grilla.
+        """
+        if stack is None:
+            data, latitudes, longitudes = reader.read(filename)
+            values = np.empty((days,) + data.shape, dtype=data.dtype)
+            values[position] = data
+            return values, latitudes, longitudes
+
+        values, latitudes, longitudes = stack
+        _, day_latitudes, day_longitudes = reader.read(filename, out=values[position])
+        if not (np.array_equal(day_latitudes, latitudes) and np.array_equal(day_longitudes, longitudes)):
+            raise ValueError(f"La grilla de {filename} no coincide con la de los demás días")
+        return stack
+
+    def read_daily_file(self, filename, file_type, variable_name, reader=None):
+        """
+        Abre un archivo diario. Los .nc se abren de forma perezosa (sólo se leen las celdas que se usan);
+        los .tif se leen como una grilla (lat, lon) con la variable variable_name, sólo en la ventana del
+        reader (GeoTiffReader; por defecto la banda completa).
+        """
+        if file_type == 'nc':
+            return xr.open_dataset(filename)
+
+        reader = reader if reader is not None else GeoTiffReader()
+        data, latitudes, longitudes = reader.read(filename)
+        return xr.DataArray(
+            data,
+            dims=('lat', 'lon'),
+            coords={
+                'lat': latitudes,
+                'lon': longitudes
+            },
+            name=variable_name
+        ).to_dataset(name=variable_name)  # Convertir DataArray a Dataset
+
+    def as_time_step(self, ds, date, variable_name, units):
+        """
+        Deja un día con un único paso de tiempo en 'date' (como el resultado de unir en memoria) y con las unidades de la variable.
+        """
+        if 'time' in ds.dims:
+            ds = ds.isel(time=slice(0, 1))
+        else:
+            ds = ds.expand_dims('time')
+        ds = ds.assign_coords(time=[date])
+        ds[variable_name].attrs['units'] = units
+        return ds
 
-        
     def translate_julian_dates(self, directorio):
         # Obtener una lista de los archivos en el directorio
         archivos = os.listdir(directorio)
@@ -272,9 +444,11 @@ class Tools():
         
         return nuevos_nombres
 
-    def calculate_daily_mean_per_municipality(self, shapefile_path, netcdf_file, variable_name, region_column, municipality_column, units, column_name):
+    def calculate_daily_mean_per_municipality(self, shapefile_path, netcdf_file, variable_name, region_column, municipality_column, units, column_name, index_folder=None):
         """
         Función para calcular el promedio diario de una variable por municipio y escribir los resultados en un archivo CSV.
+        El valor de cada municipio es el promedio ponderado por área de los píxeles que cubre (fracción cubierta
+        de cada píxel), calculado para todos los municipios y días a la vez.
 
         Parámetros:
         - shapefile_path: Ruta al shapefile de municipios.
@@ -284,55 +458,101 @@ class Tools():
         - region_column: Nombre de la columna en el shapefile que contiene la región.
         - municipality_column: Nombre de la columna en el shapefile que contiene el nombre del municipio.
         - units: Unidades de la variable.
+        - index_folder: Carpeta donde se guardan las matrices de pesos entre ejecuciones (opcional).
         """
-        # Cargar el shapefile de municipios
-        municipalities = gpd.read_file(shapefile_path)
-
-        # Abrir el archivo NetCDF
-        dataset = xr.open_dataset(netcdf_file)
+        # Verificar si la variable es 'precipitation'
+        aggregation = "acc" if variable_name == "precipitation" or variable_name == "precipitationCal" else "avg"
+        spec = (netcdf_file, variable_name, aggregation, f'{column_name}_{units}_{aggregation}')
+        return self.build_municipality_table(shapefile_path, [spec], region_column, municipality_column, index_folder=index_folder)
 
-        # Verificar si la variable existe en el conjunto de datos
-        if variable_name not in dataset:
-            raise ValueError(f"La variable '{variable_name}' no se encuentra en el archivo NetCDF.")
+    def build_municipality_table(self, shapefile_path, specs, region_column, municipality_column, output_file=None, output_format='csv', index_folder=None):
+        """
+        Función para construir en una sola pasada la tabla por municipio de varias variables.
 
-        # Inicializar una lista para almacenar los resultados
-        results = []
+        Parámetros:
+        - shapefile_path: Ruta al shapefile de municipios (se lee una sola vez).
+        - specs: Lista de tuplas (archivo NetCDF, variable, agregación, nombre de la columna). La agregación es
+          'avg' (promedio de los días) o 'acc' (acumulado de los días).
+        - region_column: Nombre de la columna en el shapefile que contiene la región.
+        - municipality_column: Nombre de la columna en el shapefile que contiene el nombre del municipio.
+        - output_file: Ruta del archivo de salida (opcional; si es None sólo se devuelve el DataFrame).
+        - output_format: 'csv' o 'parquet' (requiere pyarrow).
+        - index_folder: Carpeta donde se guardan las matrices de pesos entre ejecuciones (opcional).
+        """
+        # Cargar el shapefile de municipios
+        municipalities = gpd.read_file(shapefile_path)
 
-        # Obtener las dimensiones del archivo NetCDF
-        lon_dim = 'lon' if 'lon' in dataset.dims else 'x'
-        lat_dim = 'lat' if 'lat' in dataset.dims else 'y'
+        table = {
+            'region': municipalities[region_column].values,
+            'municipio': municipalities[municipality_column].values
+        }
 
-        # Iterar sobre cada municipio y calcular el promedio diario
-        for index, municipality in municipalities.iterrows():
-            # Obtener el polígono del municipio
-            municipality_polygon = municipality['geometry']
+        for netcdf_file, variable_name, aggregation, column_name in specs:
+            # Abrir el archivo NetCDF (la lectura es perezosa: sólo se carga la variable pedida)
+            with xr.open_dataset(netcdf_file) as dataset:
+                # Verificar si la variable existe en el conjunto de datos
+                if variable_name not in dataset:
+                    raise ValueError(f"La variable '{variable_name}' no se encuentra en el archivo NetCDF {netcdf_file}.")
+                Telemetry.count_read(netcdf_file)
 
-            # Extraer los datos de la variable para el polígono del municipio
-            variable_data = dataset[variable_name].sel({lon_dim: municipality_polygon.centroid.x, lat_dim: municipality_polygon.centroid.y}, method='nearest')
+                # Obtener las dimensiones del archivo NetCDF
+                lon_dim = 'lon' if 'lon' in dataset.dims else 'x'
+                lat_dim = 'lat' if 'lat' in dataset.dims else 'y'
 
-            string_to_append = "avg"
+                # Promedio por municipio y por día en una sola operación
+                municipal_series = self.municipal_series(dataset, variable_name, shapefile_path, municipality_column, lat_dim, lon_dim, index_folder, municipalities)
 
-           # Verificar si la variable es 'precipitation'
-            if variable_name == "precipitation" or variable_name == "precipitationCal":
+            if aggregation == "acc":
                 # Calcular el acumulado diario
-                daily_value = variable_data.sum(dim='time').values
-                string_to_append = "acc"
+                table[column_name] = np.nansum(municipal_series, axis=0)
+            elif aggregation == "avg":
+                # Calcular el promedio diario; los municipios sin datos quedan en NaN (sin advertencia de "Mean of empty slice")
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    table[column_name] = np.nanmean(municipal_series, axis=0)
             else:
-                # Calcular el promedio diario
-                daily_value = variable_data.mean(dim='time').values
-
-            # Agregar los resultados a la lista
-            results.append({
-                'region': municipality[region_column],
-                'municipio': municipality[municipality_column],
-                f'{column_name}_{units}_{string_to_append}': daily_value
-            })
-
-        # Crear un DataFrame con los resultados y escribirlo en un archivo CSV
-        df = pd.DataFrame(results)
-        #df.to_csv(output_csv, index=False)
+                raise ValueError(f"Agregación no soportada: {aggregation}. Use 'avg' o 'acc'.")
+
+        df = pd.DataFrame(table)
+
+        if output_file is not None:
+            if output_format == 'parquet':
+                try:
+                    df.to_parquet(output_file, index=False)
+                except ImportError as e:
+                    raise ImportError("Para escribir Parquet debe instalar pyarrow (pip install pyarrow).") from e
+            elif output_format == 'csv':
+                df.to_csv(output_file, index=False, encoding='utf-8-sig')
+            else:
+                raise ValueError(f"Formato de salida no soportado: {output_format}. Use 'csv' o 'parquet'.")
+            Telemetry.count_written(output_file)
+
         return df
 
+    def municipal_series(self, dataset, variable_name, shapefile_path, municipality_column, lat_dim='lat', lon_dim='lon', index_folder=None, municipalities=None):
+        """
+        Función para calcular la serie (tiempo, municipio) del promedio ponderado por área de una variable.
+
+        Parámetros:
+        - dataset: Dataset de xarray con la variable.
+        - variable_name: Nombre de la variable.
+        - shapefile_path: Ruta al shapefile de municipios.
+        - municipality_column: Columna con el nombre del municipio.
+        - lat_dim, lon_dim: Nombres de las dimensiones de latitud y longitud.
+        - index_folder: Carpeta donde se guardan las matrices de pesos entre ejecuciones (opcional).
+        - municipalities: GeoDataFrame del shapefile ya leído (opcional).
+        """
+        lat = dataset[lat_dim].values
+        lon = dataset[lon_dim].values
+        index = RegionIndex.load(shapefile_path, lat, lon, municipality_column, cache_folder=index_folder, mode='fraction', regions=municipalities)
+
+        data = dataset[variable_name]
+        other_dims = [dim for dim in data.dims if dim not in (lat_dim, lon_dim)]
+        values = data.transpose(*other_dims, lat_dim, lon_dim).values.reshape(-1, len(lat), len(lon))
+
+        # El área de un píxel en grados es proporcional al coseno de la latitud
+        area = np.broadcast_to(np.cos(np.deg2rad(lat))[:, None], (len(lat), len(lon)))
+        return index.zonal_mean(values, area)
 
     def create_gcc_json(self, file_path):
         """
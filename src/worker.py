@@ -0,0 +1,27 @@
+from task_queue import FileBroker, QueueWorker
+# Las tareas de la cola son métodos de Master y Backfill; al importarlos aquí pickle también los encuentra
+# cuando el coordinador se ejecutó como script (python master.py o python backfill.py)
+from master import Master
+from backfill import Backfill
+import os, sys
+
+"""
+Worker de la cola de tareas (ETL_STAGE_EXECUTOR=queue): toma las etapas que publica el coordinador en la
+carpeta compartida, las ejecuta en este nodo y deja su resultado en la cola
+"""
+
+if __name__ == "__main__":
+    variable = os.getenv('ETL_EXEC')
+
+    if variable is None or bool(int(variable)):
+        # Procesar los argumentos
+        #queue_path (default ETL_QUEUE_PATH) and seconds without tasks before exiting (default: never)
+        queue_path = sys.argv[1] if len(sys.argv) > 1 else Master.QUEUE_PATH
+        idle_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        if not queue_path:
+            raise ValueError("Indique la carpeta de la cola como argumento o en ETL_QUEUE_PATH")
+
+        # El plazo de señal de vida viene en cada tarea (lo fija el coordinador); la clave debe ser la misma
+        broker = FileBroker(queue_path, key=os.getenv('ETL_QUEUE_KEY'), allow_unsigned=Master.QUEUE_UNSIGNED)
+        executed = QueueWorker(broker, idle_seconds=idle_seconds).run()
+        print(f"Worker terminado: {executed} tareas ejecutadas")
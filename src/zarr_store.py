@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+from telemetry import Telemetry
+
+try:
+    import zarr
+except ImportError:
+    # zarr es opcional: sólo se necesita con OUTPUT_BACKEND=zarr
+    zarr = None
+
+"""
+Clase que mantiene un almacén Zarr de larga duración con las series diarias del ETL (un grupo por producto)
+"""
+
+
+class ZarrStore:
+    def __init__(self, store_path, time_dim='time'):
+        """
+        Inicializa el almacén. Cada ejecución actualiza en el almacén sólo los días nuevos o modificados de cada
+        producto, así que se puede leer cualquier ventana sin reunir las carpetas output/<fecha>/.
+
+        Parámetros:
+        - store_path: Ruta del almacén Zarr (por ejemplo workspace/output/store.zarr).
+        - time_dim: Nombre de la dimensión de tiempo.
+        """
+        if zarr is None:
+            raise ImportError('Para escribir el almacén Zarr debe instalar zarr (pip install "zarr<3").')
+        self.store_path = store_path
+        self.time_dim = time_dim
+
+    def open(self, group):
+        """
+        Abre un producto del almacén (None si todavía no existe).
+        """
+        if not os.path.isdir(os.path.join(self.store_path, group)):
+            return None
+        return xr.open_dataset(self.store_path, engine='zarr', group=group, consolidated=True, chunks=None)
+
+    def update(self, nc_file, group):
+        """
+        Actualiza un producto del almacén con las variables con dimensión de tiempo de un NetCDF del ETL.
+        Los días que ya estaban se reescriben sólo si cambiaron y los días posteriores al último se agregan
+        al final; los metadatos se consolidan en cada escritura.
+
+        Parámetros:
+        - nc_file: NetCDF de salida del ETL (por ejemplo IMERG_Honduras.nc).
+        - group: Nombre del producto dentro del almacén.
+
+        Devuelve el número de días escritos.
+        """
+        with xr.open_dataset(nc_file) as ds:
+            Telemetry.count_read(nc_file)
+            variables = [name for name, variable in ds.data_vars.items() if self.time_dim in variable.dims]
+            ds = ds[variables].load()
+        # Las codificaciones del NetCDF (chunks, compresión, _FillValue) no se trasladan al almacén
+        for variable in ds.variables.values():
+            variable.encoding = {}
+
+        existing = self.open(group)
+        if existing is None:
+            self.create(ds, group)
+            written = ds.sizes[self.time_dim]
+        else:
+            with existing:
+                written = self.merge(ds, existing, group)
+        if written:
+            Telemetry.count_written(self.store_path)
+        print(f"Almacén Zarr {self.store_path}: {written} días de {group} actualizados")
+        return written
+
+    def create(self, ds, group):
+        # Un chunk por día: actualizar un día sólo reescribe sus chunks
+        encoding = {name: {'chunks': (1,) + ds[name].shape[1:]} for name in ds.data_vars
+                    if ds[name].dims[0] == self.time_dim}
+        encoding[self.time_dim] = {'units': 'days since 1970-01-01', 'dtype': 'float64'}
+        os.makedirs(os.path.dirname(os.path.abspath(self.store_path)), exist_ok=True)
+        ds.to_zarr(self.store_path, group=group, mode='w', encoding=encoding, consolidated=True)
+
+    def merge(self, ds, existing, group):
+        times = pd.DatetimeIndex(ds[self.time_dim].values)
+        stored = pd.DatetimeIndex(existing[self.time_dim].values)
+        for name in ds.coords:
+            if self.time_dim not in ds[name].dims and not np.array_equal(ds[name].values, existing[name].values):
+                raise ValueError(f"La coordenada '{name}' de {group} no coincide con la del almacén {self.store_path}")
+
+        new = times > stored.max()
+        # Los días nuevos deben seguir al último día del almacén sin huecos, igual que los que ya estaban
+        appended = times[new].sort_values()
+        gap = new.any() and (appended[0] - stored.max() > pd.Timedelta(days=1)
+                             or (appended[1:] - appended[:-1] > pd.Timedelta(days=1)).any())
+        if (~times.isin(stored) & ~new).any() or gap:
+            raise ValueError(f"Las fechas de {group} no son continuas con las del almacén {self.store_path}; "
+                             "se debe rehacer el producto")
+
+        # Días que ya estaban: se reescriben los que cambiaron
+        written = 0
+        static = [name for name in ds.variables if self.time_dim not in ds[name].dims]
+        for position, date in zip(stored.get_indexer(times[~new]), times[~new]):
+            day = ds.sel({self.time_dim: [date]})
+            old = existing.isel({self.time_dim: [position]})
+            if all(day[name].equals(old[name]) for name in ds.data_vars):
+                continue
+            day.drop_vars(static).to_zarr(self.store_path, group=group, mode='r+', consolidated=True,
+                                          region={self.time_dim: slice(position, position + 1)})
+            written += 1
+
+        # Días nuevos al final de la serie
+        if new.any():
+            ds.isel({self.time_dim: np.flatnonzero(new)}).to_zarr(self.store_path, group=group, mode='a',
+                                                                 append_dim=self.time_dim, consolidated=True)
+            written += int(new.sum())
+        return written